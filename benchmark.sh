@@ -6,7 +6,7 @@ fi
 PYTHON=$PYTHON
 SRC=$(cd `dirname $0`; pwd)
 TESTCASE=tests/files/
-export PYTHONPATH=$SRC/hachoir-core:$SRC/hachoir-parser:$SRC/hachoir-metadata:$PYTHONPATH
+export PYTHONPATH=$SRC:$PYTHONPATH
 
 function prepare_benchmark
 {
@@ -28,3 +28,5 @@ prepare_benchmark "hachoir-metadata: set A (mp3, wav, png, au, mkv)"
     sheep_on_drugs.mp3 kde_click.wav logo-kubuntu.png \
     audio_8khz_8bit_ulaw_4s39.au flashmob.mkv 10min.mkv)
 
+prepare_benchmark "tools/benchmark.py: all test files"
+$PYTHON $SRC/tools/benchmark.py --quiet --output=benchmark.json
@@ -0,0 +1,121 @@
+"""
+Cooperative parse budget: limit the wall-clock time, the number of read
+bytes and the number of created fields of a parser.
+
+Limits are checked by generic field sets when a field is added and by
+input streams when data are read, so a malformed file can not keep
+a parser busy forever:
+
+    budget = ParseBudget(timeout=5.0, max_fields=100000)
+    with budget:
+        ...
+
+The budget is global to the process: only one budget is active at the same
+time (but budgets can be nested, the innermost budget is checked).
+"""
+
+from time import monotonic
+
+# Active budget, see ParseBudget.start()
+current = None
+
+
+class BudgetExceeded(BaseException):
+    """
+    Error raised when a parse budget is exceeded.
+
+    It inherits from BaseException (not from Exception) on purpose: parsers
+    and metadata extractors catch Exception to be fault tolerant, whereas
+    the budget error must stop the parsing.
+
+    Attributes: resource ("time", "read" or "fields") and limit.
+    """
+
+    def __init__(self, resource, limit):
+        self.resource = resource
+        self.limit = limit
+        if resource == "time":
+            message = "time limit of %s seconds exceeded" % limit
+        elif resource == "read":
+            message = "read limit of %s bytes exceeded" % limit
+        else:
+            message = "limit of %s fields exceeded" % limit
+        BaseException.__init__(self, "Parse budget: %s" % message)
+
+
+class ParseBudget:
+    """
+    Parse budget:
+    - timeout: maximum duration in seconds, measured from the first start() ;
+    - max_read: maximum number of read bytes ;
+    - max_fields: maximum number of created fields.
+
+    Use None for no limit. The same budget can be used for multiple
+    operations (ex: createParser() and then extractMetadata()): counters
+    are not reset.
+    """
+
+    def __init__(self, timeout=None, max_read=None, max_fields=None):
+        self.timeout = timeout
+        self.max_read = max_read
+        self.max_fields = max_fields
+        self.deadline = None
+        self.read_bits = 0
+        self.fields = 0
+        if max_read is not None:
+            self._max_read_bits = max_read * 8
+        else:
+            self._max_read_bits = None
+        self._previous = []
+
+    def start(self):
+        global current
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = monotonic() + self.timeout
+        self._previous.append(current)
+        current = self
+
+    def stop(self):
+        global current
+        current = self._previous.pop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def checkTime(self):
+        if self.deadline is not None and self.deadline < monotonic():
+            raise BudgetExceeded("time", self.timeout)
+
+    def addField(self):
+        """
+        Called by generic field sets when a field is added
+        """
+        self.fields += 1
+        if self.max_fields is not None and self.max_fields < self.fields:
+            raise BudgetExceeded("fields", self.max_fields)
+        self.checkTime()
+
+    def addRead(self, size):
+        """
+        Called by input streams when size bits are read
+        """
+        self.read_bits += size
+        if self._max_read_bits is not None \
+                and self._max_read_bits < self.read_bits:
+            raise BudgetExceeded("read", self.max_read)
+        self.checkTime()
+
+
+def runWithBudget(budget, func, *args, **kw):
+    """
+    Call func(*args, **kw) with the budget budget (do nothing special
+    if budget is None).
+    """
+    if budget is None:
+        return func(*args, **kw)
+    with budget:
+        return func(*args, **kw)
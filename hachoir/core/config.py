@@ -21,6 +21,10 @@ if os.name == "nt":
 else:
     use_i18n = True
 
+# I/O statistics of input streams, see hachoir.stream.stats
+io_stats = False          # Count reads of new input streams?
+io_trace = False          # Also record each read? (requires io_stats)
+
 # Parser global options
 autofix = True            # Enable Autofix? see hachoir.field.GenericFieldSet
 check_padding_pattern = True   # Check padding fields pattern?
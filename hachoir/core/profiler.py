@@ -1,32 +1,209 @@
-from hotshot import Profile
-from hotshot.stats import load as loadStats
-from os import unlink
+"""
+Profiler: run a function with cProfile and with a field set profiler.
+
+The field set profiler (FieldSetProfiler) attributes the time spent in
+createFields(), the number of created fields and the allocated memory
+(using tracemalloc) to each field set class of each parser.
+"""
+
+import json
+from time import perf_counter
+
+# Running field set profiler, see FieldSetProfiler.start()
+current = None
+
+
+class FieldSetProfiler:
+    """
+    Field set profiler: when started, generic field sets call
+    profileFields() to wrap their createFields() generator.
+
+    Statistics are stored in the 'stats' attribute: dictionary
+    (parser class name, field set class name) => [time in seconds,
+    number of fields, allocated bytes]. Time and memory are "exclusive":
+    the time spent in nested field sets is only attributed to them.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stats = {}
+        self._stack = []
+        self._tracemalloc = False
+
+    def start(self):
+        global current
+        if self.memory:
+            import tracemalloc
+            self._get_traced_memory = tracemalloc.get_traced_memory
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracemalloc = True
+        current = self
+
+    def stop(self):
+        global current
+        current = None
+        if self._tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+            self._tracemalloc = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _getMemory(self):
+        if not self.memory:
+            return 0
+        return self._get_traced_memory()[0]
+
+    def _enter(self, stat):
+        now = perf_counter()
+        memory = self._getMemory()
+        if self._stack:
+            parent = self._stack[-1]
+            parent[0][0] += now - parent[1]
+            parent[0][2] += memory - parent[2]
+        self._stack.append([stat, now, memory])
+
+    def _leave(self):
+        now = perf_counter()
+        memory = self._getMemory()
+        stat, start, start_memory = self._stack.pop()
+        stat[0] += now - start
+        stat[2] += memory - start_memory
+        if self._stack:
+            parent = self._stack[-1]
+            parent[1] = now
+            parent[2] = memory
+
+    def profileFields(self, fieldset, fields):
+        """
+        Wrap the createFields() generator of a field set
+        """
+        key = (fieldset.root.__class__.__name__, fieldset.__class__.__name__)
+        try:
+            stat = self.stats[key]
+        except KeyError:
+            stat = self.stats[key] = [0.0, 0, 0]
+        while True:
+            self._enter(stat)
+            try:
+                field = next(fields)
+            except StopIteration:
+                return
+            finally:
+                self._leave()
+            stat[1] += 1
+            yield field
+
+    def getParserStats(self):
+        """
+        Sum statistics per parser: dictionary parser class name
+        => [time in seconds, number of fields, allocated bytes]
+        """
+        parsers = {}
+        for (parser, fieldset), stat in self.stats.items():
+            total = parsers.setdefault(parser, [0.0, 0, 0])
+            for index, value in enumerate(stat):
+                total[index] += value
+        return parsers
+
+    def exportPlaintext(self, limit=25):
+        """
+        Format the 'limit' most expensive field set classes (sorted by time)
+        as a table: list of lines.
+        """
+        stats = sorted(self.stats.items(), key=lambda item: -item[1][0])
+        if limit:
+            stats = stats[:limit]
+        text = ["%10s %10s %12s  %s"
+                % ("time (ms)", "fields", "memory (B)", "parser/field set")]
+        for (parser, fieldset), (duration, nfield, memory) in stats:
+            text.append("%10.1f %10u %12d  %s/%s"
+                        % (duration * 1000, nfield, memory, parser, fieldset))
+        return text
+
+    def exportJSON(self):
+        """
+        Export statistics as a dictionary which can be serialized to JSON
+        """
+        def export(stat, **keys):
+            keys.update(time=stat[0], fields=stat[1], memory=stat[2])
+            return keys
+
+        fieldsets = [export(stat, parser=parser, fieldset=fieldset)
+                     for (parser, fieldset), stat in self.stats.items()]
+        fieldsets.sort(key=lambda item: -item["time"])
+        parsers = [export(stat, parser=parser)
+                   for parser, stat in self.getParserStats().items()]
+        parsers.sort(key=lambda item: -item["time"])
+        return {"fieldsets": fieldsets, "parsers": parsers}
+
+
+def exportFunctionStats(stat, nb_func):
+    """
+    Export the nb_func first functions of sorted pstats.Stats
+    as a list of dictionaries.
+    """
+    functions = []
+    for func in stat.fcn_list[:nb_func]:
+        ncall_prim, ncall, tottime, cumtime, callers = stat.stats[func]
+        functions.append({"function": "%s:%s(%s)" % func,
+                          "calls": ncall,
+                          "tottime": tottime,
+                          "cumtime": cumtime})
+    return functions
 
 
 def runProfiler(func, args=tuple(), kw={}, verbose=True, nb_func=25,
-                sort_by=('cumulative', 'calls')):
-    profile_filename = "/tmp/profiler"
-    prof = Profile(profile_filename)
-    try:
-        if verbose:
-            print("[+] Run profiler")
+                sort_by=('cumulative', 'calls'), json_filename=None,
+                memory=True):
+    """
+    Call func(*args, **kw) with cProfile and a FieldSetProfiler, and display
+    statistics. If json_filename is set, also write statistics in this file
+    using the JSON format.
+
+    Return the result of func.
+    """
+    from cProfile import Profile
+    from pstats import Stats
+
+    prof = Profile()
+    fieldset_prof = FieldSetProfiler(memory=memory)
+    if verbose:
+        print("[+] Run profiler")
+    with fieldset_prof:
         result = prof.runcall(func, *args, **kw)
-        prof.close()
-        if verbose:
-            print("[+] Stop profiler")
-            print("[+] Process data...")
-        stat = loadStats(profile_filename)
-        if verbose:
-            print("[+] Strip...")
-        stat.strip_dirs()
-        if verbose:
-            print("[+] Sort data...")
-        stat.sort_stats(*sort_by)
+    if verbose:
+        print("[+] Stop profiler")
+        print("[+] Process data...")
+    stat = Stats(prof)
+    if verbose:
+        print("[+] Strip...")
+    stat.strip_dirs()
+    if verbose:
+        print("[+] Sort data...")
+    stat.sort_stats(*sort_by)
+    if verbose:
+        print()
+        print("[+] Display statistics")
+        print()
+    stat.print_stats(nb_func)
+
+    print("Field sets:")
+    for line in fieldset_prof.exportPlaintext(nb_func):
+        print(line)
+
+    if json_filename:
+        data = fieldset_prof.exportJSON()
+        data["functions"] = exportFunctionStats(stat, nb_func)
+        with open(json_filename, "w") as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
         if verbose:
             print()
-            print("[+] Display statistics")
-            print()
-        stat.print_stats(nb_func)
-        return result
-    finally:
-        unlink(profile_filename)
+            print("[+] Statistics written into %s" % json_filename)
+    return result
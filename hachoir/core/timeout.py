@@ -1,7 +1,11 @@
 """
 limitedTime(): set a timeout in seconds when calling a function,
 raise a Timeout error if time exceed.
+
+Without signal.alarm() nor resource.setrlimit(), the timeout is only checked
+by parsers (see hachoir.core.budget).
 """
+from hachoir.core.budget import ParseBudget, BudgetExceeded
 from math import ceil
 
 IMPLEMENTATION = None
@@ -25,7 +29,11 @@ def limitedTime(second, func, *args, **kw):
     """
     Call func(*args, **kw) with a timeout of second seconds.
     """
-    return func(*args, **kw)
+    try:
+        with ParseBudget(timeout=second):
+            return func(*args, **kw)
+    except BudgetExceeded:
+        raise Timeout("Timeout exceed!")
 
 
 def fixTimeout(second):
@@ -2,6 +2,8 @@ from hachoir.field import (MissingField, BasicFieldSet, Field, ParserError,
                            createRawField, createNullField, createPaddingField, FakeArray)
 from hachoir.core.dict import Dict, UniqKeyError
 from hachoir.core.tools import lowerBound, makeUnicode
+from hachoir.stream.stats import traceFields
+from hachoir.core import budget, profiler
 import hachoir.core.config as config
 
 
@@ -63,10 +65,18 @@ class GenericFieldSet(BasicFieldSet):
         """
         BasicFieldSet.__init__(self, parent, name, stream, description, size)
         self._fields = Dict()
-        self._field_generator = self.createFields()
+        self._field_generator = self._createFieldGenerator()
         self._array_cache = {}
         self.__is_feeding = False
 
+    def _createFieldGenerator(self):
+        fields = self.createFields()
+        if config.io_stats:
+            fields = traceFields(self, fields)
+        if profiler.current is not None:
+            fields = profiler.current.profileFields(self, fields)
+        return fields
+
     def printDebug(self, p_override=False):
         dpt = 0
 
@@ -117,7 +127,7 @@ class GenericFieldSet(BasicFieldSet):
         """
         BasicFieldSet.reset(self)
         self._fields = Dict()
-        self._field_generator = self.createFields()
+        self._field_generator = self._createFieldGenerator()
         self._current_size = 0
         self._array_cache = {}
 
@@ -186,6 +196,8 @@ class GenericFieldSet(BasicFieldSet):
             self.setUniqueFieldName(field)
         if config.debug:
             self.info("[+] DBG: _addField(%s)" % field.name)
+        if budget.current is not None:
+            budget.current.addField()
 
         # required for the msoffice parser
         if field._address != self._current_size:
@@ -8,6 +8,7 @@ from hachoir.core.tools import makePrintable
 from hachoir.parser import createParser
 from hachoir.core.cmd_line import displayVersion
 from optparse import OptionGroup, OptionParser
+import hachoir.core.config as config
 import errno
 import sys
 
@@ -45,6 +46,8 @@ def parseOptions():
                       action="store_true", default=False)
     common.add_option("--bench", help="Run benchmark",
                       action="store_true", default=False)
+    common.add_option("--io-stats", help="Display I/O statistics on stderr",
+                      action="store_true", default=False)
     common.add_option("--version", help="Display version and exit",
                       action="callback", callback=displayVersion)
     parser.add_option_group(common)
@@ -107,6 +110,7 @@ class ConsoleGrep(Grep):
         self.display_value = True
         self.display_path = False
         self.display_percent = False
+        self.display_io_stats = False
         self.filename = None
 
     def onMatch(self, field):
@@ -164,6 +168,14 @@ class ConsoleGrep(Grep):
                     return
                 else:
                     raise
+            if self.display_io_stats:
+                self.displayIOStats(self.parser.stream.stats)
+
+    def displayIOStats(self, stats):
+        sys.stdout.flush()
+        print("[%s]" % self.filename, file=sys.stderr)
+        for line in stats.exportPlaintext():
+            print(line, file=sys.stderr)
 
 
 def runGrep(values, pattern, filenames):
@@ -174,6 +186,7 @@ def runGrep(values, pattern, filenames):
     grep.display_value = not(values.no_value)
     grep.display_percent = values.percent
     grep.display = not(values.bench)
+    grep.display_io_stats = values.io_stats
     for filename in filenames:
         grep.searchFile(filename, pattern, case_sensitive=values.case)
 
@@ -182,6 +195,8 @@ def main():
     try:
         values, pattern, filenames = parseOptions()
         configureHachoir(values)
+        if values.io_stats:
+            config.io_stats = True
         if values.bench:
             bench = Benchmark()
             bench.run(runGrep, values, pattern, filenames)
@@ -4,6 +4,7 @@ from hachoir.metadata.metadata import (
     RootMetadata, Metadata, MultipleMetadata, registerExtractor)
 from hachoir.parser.archive import (Bzip2Parser, CabFile, GzipParser,
                                     TarFile, ZipFile, MarFile, RarFile)
+from hachoir.parser.archive.zip import COMPRESSION_METHOD
 from hachoir.core.tools import humanUnixAttributes
 
 
@@ -61,6 +62,23 @@ class GzipMetadata(RootMetadata):
 class ZipMetadata(MultipleMetadata):
 
     def extract(self, zip):
+        directory = zip.getCentralDirectory()
+        if directory is None:
+            self.extractFileEntries(zip)
+            return
+        max_nb = maxNbFile(self)
+        for member in directory:
+            if max_nb is not None and max_nb <= member.index:
+                self.warning("ZIP archive contains many files, "
+                             "but only first %s files are processed"
+                             % max_nb)
+                break
+            self.processMember(member)
+        if directory.comment:
+            self.comment = directory.comment.decode("ISO-8859-15")
+
+    def extractFileEntries(self, zip):
+        # No central directory (ex: truncated archive): parse file entries
         max_nb = maxNbFile(self)
         for index, field in enumerate(zip.array("file")):
             if max_nb is not None and max_nb <= index:
@@ -78,6 +96,19 @@ class ZipMetadata(MultipleMetadata):
         if comment:
             self.comment = comment
 
+    @fault_tolerant
+    def processMember(self, member):
+        meta = Metadata(self)
+        meta.filename = member.filename
+        meta.creation_date = member.getDatetime()
+        meta.compression = COMPRESSION_METHOD.get(member.compression,
+                                                  "unknown")
+        meta.file_size = member.uncompressed_size
+        if member.compressed_size:
+            meta.compr_size = member.compressed_size
+        self.addGroup("file[%u]" % member.index, meta,
+                      "File \"%s\"" % meta.get('filename'))
+
     @fault_tolerant
     def processFile(self, field):
         meta = Metadata(self)
@@ -2,6 +2,7 @@ from hachoir.metadata.metadata import (registerExtractor, Metadata,
                                        RootMetadata, MultipleMetadata)
 from hachoir.parser.audio import (AuFile, MpegAudioFile, RealAudioFile,
                                   AiffFile, FlacParser)
+from hachoir.parser.audio.mpeg_audio import scanFrameHeaders
 from hachoir.parser.container import OggFile, RealMediaFile
 from hachoir.core.tools import makePrintable, timedelta2seconds, humanBitRate
 from datetime import timedelta
@@ -358,30 +359,25 @@ class MpegAudioMetadata(RootMetadata):
     def computeVariableBitrate(self, mp3):
         if self.quality <= QUALITY_FAST:
             return
-        count = 0
         if QUALITY_BEST <= self.quality:
-            self.warning(
-                "Process all MPEG audio frames to compute exact duration")
             max_count = None
         else:
-            max_count = 500 * self.quality
-        total_bit_rate = 0.0
-        for index, frame in enumerate(mp3.array("frames/frame")):
-            if index < 3:
-                continue
-            bit_rate = frame.getBitRate()
-            if bit_rate:
-                total_bit_rate += float(bit_rate)
-                count += 1
-                if max_count and max_count <= count:
-                    break
-        if not count:
+            max_count = int(10000 * self.quality)
+        frames = mp3["frames"]
+        frame = mp3["frames/frame[0]"]
+        scan = scanFrameHeaders(mp3.stream, frame.absolute_address,
+                                frames.absolute_address + frames.size
+                                - frame.absolute_address,
+                                max_count)
+        bit_rate = scan.getBitRate()
+        if not bit_rate:
             return
-        bit_rate = total_bit_rate / count
         self.bit_rate = (bit_rate,
                          "%s (Variable bit rate)" % humanBitRate(bit_rate))
-        duration = timedelta(seconds=float(mp3["frames"].size) / bit_rate)
-        self.duration = duration
+        duration = scan.getDuration()
+        if duration is None:
+            duration = float(frames.size) / bit_rate
+        self.duration = timedelta(seconds=duration)
 
 
 class AiffMetadata(RootMetadata):
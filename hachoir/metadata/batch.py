@@ -0,0 +1,250 @@
+"""
+Batch processing of many files: list files (recursively), process them in
+a pool of worker processes and summarize the run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from hachoir.core.tools import humanDuration
+from time import monotonic, perf_counter
+import heapq
+import os
+
+# Interval in seconds to check if items submitted to a pool are running
+POLL_INTERVAL = 0.5
+# Number of broken pools after which an item fails
+MAX_POOL_FAILURES = 2
+
+
+def iterFiles(paths, recursive=False):
+    """
+    Generate filenames: if recursive is True, directories are walked
+    (sorted by name), otherwise paths are generated unchanged.
+    """
+    for path in paths:
+        if recursive and os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+def createPool(jobs, initializer, initargs):
+    return ProcessPoolExecutor(jobs, initializer=initializer,
+                               initargs=initargs)
+
+
+def killPool(executor):
+    """
+    Kill the worker processes of a pool and shut it down
+    """
+    # ProcessPoolExecutor has no public method to kill a worker
+    # stuck in C code
+    processes = list((executor._processes or {}).values())
+    for process in processes:
+        process.kill()
+    executor.shutdown(wait=False)
+    for process in processes:
+        process.join()
+
+
+def runPool(func, items, jobs, initializer=None, initargs=(),
+            ordered=True, buffer_size=None, timeout=None, on_error=None):
+    """
+    Call func(item) for each item in a pool of jobs worker processes
+    (initializer(*initargs) is called once in each worker) and generate
+    (item, result) tuples.
+
+    If ordered is True, results are generated in the input order: at most
+    buffer_size (default: 4 * jobs) results are running or waiting for
+    a previous result. Otherwise, results are generated in the completion
+    order.
+
+    If an item runs for more than timeout seconds, it fails and the pool
+    is killed. If a worker dies (ex: killed by the kernel), the pool is
+    broken: the items which were running or waiting are submitted again
+    one by one to find the item which breaks the pool, it fails after
+    MAX_POOL_FAILURES broken pools. In both cases, the pool is recreated
+    and the other interrupted items are submitted again. The result of
+    a failed item is on_error(item, exc), or the exception is raised if
+    on_error is None.
+    """
+    if buffer_size is None:
+        buffer_size = 4 * jobs
+    buffer_size = max(buffer_size, jobs)
+    items = iter(items)
+    executor = createPool(jobs, initializer, initargs)
+    pending = {}    # future => (index, item)
+    started = {}    # future => time when the future was seen running
+    failures = {}   # index => number of broken pools
+    suspects = []   # (index, item) interrupted by a broken pool
+    retry = []      # (index, item) interrupted by a killed pool
+    reorder = {}    # index => (item, result)
+    ready = []      # (item, result) of the unordered mode
+    next_index = 0
+    index = 0
+    exhausted = False
+
+    def addResult(item_index, item, result):
+        if ordered:
+            reorder[item_index] = (item, result)
+        else:
+            ready.append((item, result))
+
+    def addFailure(item_index, item, exc):
+        if on_error is None:
+            raise exc
+        addResult(item_index, item, on_error(item, exc))
+
+    try:
+        while True:
+            while True:
+                if suspects:
+                    if not pending:
+                        item_index, item = suspects.pop(0)
+                        pending[executor.submit(func, item)] = (item_index, item)
+                    break
+                if retry:
+                    item_index, item = retry.pop(0)
+                elif not exhausted and len(pending) + len(reorder) < buffer_size:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    item_index = index
+                    index += 1
+                else:
+                    break
+                pending[executor.submit(func, item)] = (item_index, item)
+            if not pending:
+                break
+
+            wait_timeout = None
+            if timeout is not None:
+                now = monotonic()
+                delays = []
+                for future in pending:
+                    if future not in started and future.running():
+                        started[future] = now
+                    if future in started:
+                        delays.append(started[future] + timeout - now)
+                    else:
+                        delays.append(POLL_INTERVAL)
+                wait_timeout = max(min(delays), 0)
+            done = wait(pending, wait_timeout, FIRST_COMPLETED)[0]
+
+            broken = killed = False
+            for future in done:
+                item_index, item = pending.pop(future)
+                started.pop(future, None)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as exc:
+                    broken = True
+                    failures[item_index] = failures.get(item_index, 0) + 1
+                    if failures[item_index] < MAX_POOL_FAILURES:
+                        suspects.append((item_index, item))
+                    else:
+                        addFailure(item_index, item, exc)
+                    continue
+                addResult(item_index, item, result)
+
+            if timeout is not None:
+                now = monotonic()
+                for future, start in list(started.items()):
+                    if now < start + timeout:
+                        continue
+                    item_index, item = pending.pop(future)
+                    del started[future]
+                    addFailure(item_index, item,
+                               TimeoutError("timeout (%s sec)" % timeout))
+                    killed = True
+
+            if broken or killed:
+                for future in pending:
+                    future.cancel()
+                killPool(executor)
+                # Submit again the interrupted items
+                for future, (item_index, item) in pending.items():
+                    if future.done() and not future.cancelled() \
+                            and future.exception() is None:
+                        addResult(item_index, item, future.result())
+                        continue
+                    if broken:
+                        failures[item_index] = failures.get(item_index, 0) + 1
+                        if MAX_POOL_FAILURES <= failures[item_index]:
+                            addFailure(item_index, item,
+                                       BrokenProcessPool("worker process died"))
+                        else:
+                            suspects.append((item_index, item))
+                    else:
+                        retry.append((item_index, item))
+                pending.clear()
+                started.clear()
+                executor = createPool(jobs, initializer, initargs)
+
+            yield from ready
+            del ready[:]
+            while next_index in reorder:
+                yield reorder.pop(next_index)
+                next_index += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        if pending:
+            killPool(executor)
+        else:
+            executor.shutdown()
+
+
+class BatchSummary:
+    """
+    Summary of a batch: number of files, failures, data rate and
+    the slowest files.
+    """
+
+    def __init__(self, slowest=5):
+        self.files = 0
+        self.failures = 0
+        self.start = perf_counter()
+        self.nslowest = slowest
+        self._slowest = []   # heap of (duration, filename)
+
+    def add(self, filename, ok, duration):
+        """
+        Add the result of a file: ok is a boolean, duration in seconds
+        """
+        self.files += 1
+        if not ok:
+            self.failures += 1
+        item = (duration, filename)
+        if len(self._slowest) < self.nslowest:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    def getSlowest(self):
+        """
+        Get the slowest files: list of (duration, filename)
+        sorted by duration (slowest first)
+        """
+        return sorted(self._slowest, reverse=True)
+
+    def exportPlaintext(self):
+        duration = perf_counter() - self.start
+        text = ["Summary:",
+                "- Files: %s" % self.files,
+                "- Failures: %s" % self.failures,
+                "- Total time: %s" % humanDuration(duration * 1000)]
+        if duration:
+            text.append("- Files/sec: %.1f" % (self.files / duration))
+        slowest = self.getSlowest()
+        if slowest:
+            text.append("Slowest files:")
+        for file_duration, filename in slowest:
+            text.append("- %s: %s"
+                        % (filename, humanDuration(file_duration * 1000)))
+        return text
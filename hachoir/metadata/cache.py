@@ -0,0 +1,254 @@
+"""
+Persistent metadata cache stored in a SQLite database.
+
+Entries are keyed by the identity of the file (device, inode, size and
+modification time in nanoseconds), the Hachoir version, the quality and
+the extraction options of hachoir.metadata.config (maximum string length
+and raw output), so an unchanged file only costs a stat() call:
+
+    with MetadataCache("metadata.sqlite") as cache:
+        metadata = cache.extractMetadata(filename)
+
+Results are serialized using pickle: only use cache files that you
+created yourself.
+"""
+
+from hachoir.core.error import error
+from hachoir.core.tools import humanFilesize
+from hachoir.metadata import config
+from hachoir.metadata.metadata import extractMetadata, restoreMetadata
+from hachoir.metadata.metadata_item import QUALITY_NORMAL
+from hachoir.parser import createParser
+from hachoir.version import VERSION
+from time import time
+import os
+import pickle
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    quality REAL NOT NULL,
+    options TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    parser TEXT,
+    state BLOB,
+    last_use REAL NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns, version, quality, options)
+)
+"""
+
+# Timeout in seconds to wait for a lock on the database (used when multiple
+# processes share the same cache)
+LOCK_TIMEOUT = 30.0
+
+# Number of cache hits after which their last use time is written
+FLUSH_HITS = 1000
+
+
+def getFileKey(filename):
+    """
+    Get the identity of a file: (device, inode, size, mtime_ns)
+    """
+    stat = os.stat(filename)
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def getOptions():
+    """
+    Get the extraction options which change the metadata values
+    """
+    return "maxlen=%s raw=%s" % (config.MAX_STR_LENGTH, int(config.RAW_OUTPUT))
+
+
+class MetadataCache:
+    """
+    Persistent cache of metadata extraction results.
+
+    A result is a (parser identifier, metadata) tuple: the parser identifier
+    is None if no parser is able to parse the file, and metadata is None if
+    metadata can not be extracted.
+
+    Attributes hits, misses and stores count the operations of this object.
+    The last use time of the hit entries is written by flush(), at the latest
+    when the cache is closed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._used = []
+        self.db = sqlite3.connect(filename, timeout=LOCK_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute(SCHEMA)
+
+    def flush(self):
+        """
+        Write the last use time of the hit entries
+        """
+        if not self._used:
+            return
+        now = time()
+        with self.db:
+            self.db.executemany("UPDATE metadata SET last_use=? WHERE rowid=?",
+                                [(now, rowid) for rowid in self._used])
+        del self._used[:]
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def get(self, file_key, quality=QUALITY_NORMAL):
+        """
+        Get the cached result of the file identified by file_key
+        (see getFileKey()): (parser identifier, metadata) tuple,
+        or None if the file is not cached.
+        """
+        row = self.db.execute(
+            "SELECT rowid, parser, state FROM metadata "
+            "WHERE dev=? AND ino=? AND size=? AND mtime_ns=? "
+            "AND version=? AND quality=? AND options=?",
+            file_key + (VERSION, quality, getOptions())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        rowid, parser_id, state = row
+        if state is not None:
+            try:
+                metadata = restoreMetadata(pickle.loads(state), quality)
+            except Exception as err:
+                error("Invalid metadata cache entry: %s" % err)
+                self.misses += 1
+                return None
+        else:
+            metadata = None
+        self.hits += 1
+        self._used.append(rowid)
+        if len(self._used) >= FLUSH_HITS:
+            self.flush()
+        return parser_id, metadata
+
+    def set(self, file_key, quality, filename, parser_id, metadata):
+        """
+        Store the result of a file: replace the previous results of
+        the same file (device and inode) with the same quality and options.
+        """
+        if metadata is not None:
+            state = pickle.dumps(metadata.exportState(),
+                                 pickle.HIGHEST_PROTOCOL)
+        else:
+            state = None
+        dev, ino = file_key[:2]
+        options = getOptions()
+        with self.db:
+            self.db.execute(
+                "DELETE FROM metadata "
+                "WHERE dev=? AND ino=? AND quality=? AND options=?",
+                (dev, ino, quality, options))
+            self.db.execute(
+                "INSERT OR REPLACE INTO metadata "
+                "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                file_key + (VERSION, quality, options, filename, parser_id,
+                            state, time()))
+        self.stores += 1
+
+    def extractMetadata(self, filename, quality=QUALITY_NORMAL,
+                        budget=None, tags=None):
+        """
+        Extract metadata of a file using the cache: return a
+        (parser identifier, metadata) tuple (see get()).
+
+        Raise an InputStreamError if the file can not be read. Results of
+        a BudgetExceeded error are not cached.
+        """
+        file_key = getFileKey(filename)
+        result = self.get(file_key, quality)
+        if result is not None:
+            return result
+        parser = createParser(filename, tags=tags, budget=budget)
+        if parser:
+            with parser:
+                parser_id = parser.getParserTags()["id"]
+                metadata = extractMetadata(parser, quality, budget)
+            if not metadata:
+                metadata = None
+        else:
+            parser_id = None
+            metadata = None
+        self.set(file_key, quality, filename, parser_id, metadata)
+        return parser_id, metadata
+
+    def clean(self, max_age=None):
+        """
+        Remove the entries of other Hachoir versions, of files which have been
+        removed or modified and, if max_age is set, of files which have not
+        been used since max_age seconds. Compact the database.
+
+        Return the number of removed entries.
+        """
+        self.flush()
+        removed = []
+        if max_age is not None:
+            min_use = time() - max_age
+        else:
+            min_use = None
+        rows = self.db.execute(
+            "SELECT rowid, dev, ino, size, mtime_ns, version, filename, "
+            "last_use FROM metadata")
+        for row in rows.fetchall():
+            rowid, version, filename, last_use = row[0], row[5], row[6], row[7]
+            if version != VERSION \
+                    or (min_use is not None and last_use < min_use):
+                removed.append(rowid)
+                continue
+            try:
+                file_key = getFileKey(filename)
+            except OSError:
+                file_key = None
+            if file_key != tuple(row[1:5]):
+                removed.append(rowid)
+        with self.db:
+            self.db.executemany("DELETE FROM metadata WHERE rowid=?",
+                                [(rowid,) for rowid in removed])
+        self.db.execute("VACUUM")
+        return len(removed)
+
+    def getStats(self):
+        """
+        Get statistics: dictionary with the keys entries (number of
+        entries), size (size of the database in bytes), hits,
+        misses and stores.
+        """
+        entries = self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        return {"entries": entries,
+                "size": page_count * page_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores}
+
+    def exportPlaintext(self):
+        stats = self.getStats()
+        return ["Metadata cache %s:" % self.filename,
+                "- Entries: %s" % stats["entries"],
+                "- Size: %s" % humanFilesize(stats["size"]),
+                "- Hits: %s" % stats["hits"],
+                "- Misses: %s" % stats["misses"],
+                "- Stores: %s" % stats["stores"]]
@@ -0,0 +1,168 @@
+"""
+Machine oriented export of metadata: one JSON object per line (NDJSON)
+or one CSV row per file, written as soon as metadata are extracted.
+
+Values are typed: numbers are kept as numbers, dates are written in ISO
+8601 format, durations in seconds and languages as ISO 639-2 codes.
+
+The CSV schema is stable: columns are "path" (name of the file), "parser"
+(parser identifier) and then all metadata keys (see getColumns()), in the
+order of registerAllItems().
+"""
+
+from hachoir.core.language import Language
+from hachoir.core.tools import makeUnicode
+from hachoir.metadata.register import registerAllItems
+from datetime import date, time, timedelta
+import csv
+import io
+import json
+
+FORMATS = ("text", "json", "csv")
+
+# Separator of multiple values in a CSV cell
+CSV_SEPARATOR = " | "
+
+
+def exportValue(value):
+    """
+    Convert a metadata value to a JSON compatible value.
+
+    >>> from datetime import datetime, timedelta
+    >>> exportValue(datetime(2003, 5, 24, 22, 29, 14))
+    '2003-05-24T22:29:14'
+    >>> exportValue(timedelta(minutes=2, milliseconds=500))
+    120.5
+    >>> exportValue(Language('fre'))
+    'fre'
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, Language):
+        return value.code
+    return makeUnicode(value)
+
+
+class _KeyCollector:
+    """
+    Fake metadata used by getColumns() to collect the registered keys
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def register(self, data):
+        self.items.append(data)
+
+
+_columns = None
+
+
+def getColumns():
+    """
+    Get the list of the CSV columns: "path", "parser" and all metadata
+    keys sorted by priority.
+    """
+    global _columns
+    if _columns is None:
+        collector = _KeyCollector()
+        registerAllItems(collector)
+        items = sorted(collector.items, key=lambda data: data.priority)
+        _columns = ["path", "parser"] + [data.key for data in items]
+    return _columns
+
+
+def createRecord(filename, parser_id, metadata, priority=None):
+    """
+    Create the record of a file: dictionary with the keys "path",
+    "parser", the metadata keys and "groups" for the metadata of
+    sub-documents (see Metadata.exportValues()).
+    """
+    record = {"path": filename, "parser": parser_id}
+    record.update(metadata.exportValues(priority))
+    return record
+
+
+def filterRecord(record, keys):
+    """
+    Only keep the "path" and "parser" keys and the metadata keys
+    of the keys list (also in groups).
+    """
+    result = {}
+    for key, value in record.items():
+        if key == "groups":
+            groups = {}
+            for name, group in value.items():
+                group = filterRecord(group, keys)
+                if group:
+                    groups[name] = group
+            if groups:
+                result[key] = groups
+        elif key in keys or key in ("path", "parser"):
+            result[key] = value
+    return result
+
+
+def formatJSON(record):
+    """
+    Format a record as a JSON object written on a single line
+    """
+    return json.dumps(record)
+
+
+def _formatCell(values):
+    cell = []
+    for value in values:
+        if isinstance(value, bool):
+            value = int(value)
+        value = str(value)
+        if value not in cell:
+            cell.append(value)
+    return CSV_SEPARATOR.join(cell)
+
+
+def _collectValues(values, record):
+    for key, value in record.items():
+        if key == "groups":
+            for group in value.values():
+                _collectValues(values, group)
+            continue
+        if not isinstance(value, list):
+            value = [value]
+        values.setdefault(key, []).extend(value)
+
+
+def flattenRecord(record):
+    """
+    Flatten a record for CSV: values of groups are added after the values
+    of the common metadata. Return a dictionary key => cell text.
+    """
+    values = {}
+    _collectValues(values, record)
+    return {key: _formatCell(value) for key, value in values.items()}
+
+
+def formatCSV(record, columns=None):
+    """
+    Format a record as a CSV row (without the newline)
+    """
+    if columns is None:
+        columns = getColumns()
+    row = flattenRecord(record)
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="")
+    writer.writerow([row.get(column, "") for column in columns])
+    return output.getvalue()
+
+
+def formatCSVHeader(columns=None):
+    if columns is None:
+        columns = getColumns()
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="")
+    writer.writerow(columns)
+    return output.getvalue()
@@ -1,5 +1,4 @@
 from hachoir.metadata.metadata import RootMetadata, registerExtractor
-from hachoir.metadata.image import computeComprRate
 from hachoir.parser.image.exif import IFD, BasicIFDEntry
 from hachoir.parser.image.jpeg import (
     JpegFile, JpegChunk,
@@ -70,34 +69,48 @@ class JpegMetadata(RootMetadata):
     }
 
     def extract(self, jpeg):
-        if "start_frame/content" in jpeg:
-            self.startOfFrame(jpeg["start_frame/content"])
-        elif "start_scan/content/nr_components" in jpeg:
-            self.bits_per_pixel = 8 * \
-                jpeg["start_scan/content/nr_components"].value
-        if "app0/content" in jpeg:
-            self.extractAPP0(jpeg["app0/content"])
+        # Only parse the header segments (until the first SOS segment):
+        # the image data is not parsed
+        chunks = {}
+        for chunk in jpeg.getHeaderChunks():
+            name = chunk.name.split("[", 1)[0]
+            chunks.setdefault(name, []).append(chunk)
 
-        if "exif/content" in jpeg:
-            for ifd in jpeg['exif/content']:
+        def getContent(name):
+            for chunk in chunks.get(name, ()):
+                if "content" in chunk:
+                    return chunk["content"]
+            return None
+
+        sof = getContent("start_frame")
+        sos = getContent("start_scan")
+        if sof is not None:
+            self.startOfFrame(sof)
+        elif sos is not None and "nr_components" in sos:
+            self.bits_per_pixel = 8 * sos["nr_components"].value
+        app0 = getContent("app0")
+        if app0 is not None:
+            self.extractAPP0(app0)
+
+        exif = getContent("exif")
+        if exif is not None:
+            for ifd in exif:
                 if not isinstance(ifd, IFD):
                     continue
                 for entry in ifd.array("entry"):
                     self.processIfdEntry(ifd, entry)
                 self.readGPS(ifd)
-        if "photoshop/content" in jpeg:
-            psd = jpeg["photoshop/content"]
+        psd = getContent("photoshop")
+        if psd is not None:
             if "version/content/reader_name" in psd:
                 self.producer = psd["version/content/reader_name"].value
             if "iptc/content" in psd:
                 self.parseIPTC(psd["iptc/content"])
-        for field in jpeg.array("comment"):
+        for field in chunks.get("comment", ()):
             if "content/comment" in field:
                 self.comment = field["content/comment"].value
-        self.computeQuality(jpeg)
-        if "data" in jpeg:
-            computeComprRate(self, jpeg["data"].size)
-        if not self.has("producer") and "photoshop" in jpeg:
+        self.computeQuality(chunks.get("quantization", ()))
+        if not self.has("producer") and "photoshop" in chunks:
             self.producer = "Adobe Photoshop"
         if self.has("compression"):
             self.compression = "JPEG"
@@ -120,13 +133,13 @@ class JpegMetadata(RootMetadata):
             self.nb_colors = 256
 
     @fault_tolerant
-    def computeQuality(self, jpeg):
+    def computeQuality(self, quantizations):
         # This function is an adaption to Python of ImageMagick code
         # to compute JPEG quality using quantization tables
 
-        # Read quantization tables
+        # Read quantization tables of the DQT chunks
         qtlist = []
-        for dqt in jpeg.array("quantization"):
+        for dqt in quantizations:
             for qt in dqt.array("content/qt"):
                 # TODO: Take care of qt["index"].value?
                 qtlist.append(qt)
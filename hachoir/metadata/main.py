@@ -1,17 +1,28 @@
 from hachoir.core.error import error
 from hachoir.core.i18n import getTerminalCharset
 from hachoir.core.benchmark import Benchmark
+from hachoir.core.budget import ParseBudget, BudgetExceeded
 from hachoir.stream import InputStreamError
 from hachoir.core.tools import makePrintable
 from hachoir.core.cmd_line import displayVersion
-from hachoir.parser import createParser, ParserList
+from hachoir.parser import createParser, ParserList, HachoirParserList
 import hachoir.core.config as hachoir_config
 from hachoir.metadata import config
 from optparse import OptionParser
 from hachoir.metadata import extractMetadata
 from hachoir.metadata.metadata import extractors as metadata_extractors
+from hachoir.metadata.batch import iterFiles, runPool, BatchSummary
+from hachoir.metadata.cache import MetadataCache, getFileKey
+from hachoir.metadata.export import (FORMATS, getColumns, createRecord,
+                                     filterRecord, formatJSON, formatCSV, formatCSVHeader)
+from multiprocessing.util import Finalize
+from time import perf_counter
 import sys
 
+# Default of the --kill-timeout option (in seconds)
+DEFAULT_KILL_TIMEOUT = 300.0
+KILL_TIMEOUT_MARGIN = 10.0
+
 
 def displayParserList(*args):
     parser_list = ParserList()
@@ -21,7 +32,7 @@ def displayParserList(*args):
     sys.exit(0)
 
 
-def parseOptions():
+def parseOptions(default_format="text"):
     parser = OptionParser(usage="%prog [options] files")
     parser.add_option("--type", help="Only display file type (description)",
                       action="store_true", default=False)
@@ -33,6 +44,13 @@ def parseOptions():
                       choices=[str(choice) for choice in range(1, 9 + 1)])
     parser.add_option("--raw", help="Raw output",
                       action="store_true", default=False)
+    parser.add_option("--format",
+                      help="Output format: text, json (one JSON object per line) or csv (default: %s)" % default_format,
+                      action="store", default=default_format, type="choice",
+                      choices=FORMATS)
+    parser.add_option("--fields",
+                      help="With --format=json or csv, comma separated list of metadata keys to export (default: all keys)",
+                      type="str", default=None)
     parser.add_option("--bench", help="Run benchmark",
                       action="store_true", default=False)
     parser.add_option("--force-parser", help="List all parsers then exit",
@@ -41,10 +59,41 @@ def parseOptions():
                       action="callback", callback=displayParserList)
     parser.add_option("--profiler", help="Run profiler",
                       action="store_true", default=False)
+    parser.add_option("--profiler-json",
+                      help="Write profiler statistics into a JSON file (implies --profiler)",
+                      type="str", default=None)
+    parser.add_option("--io-stats", help="Display I/O statistics on stderr",
+                      action="store_true", default=False)
     parser.add_option("--version", help="Display version and exit",
                       action="callback", callback=displayVersion)
     parser.add_option("--quality", help="Information quality (0.0=fastest, 1.0=best, and default is 0.5)",
                       action="store", type="float", default="0.5")
+    parser.add_option("--recursive", help="Process files of directories recursively",
+                      action="store_true", default=False)
+    parser.add_option("--jobs", help="Number of worker processes (default: 1)",
+                      type="int", default=1)
+    parser.add_option("--unordered", help="With --jobs, display results in completion order (instead of input order)",
+                      action="store_true", default=False)
+    parser.add_option("--timeout", help="Maximum duration in seconds to process a file (default: no limit)",
+                      type="float", default=None)
+    parser.add_option("--kill-timeout", help="With --jobs, kill a worker process which takes more than this number of seconds to process a file (default: --timeout + %s, or %s without --timeout)" % (KILL_TIMEOUT_MARGIN, DEFAULT_KILL_TIMEOUT),
+                      type="float", default=None)
+    parser.add_option("--max-read", help="Maximum number of bytes read to process a file (default: no limit)",
+                      type="int", default=None)
+    parser.add_option("--max-fields", help="Maximum number of fields created to process a file (default: no limit)",
+                      type="int", default=None)
+    parser.add_option("--cache",
+                      help="Cache metadata in a SQLite database: unchanged files are not parsed again",
+                      type="str", default=None)
+    parser.add_option("--cache-stats",
+                      help="Display statistics of the cache on stderr (hits and misses are not counted with --jobs)",
+                      action="store_true", default=False)
+    parser.add_option("--cache-clean",
+                      help="Remove obsolete entries from the cache, compact it and exit",
+                      action="store_true", default=False)
+    parser.add_option("--cache-max-age",
+                      help="With --cache-clean, also remove entries unused since DAYS days",
+                      type="float", default=None, metavar="DAYS")
     parser.add_option("--maxlen", help="Maximum string length in characters, 0 means unlimited (default: %s)" % config.MAX_STR_LENGTH,
                       type="int", default=config.MAX_STR_LENGTH)
     parser.add_option("--verbose", help="Verbose mode",
@@ -53,21 +102,137 @@ def parseOptions():
                       default=False, action="store_true")
 
     values, filename = parser.parse_args()
+    if values.cache_clean:
+        if not values.cache:
+            parser.error("--cache-clean requires --cache")
+        return values, filename
     if len(filename) == 0:
         parser.print_help()
         sys.exit(1)
 
+    if values.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if values.kill_timeout is None:
+        if values.timeout:
+            values.kill_timeout = values.timeout + KILL_TIMEOUT_MARGIN
+        else:
+            values.kill_timeout = DEFAULT_KILL_TIMEOUT
+    if values.format != "text" and (values.mime or values.type):
+        parser.error("--format=%s can not be used with --mime or --type"
+                     % values.format)
+    if values.fields:
+        fields = [field.strip() for field in values.fields.split(",")]
+        columns = getColumns()
+        for field in fields:
+            if field not in columns:
+                parser.error("Unknown metadata key: %r" % field)
+        values.fields = fields
+    if values.cache_stats and not values.cache:
+        parser.error("--cache-stats requires --cache")
+    if values.cache and values.force_parser:
+        parser.error("--cache can not be used with --force-parser")
+    return values, filename
+
+
+def configure(values):
     # Update limits
     config.MAX_STR_LENGTH = values.maxlen
     if values.raw:
         config.RAW_OUTPUT = True
 
-    return values, filename
+    # Initialize Hachoir
+    if values.io_stats:
+        hachoir_config.io_stats = True
+    if values.debug:
+        hachoir_config.debug = True
+    elif values.verbose:
+        hachoir_config.verbose = True
+    else:
+        hachoir_config.quiet = True
 
 
-def processFile(values, filename,
-                display_filename=False, priority=None, human=True, display=True):
-    charset = getTerminalCharset()
+def displayIOStats(stats, filename):
+    print("[%s]" % filename, file=sys.stderr)
+    for line in stats.exportPlaintext():
+        print(line, file=sys.stderr)
+
+
+# Metadata cache of the current process, see getCache()
+_cache = None
+
+
+def getCache(values):
+    """
+    Get the metadata cache of the --cache option (opened once per process),
+    or None if the option is not used
+    """
+    global _cache
+    if not values.cache:
+        return None
+    if _cache is None:
+        _cache = MetadataCache(values.cache)
+        # Write the last use time of cache hits when the process exits,
+        # atexit handlers are not called in worker processes
+        Finalize(None, _cache.close, exitpriority=0)
+    return _cache
+
+
+def formatMetadata(values, filename, parser_id, metadata, priority, human):
+    """
+    Format metadata of a file using the output format: list of lines
+    """
+    if values.format != "text":
+        record = createRecord(filename, parser_id, metadata, priority)
+        if values.fields:
+            record = filterRecord(record, values.fields)
+        if values.format == "json":
+            return [formatJSON(record)]
+        else:
+            return [formatCSV(record, getOutputColumns(values))]
+    text = metadata.exportPlaintext(priority=priority, human=human)
+    if not text:
+        text = ["(no metadata, priority may be too small)"]
+    return text
+
+
+def extractText(values, filename, priority=None, human=True):
+    """
+    Extract metadata (or the MIME type or file type) of a file.
+
+    Return (ok, text) where text is a list of lines, or None on error.
+    """
+    extract_metadata = not(values.mime or values.type)
+
+    # Use the cache
+    cache = None
+    file_key = None
+    if extract_metadata:
+        cache = getCache(values)
+    if cache is not None:
+        try:
+            file_key = getFileKey(filename)
+        except OSError:
+            # createParser() reports the error
+            pass
+        if file_key is not None:
+            result = cache.get(file_key, values.quality)
+            if result is not None:
+                parser_id, metadata = result
+                if parser_id is None:
+                    error("Unable to parse file: %s" % filename)
+                    return False, None
+                if metadata is None:
+                    error("Hachoir can't extract metadata, but is able to parse: %s"
+                          % filename)
+                    return False, None
+                return True, formatMetadata(values, filename, parser_id,
+                                            metadata, priority, human)
+
+    if values.timeout or values.max_read or values.max_fields:
+        budget = ParseBudget(values.timeout, values.max_read,
+                             values.max_fields)
+    else:
+        budget = None
 
     # Create parser
     try:
@@ -75,63 +240,203 @@ def processFile(values, filename,
             tags = [("id", values.force_parser), None]
         else:
             tags = None
-        parser = createParser(filename, tags=tags)
+        parser = createParser(filename, tags=tags, budget=budget)
     except InputStreamError as err:
         error(str(err))
-        return False
+        return False, None
+    except BudgetExceeded as err:
+        error("%s: %s" % (filename, err))
+        return False, None
     if not parser:
+        if file_key is not None:
+            cache.set(file_key, values.quality, filename, None, None)
         error("Unable to parse file: %s" % filename)
-        return False
+        return False, None
 
     with parser:
+        parser_id = parser.getParserTags()["id"]
+
         # Extract metadata
-        extract_metadata = not(values.mime or values.type)
         if extract_metadata:
             try:
-                metadata = extractMetadata(parser, values.quality)
+                metadata = extractMetadata(parser, values.quality, budget)
+            except BudgetExceeded as err:
+                error("%s: %s" % (filename, err))
+                return False, None
             except Exception as err:
                 error(str(err))
                 metadata = None
+            if values.io_stats:
+                displayIOStats(parser.stream.stats, filename)
             if not metadata:
+                metadata = None
+            if file_key is not None:
+                cache.set(file_key, values.quality, filename,
+                          parser_id, metadata)
+            if metadata is None:
                 parser.error("Hachoir can't extract metadata, but is able to parse: %s"
                              % filename)
-                return False
+                return False, None
+        elif values.io_stats:
+            displayIOStats(parser.stream.stats, filename)
 
-    if display:
-        # Display metadatas on stdout
         if extract_metadata:
-            text = metadata.exportPlaintext(priority=priority, human=human)
-            if not text:
-                text = ["(no metadata, priority may be too small)"]
-            if display_filename:
-                for line in text:
-                    line = "%s: %s" % (filename, line)
-                    print(makePrintable(line, charset))
-            else:
-                for line in text:
-                    print(makePrintable(line, charset))
+            text = formatMetadata(values, filename, parser_id, metadata,
+                                  priority, human)
+        elif values.type:
+            text = [parser.description]
         else:
-            if values.type:
-                text = parser.description
-            else:
-                text = parser.mime_type
-            if display_filename:
-                text = "%s: %s" % (filename, text)
-            print(text)
-    return True
+            text = [parser.mime_type]
+    return True, text
+
+
+def getOutputColumns(values):
+    """
+    Get the CSV columns of the --format=csv output
+    """
+    if values.fields:
+        return ["path", "parser"] + values.fields
+    else:
+        return getColumns()
+
+
+def displayHeader(values):
+    if values.format == "csv":
+        print(formatCSVHeader(getOutputColumns(values)))
+
+
+def displayText(filename, text, display_filename, machine=False):
+    if machine:
+        # JSON and CSV output: don't escape characters
+        for line in text:
+            print(line)
+        return
+    charset = getTerminalCharset()
+    for line in text:
+        if display_filename:
+            line = "%s: %s" % (filename, line)
+        print(makePrintable(line, charset))
+
+
+def processFile(values, filename,
+                display_filename=False, priority=None, human=True, display=True):
+    ok, text = extractText(values, filename, priority, human)
+    if display and text is not None:
+        # Display metadatas on stdout
+        displayText(filename, text, display_filename,
+                    values.format != "text")
+    return ok
+
+
+# Options of the current worker process, see initWorker()
+_worker_values = None
+
+
+def initWorker(values):
+    """
+    Initialize a worker process: configure Hachoir and build the parser list
+    """
+    global _worker_values
+    _worker_values = values
+    configure(values)
+    HachoirParserList.getInstance()
+
+
+def processFileWorker(filename):
+    """
+    Process a file in a worker process: return (ok, text, duration)
+    """
+    values = _worker_values
+    human = not(values.raw)
+    priority = int(values.level) * 100 + 99
+    start = perf_counter()
+    try:
+        ok, text = extractText(values, filename, priority, human)
+    except Exception as err:
+        error("%s: %s" % (filename, err))
+        ok, text = False, None
+    return ok, text, perf_counter() - start
+
+
+def workerError(filename, err, kill_timeout):
+    """
+    Result of a file when its worker process died or was killed
+    """
+    if isinstance(err, TimeoutError):
+        error("%s: worker process killed after %s sec"
+              % (filename, kill_timeout))
+        return False, None, kill_timeout
+    error("%s: worker process died (%s)" % (filename, err))
+    return False, None, 0.0
+
+
+def processBatch(values, filenames, display=True):
+    """
+    Process files in batch mode: walk directories if the --recursive option
+    is used, use worker processes if --jobs is greater than 1, and display
+    a summary on stderr.
+    """
+    files = iterFiles(filenames, values.recursive)
+    if 1 < values.jobs:
+        def onError(filename, err):
+            return workerError(filename, err, values.kill_timeout)
+
+        results = runPool(processFileWorker, files, values.jobs,
+                          initializer=initWorker, initargs=(values,),
+                          ordered=not values.unordered,
+                          timeout=values.kill_timeout, on_error=onError)
+    else:
+        initWorker(values)
+        results = ((filename, processFileWorker(filename))
+                   for filename in files)
+
+    summary = BatchSummary()
+    machine = (values.format != "text")
+    if display:
+        displayHeader(values)
+    for filename, (ok, text, duration) in results:
+        summary.add(filename, ok, duration)
+        if display and text is not None:
+            displayText(filename, text, not machine, machine)
+    if display:
+        sys.stdout.flush()
+        for line in summary.exportPlaintext():
+            print(line, file=sys.stderr)
+    return not summary.failures
 
 
 def processFiles(values, filenames, display=True):
+    if values.recursive or 1 < values.jobs:
+        return processBatch(values, filenames, display)
     human = not(values.raw)
     ok = True
     priority = int(values.level) * 100 + 99
     display_filename = (1 < len(filenames))
+    if display:
+        displayHeader(values)
     for filename in filenames:
         ok &= processFile(values, filename, display_filename,
                           priority, human, display)
     return ok
 
 
+def displayCacheStats(cache):
+    for line in cache.exportPlaintext():
+        print(line, file=sys.stderr)
+
+
+def cleanCache(values):
+    if values.cache_max_age is not None:
+        max_age = values.cache_max_age * 24 * 3600
+    else:
+        max_age = None
+    with MetadataCache(values.cache) as cache:
+        removed = cache.clean(max_age)
+        print("Removed entries: %s" % removed)
+        for line in cache.exportPlaintext():
+            print(line)
+
+
 def benchmarkMetadata(values, filenames):
     bench = Benchmark()
     bench.run(processFiles, values, filenames, display=False)
@@ -139,27 +444,29 @@ def benchmarkMetadata(values, filenames):
 
 def profile(values, filenames):
     from hachoir.core.profiler import runProfiler
-    return runProfiler(processFiles, (values, filenames), {'display': False})
+    return runProfiler(processFiles, (values, filenames), {'display': False},
+                       json_filename=values.profiler_json)
 
 
-def main():
+def main(default_format="text"):
     try:
         # Parser options and initialize Hachoir
-        values, filenames = parseOptions()
+        values, filenames = parseOptions(default_format)
 
-        if values.debug:
-            hachoir_config.debug = True
-        elif values.verbose:
-            hachoir_config.verbose = True
-        else:
-            hachoir_config.quiet = True
+        configure(values)
+
+        if values.cache_clean:
+            cleanCache(values)
+            sys.exit(0)
 
-        if values.profiler:
+        if values.profiler or values.profiler_json:
             ok = profile(values, filenames)
         elif values.bench:
             ok = benchmarkMetadata(values, filenames)
         else:
             ok = processFiles(values, filenames)
+        if values.cache_stats:
+            displayCacheStats(getCache(values))
     except KeyboardInterrupt:
         print("Program interrupted (CTRL+C).")
         ok = False
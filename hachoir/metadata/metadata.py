@@ -3,12 +3,42 @@ from hachoir.core.tools import makeUnicode
 from hachoir.core.dict import Dict
 from hachoir.core.error import error
 from hachoir.core.log import Logger
+from hachoir.core.budget import runWithBudget
 from hachoir.metadata.metadata_item import (
-    MIN_PRIORITY, MAX_PRIORITY, QUALITY_NORMAL)
+    MIN_PRIORITY, MAX_PRIORITY, QUALITY_NORMAL, DataValue)
 from hachoir.metadata.register import registerAllItems
+from hachoir.metadata.export import exportValue
 
 extractors = {}
 
+# Definitions of the metadata items: key => Data without value,
+# see getTemplates()
+_templates = None
+
+
+class _TemplateList:
+
+    def __init__(self):
+        self.templates = {}
+
+    def register(self, data):
+        assert data.key not in self.templates
+        data.values = ()
+        self.templates[data.key] = data
+
+
+def getTemplates():
+    """
+    Get the definitions of the metadata items: dictionary key => Data
+    (without value). They are only created once by registerAllItems().
+    """
+    global _templates
+    if _templates is None:
+        template_list = _TemplateList()
+        registerAllItems(template_list)
+        _templates = template_list.templates
+    return _templates
+
 
 class Metadata(Logger):
     header = "Metadata"
@@ -23,13 +53,13 @@ class Metadata(Logger):
             quality = min(max(0.0, quality), 1.0)
 
         object.__init__(self)
+        # Items are only created for keys which have a value
         object.__setattr__(self, "_Metadata__data", {})
+        object.__setattr__(self, "_Metadata__templates", getTemplates())
         object.__setattr__(self, "quality", quality)
         header = self.__class__.header
         object.__setattr__(self, "_Metadata__header", header)
 
-        registerAllItems(self)
-
     def _logger(self):
         pass
 
@@ -37,13 +67,23 @@ class Metadata(Logger):
         """
         Add a new value to data with name 'key'. Skip duplicates.
         """
-        # Invalid key?
-        if key not in self.__data:
-            raise KeyError("%s has no metadata '%s'" %
-                           (self.__class__.__name__, key))
+        try:
+            data = self.__data[key]
+        except KeyError:
+            # Invalid key?
+            try:
+                template = self.__templates[key]
+            except KeyError:
+                raise KeyError("%s has no metadata '%s'" %
+                               (self.__class__.__name__, key))
+            data = template.copy(self)
+            data.add(value)
+            if data.values:
+                self.__data[key] = data
+            return
 
         # Skip duplicates
-        self.__data[key].add(value)
+        data.add(value)
 
     def setHeader(self, text):
         object.__setattr__(self, "header", text)
@@ -51,6 +91,11 @@ class Metadata(Logger):
     def getItems(self, key):
         try:
             return self.__data[key]
+        except LookupError:
+            pass
+        try:
+            # Item without value
+            return self.__templates[key]
         except LookupError:
             raise ValueError("Metadata has no value '%s'" % key)
 
@@ -85,11 +130,7 @@ class Metadata(Logger):
         return item.value
 
     def getValues(self, key):
-        try:
-            data = self.__data[key]
-        except LookupError:
-            raise ValueError("Metadata has no value '%s'" % key)
-        return [item.value for item in data]
+        return [item.value for item in self.getItems(key)]
 
     def getText(self, key, default=None, index=0):
         """
@@ -110,11 +151,19 @@ class Metadata(Logger):
             return default
 
     def register(self, data):
-        assert data.key not in self.__data
-        data.metadata = self
-        self.__data[data.key] = data
+        """
+        Register a new metadata item (Data) in this metadata object
+        """
+        assert data.key not in self.__templates
+        templates = dict(self.__templates)
+        templates[data.key] = data.copy(None)
+        templates[data.key].values = ()
+        object.__setattr__(self, "_Metadata__templates", templates)
 
     def __iter__(self):
+        """
+        Iterate on items which have at least one value
+        """
         return iter(self.__data.values())
 
     def __str__(self):
@@ -218,6 +267,52 @@ class Metadata(Logger):
                 text[title][field] = value
         return text
 
+    def exportValues(self, priority=None):
+        """
+        Export typed values (see hachoir.metadata.export.exportValue()) as
+        a dictionary key => value, or key => list of values if the key has
+        multiple values. Skip datas with priority lower than specified
+        priority.
+
+        >>> from datetime import timedelta
+        >>> meta = RootMetadata()
+        >>> meta.duration = timedelta(seconds=90)
+        >>> meta.exportValues()
+        {'duration': 90.0}
+        """
+        if priority is not None:
+            priority = max(priority, MIN_PRIORITY)
+            priority = min(priority, MAX_PRIORITY)
+        else:
+            priority = MAX_PRIORITY
+        values = {}
+        for data in sorted(self, key=lambda data: data.priority):
+            if priority < data.priority:
+                break
+            if not data.values:
+                continue
+            items = [exportValue(item.value) for item in data.values]
+            if len(items) == 1:
+                values[data.key] = items[0]
+            else:
+                values[data.key] = items
+        return values
+
+    def exportState(self):
+        """
+        Export the metadata as a structure of builtin types and values
+        which can be serialized with pickle: see restoreMetadata().
+        """
+        items = [(data.key, [(item.value, item.text) for item in data.values])
+                 for data in sorted(self, key=lambda data: data.priority)]
+        return {"header": self.header, "items": items, "groups": None}
+
+    def _restoreItems(self, items):
+        for key, values in items:
+            data = self.getItems(key).copy(self)
+            data.values = [DataValue(value, text) for value, text in values]
+            self.__data[key] = data
+
     def __bool__(self):
         return any(item for item in self.__data.values())
 
@@ -243,7 +338,7 @@ class MultipleMetadata(RootMetadata):
         return self.__groups[key]
 
     def iterGroups(self):
-        return iter(self.__groups.values())
+        return iter(self.__groups)
 
     def __bool__(self):
         if RootMetadata.__bool__(self):
@@ -307,6 +402,43 @@ class MultipleMetadata(RootMetadata):
                 text.update(value)
         return text
 
+    def exportState(self):
+        state = Metadata.exportState(self)
+        state["groups"] = [(key, metadata.exportState())
+                           for key, metadata in self.__groups.items()]
+        return state
+
+    def exportValues(self, priority=None):
+        values = Metadata.exportValues(self, priority)
+        groups = {}
+        for key, metadata in self.__groups.items():
+            group = metadata.exportValues(priority)
+            if group:
+                groups[key] = group
+        if groups:
+            values["groups"] = groups
+        return values
+
+
+def restoreMetadata(state, quality=QUALITY_NORMAL, parent=None):
+    """
+    Create a metadata object from the result of Metadata.exportState():
+    values are restored without conversion nor filter.
+    """
+    if state["groups"] is not None:
+        metadata = MultipleMetadata(quality)
+    elif parent is not None:
+        metadata = Metadata(parent)
+    else:
+        metadata = RootMetadata(quality)
+    metadata.setHeader(state["header"])
+    metadata._restoreItems(state["items"])
+    if state["groups"]:
+        for key, group_state in state["groups"]:
+            group = restoreMetadata(group_state, quality, metadata)
+            metadata.addGroup(key, group)
+    return metadata
+
 
 def registerExtractor(parser, extractor):
     assert parser not in extractors
@@ -314,10 +446,13 @@ def registerExtractor(parser, extractor):
     extractors[parser] = extractor
 
 
-def extractMetadata(parser, quality=QUALITY_NORMAL):
+def extractMetadata(parser, quality=QUALITY_NORMAL, budget=None):
     """
     Create a Metadata class from a parser. Returns None if no metadata
     extractor does exist for the parser class.
+
+    If budget (ParseBudget) is set, raise a BudgetExceeded error if the
+    budget is exceeded.
     """
     try:
         extractor = extractors[parser.__class__]
@@ -325,7 +460,7 @@ def extractMetadata(parser, quality=QUALITY_NORMAL):
         return None
     metadata = extractor(quality)
     try:
-        metadata.extract(parser)
+        runWithBudget(budget, metadata.extract, parser)
     except Exception as err:
         error("Error during metadata extraction: %s" % str(err))
     if metadata:
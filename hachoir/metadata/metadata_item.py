@@ -13,6 +13,7 @@ QUALITY_BEST = 1.0
 
 
 class DataValue:
+    __slots__ = ("value", "text")
 
     def __init__(self, value, text):
         self.value = value
@@ -20,6 +21,16 @@ class DataValue:
 
 
 class Data:
+    """
+    Metadata item: definition (key, description, priority, type, etc.)
+    and values.
+
+    Definitions are created once by registerAllItems(): they are templates
+    without value. Metadata objects only create an item, using copy(),
+    for keys which receive a value.
+    """
+    __slots__ = ("metadata", "key", "description", "values", "type",
+                 "text_handler", "filter", "priority", "conversion")
 
     def __init__(self, key, priority, description,
                  text_handler=None, type=None, filter=None, conversion=None):
@@ -41,6 +52,23 @@ class Data:
         self.priority = priority
         self.conversion = conversion
 
+    def copy(self, metadata):
+        """
+        Create an item without value of the metadata object metadata
+        sharing the definition of this item
+        """
+        data = Data.__new__(Data)
+        data.metadata = metadata
+        data.key = self.key
+        data.description = self.description
+        data.values = []
+        data.type = self.type
+        data.text_handler = self.text_handler
+        data.filter = self.filter
+        data.priority = self.priority
+        data.conversion = self.conversion
+        return data
+
     def __lt__(self, other):
         return self.priority < other.priority
 
@@ -22,9 +22,14 @@ class Timezone(TimezoneUTC):
     """Fixed offset in hour from UTC."""
 
     def __init__(self, offset):
+        self._hours = offset
         self._offset = timedelta(minutes=offset * 60)
         self._name = "%+03u00" % offset
 
+    def __getinitargs__(self):
+        # used by pickle
+        return (self._hours,)
+
     def utcoffset(self, dt):
         return self._offset
 
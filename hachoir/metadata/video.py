@@ -1,4 +1,5 @@
-from hachoir.field import MissingField
+from hachoir.core.error import warning
+from hachoir.field import MissingField, ParserError
 from hachoir.metadata.metadata import (registerExtractor,
                                        Metadata, RootMetadata, MultipleMetadata)
 from hachoir.metadata.metadata_item import QUALITY_GOOD
@@ -27,10 +28,26 @@ class MkvMetadata(MultipleMetadata):
 
     def extract(self, mkv):
         for segment in mkv.array("Segment"):
-            self.processSegment(segment)
-
-    def processSegment(self, segment):
+            try:
+                # Elements are located using the SeekHead: clusters are
+                # not parsed
+                index = mkv.getSegmentIndex(segment)
+                fields = index.getElements("Info", "Tracks", "Tags")
+            except ParserError as err:
+                warning("Unable to index the MKV segment: %s" % err)
+                fields = self.iterSegmentFields(segment)
+            self.processSegment(fields)
+
+    def iterSegmentFields(self, segment):
         for field in segment:
+            if field.name.startswith("Cluster["):
+                if self.quality < QUALITY_GOOD:
+                    return
+            else:
+                yield field
+
+    def processSegment(self, fields):
+        for field in fields:
             if field.name.startswith("Info["):
                 self.processInfo(field)
             elif field.name.startswith("Tags["):
@@ -38,9 +55,6 @@ class MkvMetadata(MultipleMetadata):
                     self.processTag(tag)
             elif field.name.startswith("Tracks["):
                 self.processTracks(field)
-            elif field.name.startswith("Cluster["):
-                if self.quality < QUALITY_GOOD:
-                    return
 
     def processTracks(self, tracks):
         for entry in tracks.array("TrackEntry"):
@@ -218,9 +232,11 @@ class FlvMetadata(MultipleMetadata):
 class MovMetadata(RootMetadata):
 
     def extract(self, mov):
-        for atom in mov:
-            if "movie" in atom:
-                self.processMovie(atom["movie"])
+        # Jump to the movie atom using the atom index: media data atoms are
+        # not parsed
+        atom = mov.getTopAtom("moov")
+        if atom is not None and "movie" in atom:
+            self.processMovie(atom["movie"])
 
     @fault_tolerant
     def processMovieHeader(self, hdr):
@@ -6,7 +6,7 @@ Authors: Christophe Gisquet and Victor Stinner
 """
 
 from hachoir.parser import Parser
-from hachoir.field import (FieldSet, ParserError,
+from hachoir.field import (FieldSet, ParserError, createOrphanField,
                            Bit, Bits, Enum,
                            TimeDateMSDOS32, SubFile,
                            UInt8, UInt16, UInt32, UInt64,
@@ -15,7 +15,10 @@ from hachoir.field import (FieldSet, ParserError,
 from hachoir.core.text_handler import textHandler, filesizeHandler, hexadecimal
 from hachoir.core.tools import makeUnicode
 from hachoir.core.endian import LITTLE_ENDIAN
+from hachoir.stream import InputStreamError
 from hachoir.parser.common.deflate import Deflate
+from datetime import datetime
+import struct
 
 MAX_FILESIZE = 1000 * 1024 * 1024
 
@@ -340,6 +343,194 @@ class Zip64EndCentralDirectoryLocator(FieldSet):
         yield UInt32(self, "disk_total_number", "Total number of disks")
 
 
+# Maximum size of the end of central directory: 22 bytes + comment
+MAX_END_CENTRAL_DIRECTORY = 22 + 0xFFFF
+END_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_END_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+CENTRAL_DIRECTORY_ENTRY = struct.Struct("<4s4B4HL2L5H2L")
+
+
+def msdosDatetime(value):
+    """
+    Convert a 32-bit MS-DOS timestamp (16-bit time, 16-bit date) to
+    datetime. Returns None if the timestamp is invalid.
+
+    >>> msdosDatetime(0x3986652e)
+    datetime.datetime(2008, 12, 6, 12, 41, 28)
+    """
+    date = value >> 16
+    try:
+        return datetime(1980 + (date >> 9), (date >> 5) & 15, date & 31,
+                        (value >> 11) & 31, (value >> 5) & 63,
+                        2 * (value & 31))
+    except ValueError:
+        return None
+
+
+class ZipMember:
+    """
+    Entry of the central directory of a ZIP archive: see
+    ZipFile.getCentralDirectory(). Sizes and offsets are in bytes.
+    """
+    __slots__ = ("index", "filename", "flags", "compression", "last_mod",
+                 "crc32", "compressed_size", "uncompressed_size",
+                 "external_attr", "offset_header", "comment")
+
+    def getDatetime(self):
+        return msdosDatetime(self.last_mod)
+
+    def __repr__(self):
+        return "<ZipMember #%s %r>" % (self.index, self.filename)
+
+
+class ZipDirectory:
+    """
+    Central directory of a ZIP archive read as a compact table: members
+    (list of ZipMember) can be accessed by index or by name in O(1).
+    """
+
+    def __init__(self, members, comment):
+        self.members = members
+        self.comment = comment
+        self._names = {}
+        for member in members:
+            self._names.setdefault(member.filename, member)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __getitem__(self, index):
+        return self.members[index]
+
+    def __contains__(self, filename):
+        return filename in self._names
+
+    def getMember(self, filename):
+        """
+        Get a member by its filename: raise a KeyError if it doesn't exist
+        """
+        return self._names[filename]
+
+
+def _readZip64Extra(extra, member, need_size, need_compr, need_offset):
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, size = struct.unpack_from("<HH", extra, pos)
+        pos += 4
+        if field_id == 0x0001:
+            data = extra[pos:pos + size]
+            values = [struct.unpack_from("<Q", data, offset)[0]
+                      for offset in range(0, len(data) - 7, 8)]
+            if need_size and values:
+                member.uncompressed_size = values.pop(0)
+            if need_compr and values:
+                member.compressed_size = values.pop(0)
+            if need_offset and values:
+                member.offset_header = values.pop(0)
+            return
+        pos += size
+
+
+def readCentralDirectory(stream, size):
+    """
+    Read the central directory of a ZIP archive of size bits: locate the end
+    of central directory (and the ZIP64 locator) at the end of the stream,
+    and then parse the central directory without creating fields.
+
+    Returns a ZipDirectory, or None if the central directory is missing or
+    invalid.
+    """
+    size //= 8
+    tail_size = min(size, MAX_END_CENTRAL_DIRECTORY)
+    tail_start = size - tail_size
+    tail = stream.readBytes(tail_start * 8, tail_size)
+    pos = tail.rfind(b"PK\5\6")
+    while 0 <= pos:
+        if pos + END_CENTRAL_DIRECTORY.size <= len(tail):
+            comment_length = END_CENTRAL_DIRECTORY.unpack_from(tail, pos)[-1]
+            if pos + END_CENTRAL_DIRECTORY.size + comment_length <= len(tail):
+                break
+        pos = tail.rfind(b"PK\5\6", 0, pos)
+    else:
+        return None
+    end_address = tail_start + pos
+    (magic, disk, disk2, nentry_disk, nentry, cd_size, cd_offset,
+     comment_length) = END_CENTRAL_DIRECTORY.unpack_from(tail, pos)
+    start = pos + END_CENTRAL_DIRECTORY.size
+    comment = tail[start:start + comment_length]
+
+    # ZIP64 end of central directory locator
+    if ZIP64_LOCATOR.size <= end_address:
+        data = stream.readBytes((end_address - ZIP64_LOCATOR.size) * 8,
+                                ZIP64_LOCATOR.size)
+        magic, disk, offset, ndisk = ZIP64_LOCATOR.unpack(data)
+        if magic == b"PK\6\7":
+            # The offset is relative to the start of the archive: if data
+            # are prepended, the record is just before the locator
+            expected = (end_address - ZIP64_LOCATOR.size
+                        - ZIP64_END_CENTRAL_DIRECTORY.size)
+            for address in (offset, expected):
+                if not(0 <= address
+                       and address + ZIP64_END_CENTRAL_DIRECTORY.size <= size):
+                    continue
+                data = stream.readBytes(address * 8,
+                                        ZIP64_END_CENTRAL_DIRECTORY.size)
+                values = ZIP64_END_CENTRAL_DIRECTORY.unpack(data)
+                if values[0] == b"PK\6\6":
+                    nentry, cd_size, cd_offset = values[7:10]
+                    end_address = address
+                    break
+
+    # Data before the archive (ex: self-extracting archive)
+    base = end_address - cd_size - cd_offset
+    if base < 0 or size < base + cd_offset + cd_size:
+        return None
+    data = stream.readBytes((base + cd_offset) * 8, cd_size)
+
+    members = []
+    pos = 0
+    entry_size = CENTRAL_DIRECTORY_ENTRY.size
+    while pos + entry_size <= len(data) and len(members) < nentry:
+        values = CENTRAL_DIRECTORY_ENTRY.unpack_from(data, pos)
+        if values[0] != b"PK\1\2":
+            return None
+        (flags, compression, mod_time, mod_date, crc32, compressed_size,
+         uncompressed_size, filename_length, extra_length, comment_length,
+         disk_start, internal_attr, external_attr, offset_header) = values[5:]
+        pos += entry_size
+        member = ZipMember()
+        member.index = len(members)
+        filename = data[pos:pos + filename_length]
+        if flags & 0x800:
+            member.filename = filename.decode("UTF-8", "replace")
+        else:
+            member.filename = filename.decode("ISO-8859-15")
+        pos += filename_length
+        member.flags = flags
+        member.compression = compression
+        member.last_mod = (mod_date << 16) | mod_time
+        member.crc32 = crc32
+        member.compressed_size = compressed_size
+        member.uncompressed_size = uncompressed_size
+        member.external_attr = external_attr
+        member.offset_header = offset_header
+        if 0xFFFFFFFF in (compressed_size, uncompressed_size, offset_header):
+            _readZip64Extra(data[pos:pos + extra_length], member,
+                            uncompressed_size == 0xFFFFFFFF,
+                            compressed_size == 0xFFFFFFFF,
+                            offset_header == 0xFFFFFFFF)
+        member.offset_header += base
+        pos += extra_length
+        member.comment = data[pos:pos + comment_length]
+        pos += comment_length
+        members.append(member)
+    return ZipDirectory(members, comment)
+
+
 class ZipFile(Parser):
     endian = LITTLE_ENDIAN
     MIME_TYPES = {
@@ -437,6 +628,36 @@ class ZipFile(Parser):
                 raise ParserError(
                     "Error, unknown ZIP header (0x%08X)." % header)
 
+    def getCentralDirectory(self):
+        """
+        Get the central directory (ZipDirectory), read from the end of the
+        archive without parsing file entries. Returns None if the archive
+        has no valid central directory (ex: truncated archive).
+        """
+        try:
+            return self._directory
+        except AttributeError:
+            pass
+        try:
+            directory = readCentralDirectory(self.stream, self.size)
+        except (InputStreamError, struct.error):
+            directory = None
+        self._directory = directory
+        return directory
+
+    def getFileEntry(self, member):
+        """
+        Parse the local file header of a member of the central directory
+        (ZipMember): returns an orphan FileEntry field
+        """
+        header = self.stream.readBits((member.offset_header) * 8, 32,
+                                      LITTLE_ENDIAN)
+        if header != FileEntry.HEADER:
+            raise ParserError("ZIP: invalid local file header of %r"
+                              % member.filename)
+        return createOrphanField(self, (member.offset_header + 4) * 8,
+                                 FileEntry, "file[%u]" % member.index)
+
     def createMimeType(self):
         if self["file[0]/filename"].value == "mimetype":
             return makeUnicode(self["file[0]/data"].value)
@@ -179,6 +179,193 @@ class Frame(FieldSet):
         return "MPEG-%s %s" % (self["version"].display, ", ".join(info))
 
 
+# Number of samples per frame: (version, layer) => samples
+SAMPLES_PER_FRAME = {
+    (Frame.MPEG_I, Frame.LAYER_I): 384,
+    (Frame.MPEG_I, Frame.LAYER_II): 1152,
+    (Frame.MPEG_I, Frame.LAYER_III): 1152,
+    (Frame.MPEG_II, Frame.LAYER_I): 384,
+    (Frame.MPEG_II, Frame.LAYER_II): 1152,
+    (Frame.MPEG_II, Frame.LAYER_III): 576,
+    (Frame.MPEG_II_5, Frame.LAYER_I): 384,
+    (Frame.MPEG_II_5, Frame.LAYER_II): 1152,
+    (Frame.MPEG_II_5, Frame.LAYER_III): 576,
+}
+
+# Cache of decodeFrameHeader(): header >> 9 => result
+_frame_headers = {}
+
+
+def decodeFrameHeader(header):
+    """
+    Decode a 32-bit frame header (integer). Returns None if the header is
+    invalid, or a tuple: (frame size in bytes, bit rate in bit/sec,
+    sample rate in Hz, number of samples).
+
+    >>> decodeFrameHeader(0xfffb9064)
+    (417, 128000, 44100, 1152)
+    """
+    # Emphasis 2 is reserved
+    if header & 3 == 2:
+        return None
+    # Other bits after the padding bit don't change the frame size
+    key = header >> 9
+    try:
+        return _frame_headers[key]
+    except KeyError:
+        pass
+    result = None
+    version = (key >> 10) & 3
+    layer = (key >> 8) & 3
+    bit_rate = (key >> 3) & 15
+    rate = (key >> 1) & 3
+    padding = key & 1
+    if ((key >> 12) == 0x7ff and version != 1 and layer != 0
+            and bit_rate not in (0, 15) and rate != 3):
+        if version == Frame.MPEG_I:
+            bit_rate = Frame.BIT_RATES[1][3 - layer][bit_rate] * 1000
+        else:
+            bit_rate = Frame.BIT_RATES[2][3 - layer][bit_rate] * 1000
+        sample_rate = Frame.SAMPLING_RATES[version][rate]
+        if layer == Frame.LAYER_III:
+            if version == Frame.MPEG_I:
+                frame_size = (bit_rate * 144) // sample_rate + padding
+            else:
+                frame_size = (bit_rate * 72) // sample_rate + padding
+        elif layer == Frame.LAYER_II:
+            frame_size = (bit_rate * 144) // sample_rate + padding
+        else:
+            frame_size = ((bit_rate * 12) // sample_rate + padding) * 4
+        result = (frame_size, bit_rate, sample_rate,
+                  SAMPLES_PER_FRAME[version, layer])
+    _frame_headers[key] = result
+    return result
+
+
+def readVbrHeader(data, header):
+    """
+    Read the Xing/Info (LAME) or VBRI (Fraunhofer) header of the first frame
+    (data starts with the frame header). Returns None if there is no such
+    header, or a tuple (name, number of frames, number of bytes) where
+    the numbers are None if unknown.
+    """
+    version = (header >> 19) & 3
+    mono = ((header >> 6) & 3) == 3
+    if version == Frame.MPEG_I:
+        offset = 4 + (17 if mono else 32)
+    else:
+        offset = 4 + (9 if mono else 17)
+    name = data[offset:offset + 4]
+    if name in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[offset + 4:offset + 8], "big")
+        offset += 8
+        nframe = nbyte = None
+        if flags & 1:
+            nframe = int.from_bytes(data[offset:offset + 4], "big")
+            offset += 4
+        if flags & 2:
+            nbyte = int.from_bytes(data[offset:offset + 4], "big")
+        return (name.decode("ascii"), nframe, nbyte)
+    if data[36:40] == b"VBRI":
+        nbyte = int.from_bytes(data[46:50], "big")
+        nframe = int.from_bytes(data[50:54], "big")
+        return ("VBRI", nframe, nbyte)
+    return None
+
+
+class FrameScan:
+    """
+    Result of scanFrameHeaders():
+
+    - frame_count: number of frames
+    - bit_rates: histogram of the bit rates (bit/sec => number of frames)
+    - samples: number of samples
+    - sample_rate: sample rate in Hz (of the first frame)
+    - frames_size: size of the frames in bytes
+    - vbr_header: result of readVbrHeader() (None if missing)
+    - complete: True if all frames have been scanned up to the end
+    """
+
+    def __init__(self):
+        self.frame_count = 0
+        self.bit_rates = {}
+        self.samples = 0
+        self.sample_rate = None
+        self.frames_size = 0
+        self.vbr_header = None
+        self.complete = False
+
+    def getDuration(self):
+        """
+        Get the exact duration in seconds, or None if it is unknown
+        """
+        if self.vbr_header and self.vbr_header[1] and self.frame_count:
+            samples = self.samples // self.frame_count
+            return self.vbr_header[1] * samples / self.sample_rate
+        if self.complete and self.frame_count:
+            return self.samples / self.sample_rate
+        return None
+
+    def getBitRate(self):
+        """
+        Get the average bit rate in bit/sec, or None if it is unknown
+        """
+        if self.vbr_header and self.vbr_header[1] and self.vbr_header[2]:
+            duration = self.getDuration()
+            if duration:
+                return self.vbr_header[2] * 8 / duration
+        if not self.samples:
+            return None
+        return self.frames_size * 8 * self.sample_rate / self.samples
+
+
+def scanFrameHeaders(stream, address, size, max_frames=None,
+                     chunk_size=65536):
+    """
+    Scan the frame headers of the frames starting at address (in bits)
+    without creating fields: only the 4 bytes of each frame header are
+    decoded. The scan stops at the end (address + size), at the first
+    invalid header or after max_frames frames: in the last two cases,
+    the scan is not complete.
+
+    The first frame is skipped if it is a Xing/Info/VBRI header.
+    Returns a FrameScan object.
+    """
+    scan = FrameScan()
+    end = size // 8
+    pos = 0
+    data = b""
+    data_start = 0
+    while pos + 4 <= end:
+        if max_frames is not None and max_frames <= scan.frame_count:
+            return scan
+        offset = pos - data_start
+        if len(data) < offset + 4:
+            data_start = pos
+            offset = 0
+            data = stream.readBytes(address + pos * 8,
+                                    min(chunk_size, end - pos))
+        header = int.from_bytes(data[offset:offset + 4], "big")
+        info = decodeFrameHeader(header)
+        if info is None:
+            # Invalid data before the end
+            break
+        frame_size, bit_rate, sample_rate, samples = info
+        if not pos:
+            scan.sample_rate = sample_rate
+            scan.vbr_header = readVbrHeader(data[:frame_size], header)
+            if scan.vbr_header:
+                pos += frame_size
+                continue
+        scan.frame_count += 1
+        scan.samples += samples
+        scan.frames_size += min(frame_size, end - pos)
+        scan.bit_rates[bit_rate] = scan.bit_rates.get(bit_rate, 0) + 1
+        pos += frame_size
+    scan.complete = (end <= pos)
+    return scan
+
+
 def findSynchronizeBits(parser, start, max_size):
     """
     Find synchronisation bits (11 bits set to 1)
@@ -5,7 +5,7 @@
 #
 
 from hachoir.parser import Parser
-from hachoir.field import (FieldSet, Link,
+from hachoir.field import (FieldSet, Link, createOrphanField,
                            MissingField, ParserError,
                            Enum as _Enum, String as _String,
                            Float32, Float64,
@@ -16,6 +16,7 @@ from hachoir.core.iso639 import ISO639_2
 from hachoir.core.tools import humanDatetime
 from hachoir.core.text_handler import textHandler, hexadecimal
 from hachoir.parser.container.ogg import XiphInt
+from bisect import bisect_left
 from datetime import datetime, timedelta
 import collections
 
@@ -591,6 +592,331 @@ class EBML(FieldSet):
                     yield EBML(self, val)
 
 
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+CLUSTER = 0x1F43B675
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+
+# Maximum size in bytes of a SeekHead or Cues element read by SegmentIndex
+MAX_INDEX_SIZE = 16 << 20
+
+
+def readVarInt(data, pos, keep_marker=False):
+    """
+    Decode the EBML variable size integer of data at pos: return
+    (value, length). The marker bit is kept for element identifiers.
+    value is None if all bits are set (unknown size).
+
+    >>> readVarInt(b"\\x81", 0)
+    (1, 1)
+    >>> readVarInt(b"\\x1a\\x45\\xdf\\xa3", 0, True)
+    (440786851, 4)
+    >>> readVarInt(b"\\x01\\xff\\xff\\xff\\xff\\xff\\xff\\xff", 0)
+    (None, 8)
+    """
+    if len(data) <= pos or not data[pos]:
+        raise ParserError("Invalid EBML integer")
+    length = 9 - data[pos].bit_length()
+    if len(data) < pos + length:
+        raise ParserError("Truncated EBML integer")
+    value = int.from_bytes(data[pos:pos + length], "big")
+    if not keep_marker:
+        marker = 1 << (7 * length)
+        value -= marker
+        if value == marker - 1:
+            value = None
+    return value, length
+
+
+def iterElements(data):
+    """
+    Generate (id, value) of the EBML elements of data (bytes)
+    """
+    pos = 0
+    while pos < len(data):
+        id, length = readVarInt(data, pos, True)
+        pos += length
+        size, length = readVarInt(data, pos)
+        pos += length
+        if size is None:
+            raise ParserError("Unknown length of a child element")
+        yield id, data[pos:pos + size]
+        pos += size
+
+
+class SegmentIndex:
+    """
+    Index of the top-level elements of a Matroska segment, built from the
+    SeekHead elements. Without SeekHead, elements are located by skipping
+    them using their size. Clusters are never parsed: they are only
+    located, on demand.
+
+    Positions are in bytes, relative to the start of the segment data (as
+    in SeekPosition and CueClusterPosition).
+    """
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.stream = segment.stream
+        size = segment["size"]
+        self.data_address = size.address + size.size
+        if size.value is not None:
+            self.end = size.value
+        elif segment.parent._size is not None:
+            self.end = (segment.parent._size - segment.address
+                        - self.data_address) // 8
+        else:
+            self.end = None
+        self.positions = {}
+        self.fields = {}
+        self.seek_heads = set()
+        self.first_cluster = None
+        self._cues = None
+        self._clusters = []       # positions of the clusters read so far
+        self._cluster_scan = None
+        self._build()
+
+    def readHeader(self, position):
+        """
+        Read the header of the element at position: return (id, size,
+        header size), size is None if unknown. Return None at the end
+        of the segment.
+        """
+        if self.end is not None and self.end <= position:
+            return None
+        address = self.segment.absolute_address + self.data_address \
+            + position * 8
+        size = 12
+        if self.end is not None:
+            size = min(size, self.end - position)
+        if self.stream.size is not None:
+            size = min(size, (self.stream.size - address) // 8)
+        if size <= 0:
+            return None
+        data = self.stream.read(address, size * 8)[1]
+        id, id_length = readVarInt(data, 0, True)
+        size, size_length = readVarInt(data, id_length)
+        return id, size, id_length + size_length
+
+    def _readHeader(self, position):
+        header = self.readHeader(position)
+        if header is None:
+            raise ParserError("MKV: no element at %s (end of the segment)"
+                              % position)
+        return header
+
+    def readElement(self, position):
+        """
+        Read the value (bytes) of the element at position
+        """
+        id, size, header_size = self._readHeader(position)
+        if size is None or MAX_INDEX_SIZE < size:
+            raise ParserError("MKV: element at %s is too big to be indexed"
+                              % position)
+        address = self.segment.absolute_address + self.data_address \
+            + (position + header_size) * 8
+        if self.stream.size is not None \
+                and self.stream.size < address + size * 8:
+            raise ParserError("MKV: element at %s is truncated" % position)
+        return self.stream.readBytes(address, size)
+
+    def _add(self, id, position):
+        positions = self.positions.setdefault(id, [])
+        if position not in positions:
+            positions.append(position)
+            positions.sort()
+
+    def _readSeekHead(self, position):
+        pending = [position]
+        while pending:
+            position = pending.pop()
+            if position in self.seek_heads:
+                continue
+            self.seek_heads.add(position)
+            self._add(SEEK_HEAD, position)
+            for id, value in iterElements(self.readElement(position)):
+                if id != SEEK:
+                    continue
+                seek = dict(iterElements(value))
+                if SEEK_ID not in seek or SEEK_POSITION not in seek:
+                    continue
+                seek_id = int.from_bytes(seek[SEEK_ID], "big")
+                seek_position = int.from_bytes(seek[SEEK_POSITION], "big")
+                if seek_id == SEEK_HEAD:
+                    pending.append(seek_position)
+                elif seek_id == CLUSTER:
+                    self._setFirstCluster(seek_position)
+                else:
+                    self._add(seek_id, seek_position)
+
+    def _setFirstCluster(self, position):
+        if self.first_cluster is None or position < self.first_cluster:
+            self.first_cluster = position
+
+    def _build(self):
+        # Read the elements before the first cluster: usually SeekHead,
+        # Info and Tracks. Without SeekHead, skip clusters to find the
+        # elements stored after them.
+        position = 0
+        while True:
+            header = self.readHeader(position)
+            if header is None:
+                break
+            id, size, header_size = header
+            if id == SEEK_HEAD:
+                self._readSeekHead(position)
+            elif id == CLUSTER:
+                self._setFirstCluster(position)
+                if self.seek_heads:
+                    break
+            else:
+                self._add(id, position)
+            if size is None:
+                break
+            position += header_size + size
+
+    def getPositions(self, id):
+        """
+        Get the positions of the elements with the identifier id
+        """
+        return self.positions.get(id, ())
+
+    def getIndex(self, id, position):
+        """
+        Get the index of the element at position among the elements
+        with the identifier id, as in the field names of the segment
+        (ex: 3 for the 4th cluster)
+        """
+        if id == CLUSTER:
+            while not self._clusters or self._clusters[-1] < position:
+                if not self._readClusterPosition():
+                    break
+            positions = self._clusters
+        else:
+            positions = self.getPositions(id)
+        return bisect_left(positions, position)
+
+    def getElement(self, position):
+        """
+        Get the element at position: orphan field of the segment,
+        parsed on demand
+        """
+        try:
+            return self.fields[position]
+        except KeyError:
+            pass
+        id = self._readHeader(position)[0]
+        field = createOrphanField(self.segment,
+                                  self.data_address + position * 8,
+                                  EBML, segment)
+        field._name = field._name.replace(
+            "[]", "[%u]" % self.getIndex(id, position))
+        self.fields[position] = field
+        return field
+
+    def getElements(self, *names):
+        """
+        Get the elements named names (ex: "Info", "Tags") sorted by
+        position: list of orphan fields.
+        """
+        positions = []
+        for name in names:
+            positions.extend(self.getPositions(SEGMENT_IDS[name]))
+        return [self.getElement(position) for position in sorted(positions)]
+
+    def _scanClusters(self):
+        position = self.first_cluster
+        if position is None:
+            cues = self.getCues()
+            if not cues:
+                return
+            position = min(cue[2] for cue in cues)
+        while True:
+            header = self.readHeader(position)
+            if header is None:
+                break
+            id, size, header_size = header
+            if id == CLUSTER:
+                yield position
+            elif id not in SEGMENT_NAMES and id not in (0xBF, 0xEC):
+                break
+            if size is None:
+                break
+            position += header_size + size
+
+    def _readClusterPosition(self):
+        """
+        Read the position of the next cluster: return False if there is
+        no more cluster
+        """
+        if self._cluster_scan is None:
+            self._cluster_scan = self._scanClusters()
+        for position in self._cluster_scan:
+            self._clusters.append(position)
+            return True
+        return False
+
+    def iterClusterPositions(self):
+        """
+        Generate the positions of the clusters: only the header of
+        each cluster is read.
+        """
+        index = 0
+        while index < len(self._clusters) or self._readClusterPosition():
+            yield self._clusters[index]
+            index += 1
+
+    def iterClusters(self):
+        """
+        Generate the clusters: orphan fields parsed on demand
+        """
+        for position in self.iterClusterPositions():
+            yield self.getElement(position)
+
+    def getCues(self):
+        """
+        Get the cue points: list of (time, track, cluster position) sorted
+        by time, read without creating fields. The time is in TimecodeScale
+        units.
+        """
+        if self._cues is not None:
+            return self._cues
+        cues = []
+        for position in self.getPositions(CUES):
+            for id, value in iterElements(self.readElement(position)):
+                if id != CUE_POINT:
+                    continue
+                time = None
+                tracks = []
+                for child_id, child in iterElements(value):
+                    if child_id == CUE_TIME:
+                        time = int.from_bytes(child, "big")
+                    elif child_id == CUE_TRACK_POSITIONS:
+                        tracks.append(dict(iterElements(child)))
+                if time is None:
+                    continue
+                for track in tracks:
+                    if CUE_CLUSTER_POSITION not in track:
+                        continue
+                    cues.append(
+                        (time, int.from_bytes(track.get(CUE_TRACK, b""), "big"),
+                         int.from_bytes(track[CUE_CLUSTER_POSITION], "big")))
+        cues.sort()
+        self._cues = cues
+        return cues
+
+
+SEGMENT_NAMES = {id: value[0].rstrip("[]") for id, value in segment.items()}
+SEGMENT_IDS = {name: id for id, name in SEGMENT_NAMES.items()}
+
+
 class MkvFile(Parser):
     EBML_SIGNATURE = 0x1A45DFA3
     PARSER_TAGS = {
@@ -631,6 +957,23 @@ class MkvFile(Parser):
         while not self.eof:
             yield EBML(self, {0x18538067: ('Segment[]', segment)})
 
+    def getSegmentIndex(self, segment):
+        """
+        Get the index of a segment (SegmentIndex) to access its top-level
+        elements without parsing the clusters
+        """
+        try:
+            indexes = self._segment_indexes
+        except AttributeError:
+            indexes = self._segment_indexes = {}
+        try:
+            return indexes[segment.address]
+        except KeyError:
+            pass
+        index = SegmentIndex(segment)
+        indexes[segment.address] = index
+        return index
+
     def createContentSize(self):
         field = self["Segment[0]/size"]
         return field.absolute_address + field.value * 8 + field.size
@@ -16,11 +16,14 @@ from hachoir.parser import HachoirParser, Parser
 from hachoir.field import (RootSeekableFieldSet, SeekableFieldSet, FieldSet, ParserError,
                            Bit, Bits, UInt8, UInt16, UInt32,
                            Enum, String, TimestampUnix32, RawBytes,
-                           NullBytes, PaddingBits, PaddingBytes, FragmentGroup, CustomFragment)
+                           NullBytes, PaddingBits, PaddingBytes, FragmentGroup, CustomFragment,
+                           createOrphanField)
 from hachoir.core.tools import (humanDuration, humanFilesize)
 from hachoir.core.endian import LITTLE_ENDIAN
 from hachoir.core.text_handler import textHandler
+from hachoir.stream import ExtentStream
 from .linux_swap import UUID
+import struct
 
 
 class DirectoryEntry(FieldSet):
@@ -197,11 +200,14 @@ class Inode(FieldSet):
         6: "Undelete directory",
         8: "EXT3 journal"
     }
-    static_size = (68 + 15 * 4) * 8
 
     def __init__(self, parent, name, index):
         FieldSet.__init__(self, parent, name, None)
         self.uniq_id = 1 + index
+        inode_size = self["/superblock/inode_size"].value
+        if inode_size == 0:
+            inode_size = 128
+        self._size = inode_size * 8
 
     def createDescription(self):
         desc = "Inode %s: " % self.uniq_id
@@ -293,6 +299,15 @@ class Inode(FieldSet):
         else:
             yield RawBytes(self, "raw", 12, "Reserved")
 
+        # Large inode (ext4)
+        size = (self.size - self.current_size) // 8
+        if 4 <= size:
+            yield UInt16(self, "extra_isize", "Size of the extra inode fields")
+            yield UInt16(self, "checksum_hi", "High 16 bits of the inode checksum")
+            size -= 4
+        if size:
+            yield RawBytes(self, "extra", size, "Extra inode fields and extended attributes")
+
 
 class Directory(Parser):
     PARSER_TAGS = {}
@@ -340,12 +355,21 @@ class GroupDescriptorFlags(Flags):
         yield PaddingBits(self, "reserved[]", 13)
 
 
+def getDescriptorSize(superblock):
+    """
+    Get the size of a group descriptor in bytes
+    """
+    if superblock["feature_incompat/64bit"].value:
+        return max(superblock["desc_size"].value, 32)
+    return 32
+
+
 class GroupDescriptor(FieldSet):
-    static_size = 32 * 8
 
     def __init__(self, parent, name, index):
         FieldSet.__init__(self, parent, name)
         self.uniq_id = index
+        self._size = getDescriptorSize(self["/superblock"]) * 8
 
     def createDescription(self):
         blocks_per_group = self["/superblock/blocks_per_group"].value
@@ -366,6 +390,21 @@ class GroupDescriptor(FieldSet):
         yield UInt16(self, "inode_bitmap_csum", "Inode bitmap checksum")
         yield UInt16(self, "itable_unused", "Number of unused inodes")
         yield UInt16(self, "checksum", "Group descriptor checksum")
+        if self.size == 32 * 8:
+            return
+        yield UInt32(self, "block_bitmap_hi", "High 32 bits of the block bitmap index")
+        yield UInt32(self, "inode_bitmap_hi", "High 32 bits of the inode bitmap index")
+        yield UInt32(self, "inode_table_hi", "High 32 bits of the inode table index")
+        yield UInt16(self, "free_blocks_count_hi", "High 16 bits of the number of free blocks")
+        yield UInt16(self, "free_inodes_count_hi", "High 16 bits of the number of free inodes")
+        yield UInt16(self, "used_dirs_count_hi", "High 16 bits of the number of directories")
+        yield UInt16(self, "itable_unused_hi", "High 16 bits of the number of unused inodes")
+        yield UInt32(self, "exclude_bitmap_hi", "High 32 bits of the snapshot exclusion bitmap index")
+        yield UInt16(self, "block_bitmap_csum_hi", "High 16 bits of the block bitmap checksum")
+        yield UInt16(self, "inode_bitmap_csum_hi", "High 16 bits of the inode bitmap checksum")
+        size = (self.size - self.current_size) // 8
+        if size:
+            yield PaddingBytes(self, "reserved", size)
 
 
 class FeatureCompatFlags(Flags):
@@ -663,6 +702,9 @@ class Group(SeekableFieldSet):
                 continue
             if inode['blocks'].value == 0:
                 continue
+            if "block[0]" not in inode:
+                # Extents or inline data: see ExtFileSystem.getExtents()
+                continue
             blocks = inode.array('block')
             if inode['mode/file_type'].display == 'Directory':
                 parser = Directory
@@ -694,6 +736,298 @@ class Group(SeekableFieldSet):
                 pass
 
 
+ROOT_INODE = 2
+
+# Inode flags
+EXTENTS_FL = 0x00080000
+INLINE_DATA_FL = 0x10000000
+
+EXTENT_MAGIC = 0xF30A
+MAX_EXTENT_DEPTH = 5
+
+
+class ExtInode:
+    """
+    Inode read by ExtFileSystem: number, offset (in bytes), mode, size
+    (in bytes), flags, links_count and block (content of the i_block
+    area: block map, extent tree, inline data or symbolic link target).
+    """
+    __slots__ = ("number", "offset", "mode", "size", "flags",
+                 "links_count", "block")
+
+    S_IFMT = 0o170000
+    S_IFDIR = 0o040000
+    S_IFREG = 0o100000
+    S_IFLNK = 0o120000
+
+    def __init__(self, number, offset, data):
+        self.number = number
+        self.offset = offset
+        self.mode, size, self.links_count, self.flags = struct.unpack_from(
+            "<H2xL18xH4xL", data)
+        self.block = data[40:100]
+        size_high = struct.unpack_from("<L", data, 108)[0]
+        self.size = size + (size_high << 32)
+
+    def isDirectory(self):
+        return self.mode & self.S_IFMT == self.S_IFDIR
+
+    def isRegular(self):
+        return self.mode & self.S_IFMT == self.S_IFREG
+
+    def isSymlink(self):
+        return self.mode & self.S_IFMT == self.S_IFLNK
+
+    def __repr__(self):
+        return "<ExtInode %s: mode=%o size=%s>" % (
+            self.number, self.mode, self.size)
+
+
+class ExtFileSystem:
+    """
+    Random access to the files of an ext2, ext3 or ext4 file system,
+    without parsing the groups:
+
+        fs = parser.getFileSystem()
+        inode = fs.lookup("/var/log/syslog")
+        data = fs.readFile(inode)
+
+    Inodes are located using the superblock and the group descriptor
+    table (read by block and cached), file blocks using the block map
+    or the extent tree of the inode. Only the blocks needed are read.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.stream = parser.stream
+        superblock = parser["superblock"]
+        self.block_size = 1024 << superblock["log_block_size"].value
+        self.inodes_count = superblock["inodes_count"].value
+        self.inodes_per_group = superblock["inodes_per_group"].value
+        self.inode_size = superblock["inode_size"].value or 128
+        self.desc_size = getDescriptorSize(superblock)
+        self.group_count = superblock.group_count
+        # The group descriptor table follows the superblock
+        self.table_block = superblock["first_data_block"].value + 1
+        self._descriptors = {}
+
+    def readBytes(self, offset, size):
+        return self.stream.readBytes(offset * 8, size)
+
+    def _readDescriptors(self, block):
+        count = self.block_size // self.desc_size
+        data = self.readBytes((self.table_block + block) * self.block_size,
+                              self.block_size)
+        tables = []
+        for index in range(count):
+            pos = index * self.desc_size
+            table = struct.unpack_from("<L", data, pos + 8)[0]
+            if 0x2C <= self.desc_size:
+                table += struct.unpack_from("<L", data, pos + 0x28)[0] << 32
+            tables.append(table)
+        return tables
+
+    def getInodeTable(self, group):
+        """
+        Get the first block of the inode table of a group
+        """
+        if not(0 <= group < self.group_count):
+            raise ParserError("Invalid group number: %s" % group)
+        count = self.block_size // self.desc_size
+        block, index = divmod(group, count)
+        if block not in self._descriptors:
+            self._descriptors[block] = self._readDescriptors(block)
+        return self._descriptors[block][index]
+
+    def getInodeOffset(self, number):
+        """
+        Get the offset in bytes of the inode number
+        """
+        if not(1 <= number <= self.inodes_count):
+            raise ParserError("Invalid inode number: %s" % number)
+        group, index = divmod(number - 1, self.inodes_per_group)
+        return (self.getInodeTable(group) * self.block_size
+                + index * self.inode_size)
+
+    def getInode(self, number):
+        """
+        Read the inode number (ExtInode)
+        """
+        offset = self.getInodeOffset(number)
+        return ExtInode(number, offset, self.readBytes(offset, 128))
+
+    def getInodeField(self, number):
+        """
+        Create the field of the inode number (Inode field)
+        """
+        offset = self.getInodeOffset(number)
+        return createOrphanField(self.parser, offset * 8, Inode,
+                                 "inode[%u]" % (number - 1), number - 1)
+
+    def _readBlockMap(self, pointers, level, logical, count, extents):
+        # Add the (logical block, physical block, length) extents of a list
+        # of block pointers, level is the level of indirection
+        span = (self.block_size // 4) ** level
+        for pointer in pointers:
+            if count <= logical:
+                break
+            if pointer:
+                if level:
+                    data = self.readBytes(pointer * self.block_size,
+                                          self.block_size)
+                    children = struct.unpack("<%uL" % (self.block_size // 4), data)
+                    self._readBlockMap(children, level - 1, logical,
+                                       count, extents)
+                elif extents and extents[-1][0] + extents[-1][2] == logical \
+                        and extents[-1][1] + extents[-1][2] == pointer:
+                    start, physical, length = extents[-1]
+                    extents[-1] = (start, physical, length + 1)
+                else:
+                    extents.append((logical, pointer, 1))
+            logical += span
+
+    def _readExtentNode(self, data, depth, extents):
+        magic, entries, max_entries, node_depth = struct.unpack_from("<4H", data)
+        if magic != EXTENT_MAGIC:
+            raise ParserError("Invalid extent node magic: 0x%04x" % magic)
+        if node_depth != depth:
+            raise ParserError("Invalid extent tree depth")
+        for index in range(entries):
+            pos = 12 + index * 12
+            if depth:
+                leaf_lo, leaf_hi = struct.unpack_from("<LH", data, pos + 4)
+                child = self.readBytes(
+                    ((leaf_hi << 32) + leaf_lo) * self.block_size,
+                    self.block_size)
+                self._readExtentNode(child, depth - 1, extents)
+            else:
+                logical, length, start_hi, start_lo = struct.unpack_from(
+                    "<LHHL", data, pos)
+                if 32768 < length:
+                    # Uninitialized extent: read as null bytes
+                    length -= 32768
+                    physical = None
+                else:
+                    physical = (start_hi << 32) + start_lo
+                extents.append((logical, physical, length))
+
+    def getBlocks(self, inode):
+        """
+        Get the blocks of an inode: list of (logical block, physical block,
+        length in blocks) tuples sorted by logical block. physical is None
+        for uninitialized blocks.
+        """
+        if inode.flags & INLINE_DATA_FL:
+            return []
+        if inode.isSymlink() and inode.size < 60:
+            # Fast symbolic link: target stored in the inode
+            return []
+        extents = []
+        if inode.flags & EXTENTS_FL:
+            depth = struct.unpack_from("<H", inode.block, 6)[0]
+            if MAX_EXTENT_DEPTH < depth:
+                raise ParserError("Extent tree is too deep")
+            self._readExtentNode(inode.block, depth, extents)
+            extents.sort()
+        else:
+            count = (inode.size + self.block_size - 1) // self.block_size
+            pointers = struct.unpack("<15L", inode.block)
+            self._readBlockMap(pointers[:12], 0, 0, count, extents)
+            logical = 12
+            for level in range(1, 4):
+                self._readBlockMap(pointers[11 + level:12 + level], level,
+                                   logical, count, extents)
+                logical += (self.block_size // 4) ** level
+        return extents
+
+    def getExtents(self, inode):
+        """
+        Get the content of an inode as a list of (offset, size) in bytes,
+        offset is None for holes (see ExtentStream)
+        """
+        if inode.flags & INLINE_DATA_FL \
+                or (inode.isSymlink() and inode.size < 60):
+            return [(inode.offset + 40, min(inode.size, 60))]
+        result = []
+        position = 0
+        for logical, physical, length in self.getBlocks(inode):
+            start = logical * self.block_size
+            if inode.size <= start:
+                break
+            if position < start:
+                result.append((None, start - position))
+            length = min(length * self.block_size, inode.size - start)
+            if physical is not None:
+                physical *= self.block_size
+            result.append((physical, length))
+            position = start + length
+        if position < inode.size:
+            result.append((None, inode.size - position))
+        return result
+
+    def openFile(self, inode):
+        """
+        Open the content of an inode: ExtentStream which only reads the
+        blocks of the file. Raise a NullStreamError for an empty file.
+        """
+        return ExtentStream(self.stream, self.getExtents(inode), inode.size,
+                            source="%s:inode%s" % (self.stream.source,
+                                                   inode.number))
+
+    def readFile(self, inode):
+        """
+        Read the content of an inode (bytes)
+        """
+        if not inode.size:
+            return b""
+        return self.openFile(inode).readBytes(0, inode.size)
+
+    def readLink(self, inode):
+        """
+        Read the target of a symbolic link (str)
+        """
+        return self.readFile(inode).decode("utf-8", "surrogateescape")
+
+    def iterDirectory(self, inode):
+        """
+        Iterate on the entries of a directory: (name, inode number,
+        file type) tuples, name is a str
+        """
+        if not inode.isDirectory():
+            raise ParserError("Inode %s is not a directory" % inode.number)
+        data = self.readFile(inode)
+        pos = 0
+        while pos + 8 <= len(data):
+            number, rec_len, name_len, file_type = struct.unpack_from(
+                "<LHBB", data, pos)
+            if rec_len < 8:
+                raise ParserError("Invalid directory entry length")
+            if number:
+                name = data[pos + 8:pos + 8 + name_len]
+                yield (name.decode("utf-8", "surrogateescape"),
+                       number, file_type)
+            pos += rec_len
+
+    def lookup(self, path, inode=None):
+        """
+        Get the inode (ExtInode) of a path. Relative paths are relative to
+        inode (default: root directory). Raise a KeyError if a file does
+        not exist. Symbolic links are not followed.
+        """
+        if inode is None or path.startswith("/"):
+            inode = self.getInode(ROOT_INODE)
+        for name in path.split("/"):
+            if name in ("", "."):
+                continue
+            for entry_name, number, file_type in self.iterDirectory(inode):
+                if entry_name == name:
+                    inode = self.getInode(number)
+                    break
+            else:
+                raise KeyError("No such file: %s" % path)
+        return inode
+
+
 class EXT2_FS(HachoirParser, RootSeekableFieldSet):
     """
     Parse an EXT2 or EXT3 partition.
@@ -731,7 +1065,10 @@ class EXT2_FS(HachoirParser, RootSeekableFieldSet):
             return "Invalid magic number"
         if not(0 <= self["superblock/log_block_size"].value <= 2):
             return "Invalid (log) block size"
-        if self["superblock/inode_size"].value not in (0, 128):
+        inode_size = self["superblock/inode_size"].value
+        block_size = 1024 << self["superblock/log_block_size"].value
+        if inode_size and (inode_size < 128 or inode_size & (inode_size - 1)
+                           or block_size < inode_size):
             return "Unsupported inode size"
         return True
 
@@ -762,6 +1099,17 @@ class EXT2_FS(HachoirParser, RootSeekableFieldSet):
     def seekBlock(self, block):
         self.seekBit(block * self.block_size * 8)
 
+    def getFileSystem(self):
+        """
+        Get the file system accessor (ExtFileSystem)
+        """
+        try:
+            return self._file_system
+        except AttributeError:
+            pass
+        self._file_system = ExtFileSystem(self)
+        return self._file_system
+
     def getSuperblock(self):
         # FIXME: Use superblock copy if main superblock is invalid
         return self["superblock"]
@@ -2,14 +2,19 @@ from hachoir.parser import Parser
 from hachoir.field import (FieldSet, StaticFieldSet,
                            RawBytes, PaddingBytes, createPaddingField, Link, Fragment,
                            Bit, Bits, UInt8, UInt16, UInt32,
-                           String, Bytes, NullBytes)
+                           String, Bytes, NullBytes, ParserError)
 from hachoir.field.integer import GenericInteger
 from hachoir.core.endian import LITTLE_ENDIAN
 from hachoir.core.text_handler import textHandler, hexadecimal
 from hachoir.core.error import error
 from hachoir.core.tools import humanFilesize, makePrintable
+from hachoir.stream import ExtentStream
+from array import array
+from collections import OrderedDict
 import datetime
 import re
+import struct
+import sys
 
 strip_index = re.compile(r'\[[^]]+]$')
 
@@ -325,6 +330,378 @@ class InodeGen:
         return field
 
 
+# Number of cluster chains cached by FatTable
+CHAIN_CACHE_SIZE = 256
+
+
+class FatTable:
+    """
+    File allocation table decoded once into an array of integers
+    (12, 16 or 32-bit entries): table[cluster] is the next cluster.
+
+    Cluster chains are coalesced into runs of contiguous clusters,
+    the runs of the last CHAIN_CACHE_SIZE chains are cached.
+    """
+    END_OF_CHAIN = {12: 0xFF8, 16: 0xFFF8, 32: 0x0FFFFFF8}
+
+    def __init__(self, version, data, count=None):
+        if version == 12:
+            if count is None:
+                count = len(data) * 2 // 3
+            entries = array("H", bytes(count * 2))
+            for index in range(count):
+                pos = index + index // 2
+                value = data[pos] | (data[pos + 1] << 8)
+                if index & 1:
+                    value >>= 4
+                entries[index] = value & 0xFFF
+        else:
+            entries = array("H" if version == 16 else "I")
+            if count is None:
+                count = len(data) // entries.itemsize
+            entries.frombytes(data[:count * entries.itemsize])
+            if sys.byteorder == "big":
+                entries.byteswap()
+        self.version = version
+        self.entries = entries
+        self.end_of_chain = self.END_OF_CHAIN[version]
+        if version == 32:
+            # The high 4 bits of FAT32 entries are reserved
+            self.mask = 0x0FFFFFFF
+        else:
+            self.mask = self.end_of_chain | 0xF
+        self._chains = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, cluster):
+        return self.entries[cluster] & self.mask
+
+    def getRuns(self, cluster):
+        """
+        Get the chain starting at cluster as runs of contiguous clusters:
+        tuple of (first cluster, number of clusters). Return an empty tuple
+        if cluster is not a valid first cluster.
+        """
+        try:
+            runs = self._chains[cluster]
+        except KeyError:
+            pass
+        else:
+            self._chains.move_to_end(cluster)
+            return runs
+
+        start = cluster
+        entries = self.entries
+        mask = self.mask
+        count = len(entries)
+        runs = []
+        if 2 <= cluster < count:
+            first = cluster
+            length = 1
+            for step in range(count):
+                next = entries[cluster] & mask
+                if self.end_of_chain <= next:
+                    break
+                if not (2 <= next < count):
+                    raise ParserError("Invalid cluster %u in the chain of "
+                                      "cluster %u" % (next, start))
+                if next == cluster + 1:
+                    length += 1
+                else:
+                    runs.append((first, length))
+                    first = next
+                    length = 1
+                cluster = next
+            else:
+                raise ParserError("Loop in a cluster chain")
+            runs.append((first, length))
+        runs = tuple(runs)
+
+        self._chains[start] = runs
+        while CHAIN_CACHE_SIZE < len(self._chains):
+            self._chains.popitem(last=False)
+        return runs
+
+    def getChain(self, cluster):
+        """
+        Get the list of the clusters of the chain starting at cluster
+        """
+        return [first + index
+                for first, length in self.getRuns(cluster)
+                for index in range(length)]
+
+
+class FatDirEntry:
+    """
+    Directory entry read by FatFileSystem: name (long file name, or short
+    name if the file has no long name), short_name, attr (attribute flags),
+    cluster (first cluster), size (in bytes) and offset of the entry
+    (in bytes).
+    """
+    __slots__ = ("name", "short_name", "attr", "cluster", "size", "offset")
+
+    READ_ONLY = 0x01
+    HIDDEN = 0x02
+    SYSTEM = 0x04
+    VOLUME_LABEL = 0x08
+    DIRECTORY = 0x10
+    ARCHIVE = 0x20
+    LONG_NAME = 0x0F
+
+    def __init__(self, name, short_name, attr, cluster, size, offset):
+        self.name = name
+        self.short_name = short_name
+        self.attr = attr
+        self.cluster = cluster
+        self.size = size
+        self.offset = offset
+
+    def isDirectory(self):
+        return bool(self.attr & self.DIRECTORY)
+
+    def __repr__(self):
+        return "<FatDirEntry %r: cluster=%s size=%s>" % (
+            self.name, self.cluster, self.size)
+
+
+def shortNameChecksum(name):
+    checksum = 0
+    for byte in name:
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + byte) & 0xFF
+    return checksum
+
+
+def parseShortName(raw, case_flags):
+    # case_flags: Windows NT flags, 0x08: lower case name, 0x10: lower
+    # case extension
+    if raw[0] == 0x05:
+        raw = b"\xE5" + raw[1:]
+    name = raw[:8].decode("cp437").rstrip(" ")
+    ext = raw[8:11].decode("cp437").rstrip(" ")
+    if case_flags & 0x08:
+        name = name.lower()
+    if case_flags & 0x10:
+        ext = ext.lower()
+    if ext:
+        name += "." + ext
+    return name
+
+
+class FatFileSystem:
+    """
+    Random access to the files of a FAT12, FAT16 or FAT32 file system,
+    without creating the fields of the FAT and of the directories:
+
+        fs = parser.getFileSystem()
+        for path, entry in fs.walk():
+            if not entry.isDirectory():
+                data = fs.readFile(entry)
+
+    The first FAT is read and decoded once (see FatTable), file contents
+    are read using the runs of contiguous clusters of their chain.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.stream = parser.stream
+        self.version = parser.version
+        boot = parser["boot"]
+        self.sector_size = boot["sector_size"].value
+        self.cluster_size = boot["cluster_size"].value * self.sector_size
+        if not self.cluster_size:
+            raise ParserError("Invalid cluster size")
+        fat_size = boot["fat_size"].value
+        if not fat_size and "fat32_size" in boot:
+            fat_size = boot["fat32_size"].value
+        self.fat_offset = boot["reserved_sectors"].value * self.sector_size
+        self.fat_size = fat_size * self.sector_size
+        self.root_offset = self.fat_offset + boot["fat_nb"].value * self.fat_size
+        self.root_size = boot["max_root"].value * 32
+        root_sectors = (self.root_size + self.sector_size - 1) // self.sector_size
+        self.data_offset = self.root_offset + root_sectors * self.sector_size
+        sectors = boot["sectors1"].value or boot["sectors2"].value
+        data_sectors = sectors - self.data_offset // self.sector_size
+        self.cluster_count = max(data_sectors, 0) // boot["cluster_size"].value
+        if "root_start" in boot:
+            self.root_cluster = boot["root_start"].value
+        else:
+            self.root_cluster = 0
+        self._table = None
+
+    def readBytes(self, offset, size):
+        return self.stream.readBytes(offset * 8, size)
+
+    def getTable(self):
+        """
+        Get the first FAT decoded (FatTable)
+        """
+        if self._table is None:
+            count = min(self.cluster_count + 2,
+                        self.fat_size * 8 // self.version)
+            size = (count * self.version + 7) // 8
+            if self.version == 12:
+                size += 1
+            size = min(size, self.fat_size,
+                       self.stream.size // 8 - self.fat_offset)
+            self._table = FatTable(self.version,
+                                   self.readBytes(self.fat_offset, size),
+                                   count)
+        return self._table
+
+    def getClusterOffset(self, cluster):
+        """
+        Get the offset in bytes of a data cluster
+        """
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def getRoot(self):
+        """
+        Get the root directory (FatDirEntry)
+        """
+        return FatDirEntry("", "", FatDirEntry.DIRECTORY,
+                           self.root_cluster, 0, None)
+
+    def getExtents(self, entry):
+        """
+        Get the content of a file or a directory as a list of
+        (offset, size) in bytes (see ExtentStream)
+        """
+        if entry.isDirectory() and not entry.cluster:
+            # Root directory of FAT12 and FAT16
+            return [(self.root_offset, self.root_size)]
+        if entry.isDirectory():
+            size = None
+        else:
+            size = entry.size
+        extents = []
+        for first, length in self.getTable().getRuns(entry.cluster):
+            length *= self.cluster_size
+            if size is not None:
+                if size <= 0:
+                    break
+                length = min(length, size)
+                size -= length
+            extents.append((self.getClusterOffset(first), length))
+        return extents
+
+    def openFile(self, entry):
+        """
+        Open the content of a file (FatDirEntry): ExtentStream which only
+        reads the clusters of the file. Raise a NullStreamError for
+        an empty file.
+        """
+        extents = self.getExtents(entry)
+        if entry.isDirectory():
+            size = sum(length for offset, length in extents)
+        else:
+            size = entry.size
+        return ExtentStream(self.stream, extents, size,
+                            source="%s:%s" % (self.stream.source, entry.name))
+
+    def readFile(self, entry):
+        """
+        Read the content of a file (bytes)
+        """
+        data = []
+        size = 0
+        for offset, length in self.getExtents(entry):
+            data.append(self.readBytes(offset, length))
+            size += length
+        if not entry.isDirectory() and size < entry.size:
+            raise ParserError("File %s is truncated (cluster chain too short)"
+                              % entry.name)
+        return b"".join(data)
+
+    def iterDirectory(self, entry=None):
+        """
+        Iterate on the entries of a directory (default: root directory):
+        FatDirEntry objects. Deleted entries, volume labels and the "." and
+        ".." entries are skipped.
+        """
+        if entry is None:
+            entry = self.getRoot()
+        if not entry.isDirectory():
+            raise ParserError("%s is not a directory" % entry.name)
+        long_name = {}
+        checksum = None
+        for offset, length in self.getExtents(entry):
+            data = self.readBytes(offset, length)
+            for pos in range(0, length - 31, 32):
+                status = data[pos]
+                if not status:
+                    return
+                attr = data[pos + 11]
+                if status == 0xE5:
+                    long_name = {}
+                    continue
+                if attr & 0x3F == FatDirEntry.LONG_NAME:
+                    if status & 0x40:
+                        long_name = {}
+                        checksum = data[pos + 13]
+                    part = (data[pos + 1:pos + 11] + data[pos + 14:pos + 26]
+                            + data[pos + 28:pos + 32])
+                    long_name[status & 0x1F] = part
+                    continue
+                raw = data[pos:pos + 11]
+                name = short_name = parseShortName(raw, data[pos + 12])
+                if long_name and checksum == shortNameChecksum(raw) \
+                        and sorted(long_name) == list(range(1, len(long_name) + 1)):
+                    name = b"".join(long_name[index]
+                                    for index in sorted(long_name))
+                    name = name.decode("UTF-16-LE", "replace")
+                    name = name.split("\0", 1)[0]
+                long_name = {}
+                if attr & FatDirEntry.VOLUME_LABEL or short_name in (".", ".."):
+                    continue
+                cluster_hi, cluster_lo, size = struct.unpack_from(
+                    "<H4xHL", data, pos + 20)
+                cluster = cluster_lo
+                if self.version == 32:
+                    cluster += cluster_hi << 16
+                yield FatDirEntry(name, short_name, attr, cluster, size,
+                                  offset + pos)
+
+    def walk(self, entry=None, path=""):
+        """
+        Walk the directory tree (default: from the root directory):
+        generate (path, FatDirEntry) tuples, parents before their children.
+        """
+        visited = set()
+        stack = [(path, entry)]
+        while stack:
+            path, entry = stack.pop()
+            children = []
+            for child in self.iterDirectory(entry):
+                child_path = path + "/" + child.name
+                yield child_path, child
+                if child.isDirectory() and child.cluster \
+                        and child.cluster not in visited:
+                    visited.add(child.cluster)
+                    children.append((child_path, child))
+            stack.extend(reversed(children))
+
+    def lookup(self, path):
+        """
+        Get the entry (FatDirEntry) of an absolute path, names are compared
+        case-insensitively. Raise a KeyError if a file does not exist.
+        """
+        entry = self.getRoot()
+        for name in path.split("/"):
+            if name in ("", "."):
+                continue
+            name = name.lower()
+            for child in self.iterDirectory(entry):
+                if child.name.lower() == name \
+                        or child.short_name.lower() == name:
+                    entry = child
+                    break
+            else:
+                raise KeyError("No such file: %s" % path)
+        return entry
+
+
 class FAT_FS(Parser):
     endian = LITTLE_ENDIAN
     PARSER_TAGS = {
@@ -340,23 +717,22 @@ class FAT_FS(Parser):
             return "Invalid BIOS signature"
         return True
 
+    def getFileSystem(self):
+        """
+        Get the file system accessor (FatFileSystem)
+        """
+        try:
+            return self._file_system
+        except AttributeError:
+            pass
+        self._file_system = FatFileSystem(self)
+        return self._file_system
+
     def clusters(self, cluster_func):
-        max_entry = (1 << min(28, self.version)) - 16
-        cluster = cluster_func()
-        if 1 < cluster < max_entry:
-            clus_nb = 1
-            next = cluster
-            while True:
-                next = self.fat[next / 1000][next % 1000].value
-                if not 1 < next < max_entry:
-                    break
-                if cluster + clus_nb == next:
-                    clus_nb += 1
-                else:
-                    yield self.data_start + cluster * self.cluster_size, clus_nb * self.cluster_size, False
-                    cluster = next
-                    clus_nb = 1
-            yield self.data_start + cluster * self.cluster_size, clus_nb * self.cluster_size, True
+        runs = self.getFileSystem().getTable().getRuns(cluster_func())
+        for index, (cluster, clus_nb) in enumerate(runs):
+            yield (self.data_start + cluster * self.cluster_size,
+                   clus_nb * self.cluster_size, index == len(runs) - 1)
 
     def createFields(self):
         # Read boot seector
@@ -37,8 +37,10 @@ from hachoir.core.endian import LITTLE_ENDIAN, BIG_ENDIAN
 from hachoir.core.tools import humanDatetime
 from datetime import datetime
 from hachoir.field import Bits, FieldError
+from hachoir.stream import ExtentStream
 from sys import byteorder
 import string
+import struct
 
 
 class GenericISO9660Integer(Bits):
@@ -487,6 +489,375 @@ class Volume(FieldSet):
             yield RawBytes(self, "raw_content", SECTOR_SIZE - 7)
 
 
+# Directory record flags
+FLAG_DIRECTORY = 0x02
+FLAG_MULTI_EXTENT = 0x80
+
+# Escape sequences of Joliet supplementary volume descriptors
+# (UCS-2 level 1, 2 and 3)
+JOLIET_ESCAPES = (b"%/@", b"%/C", b"%/E")
+
+# Maximum number of continuation areas of the System Use field of a record
+MAX_CONTINUATION_AREAS = 16
+
+
+def iterDirectoryRecords(data, block_size):
+    """
+    Iterate on the directory records of a directory extent (bytes):
+    (offset, record) tuples. Records do not cross block boundaries:
+    a null length means that the next record is in the next block.
+    """
+    pos = 0
+    while pos < len(data):
+        length = data[pos]
+        if not length:
+            pos = (pos // block_size + 1) * block_size
+            continue
+        if length < 34 or len(data) < pos + length:
+            raise ParserError("Invalid directory record length at %s" % pos)
+        yield pos, data[pos:pos + length]
+        pos += length
+
+
+class IsoDirEntry:
+    """
+    Directory entry read by IsoFileSystem: name, flags, location (first
+    block), size (in bytes), extents (list of (offset, size) in bytes,
+    files bigger than 4 GB use multiple extents) and offset of the directory
+    record (in bytes).
+    """
+    __slots__ = ("name", "flags", "location", "size", "extents", "offset")
+
+    def __init__(self, name, flags, location, size, extents, offset):
+        self.name = name
+        self.flags = flags
+        self.location = location
+        self.size = size
+        self.extents = extents
+        self.offset = offset
+
+    def isDirectory(self):
+        return bool(self.flags & FLAG_DIRECTORY)
+
+    def __repr__(self):
+        return "<IsoDirEntry %r: location=%s size=%s>" % (
+            self.name, self.location, self.size)
+
+
+class IsoFileSystem:
+    """
+    Random access to the files of an ISO 9660 image, without creating
+    the fields of the directory records:
+
+        fs = parser.getFileSystem()
+        entry = fs.lookup("/boot/isolinux/isolinux.cfg")
+        data = fs.readFile(entry)
+
+    Names are read from the Rock Ridge extension if available, otherwise
+    from the Joliet volume descriptor if available. joliet=True forces
+    Joliet names, joliet=False ignores the Joliet volume descriptor.
+    Each directory extent is read at once, directories are located using
+    the path table when names come from the volume descriptor.
+    """
+
+    def __init__(self, parser, joliet=None):
+        self.parser = parser
+        self.stream = parser.stream
+        primary = None
+        supplementary = None
+        for index in range(16, 16 + 64):
+            descriptor = self.readBytes(index * SECTOR_SIZE, SECTOR_SIZE)
+            if descriptor[1:6] != b"CD001":
+                raise ParserError("Invalid volume descriptor signature")
+            if descriptor[0] == Volume.TERMINATOR:
+                break
+            if descriptor[0] == 1 and primary is None:
+                primary = descriptor
+                primary_offset = index * SECTOR_SIZE
+            elif descriptor[0] == 2 and supplementary is None \
+                    and descriptor[88:91] in JOLIET_ESCAPES:
+                supplementary = descriptor
+                supplementary_offset = index * SECTOR_SIZE
+        if primary is None:
+            raise ParserError("Missing primary volume descriptor")
+        self.block_size = struct.unpack_from("<H", primary, 128)[0]
+        if not self.block_size:
+            raise ParserError("Invalid logical block size")
+
+        self.joliet = False
+        self.rock_ridge = False
+        self.susp_skip = 0
+        self.descriptor = primary
+        self.root = self.parseRecord(primary[156:190], primary_offset + 156)
+        self._checkRockRidge()
+        if supplementary is not None \
+                and (joliet or (joliet is None and not self.rock_ridge)):
+            self.joliet = True
+            self.rock_ridge = False
+            self.descriptor = supplementary
+            self.root = self.parseRecord(supplementary[156:190],
+                                         supplementary_offset + 156)
+        elif joliet:
+            raise ParserError("No Joliet volume descriptor")
+        self.root.name = ""
+        self._directory_index = None
+
+    def readBytes(self, offset, size):
+        return self.stream.readBytes(offset * 8, size)
+
+    def _checkRockRidge(self):
+        # The SP entry of the first record of the root directory indicates
+        # that the System Use Sharing Protocol is used
+        data = self.readBytes(self.root.location * self.block_size,
+                              self.block_size)
+        length = data[0]
+        if length < 34:
+            return
+        pos = 33 + data[32] + (1 - data[32] % 2)
+        if data[pos:pos + 2] == b"SP" and data[pos + 4:pos + 6] == b"\xBE\xEF":
+            self.rock_ridge = True
+            self.susp_skip = data[pos + 6]
+
+    def _readAlternateName(self, data, pos):
+        # Read the alternate name (NM entries) of the System Use field
+        # of a record, None if the record has no alternate name
+        parts = []
+        for area in range(MAX_CONTINUATION_AREAS):
+            continuation = None
+            while pos + 4 <= len(data):
+                signature = data[pos:pos + 2]
+                length = data[pos + 2]
+                if length < 4 or len(data) < pos + length:
+                    break
+                if signature == b"NM" and 5 <= length:
+                    # Ignore names of the current and parent directories
+                    if not data[pos + 4] & 0x06:
+                        parts.append(data[pos + 5:pos + length])
+                elif signature == b"CE" and 28 <= length:
+                    continuation = struct.unpack_from("<L4xL4xL", data, pos + 4)
+                elif signature == b"ST":
+                    break
+                pos += length
+            if continuation is None:
+                break
+            block, offset, size = continuation
+            data = self.readBytes(block * self.block_size + offset, size)
+            pos = 0
+        if not parts:
+            return None
+        return b"".join(parts).decode("UTF-8", "surrogateescape")
+
+    def parseRecord(self, record, offset):
+        """
+        Parse a directory record (bytes) at offset (in bytes): IsoDirEntry.
+        The name of the current and parent directories are "." and "..".
+        """
+        location, size = struct.unpack_from("<L4xL", record, 2)
+        flags = record[25]
+        name_length = record[32]
+        name = record[33:33 + name_length]
+        if name == b"\0":
+            name = "."
+        elif name == b"\1":
+            name = ".."
+        else:
+            alternate = None
+            if self.rock_ridge:
+                pos = 33 + name_length + (1 - name_length % 2) + self.susp_skip
+                alternate = self._readAlternateName(record, pos)
+            if alternate is not None:
+                name = alternate
+            else:
+                if self.joliet:
+                    name = name.decode("UTF-16-BE", "replace")
+                else:
+                    name = name.decode("ASCII", "replace")
+                # Remove the version number and the empty extension
+                name = name.split(";", 1)[0]
+                if not flags & FLAG_DIRECTORY and name.endswith("."):
+                    name = name[:-1]
+        extents = [(location * self.block_size, size)]
+        return IsoDirEntry(name, flags, location, size, extents, offset)
+
+    def readDirectory(self, entry):
+        """
+        Read all directory records of a directory: list of IsoDirEntry
+        (the "." and ".." entries included). The records of a file made of
+        multiple extents are merged.
+        """
+        if not entry.isDirectory():
+            raise ParserError("%s is not a directory" % entry.name)
+        start = entry.location * self.block_size
+        data = self.readBytes(start, entry.size)
+        entries = []
+        previous = None
+        for pos, record in iterDirectoryRecords(data, self.block_size):
+            child = self.parseRecord(record, start + pos)
+            if previous is not None:
+                # Next extent of a file made of multiple extents
+                previous.extents.extend(child.extents)
+                previous.size += child.size
+                previous.flags = child.flags
+                child = previous
+            else:
+                entries.append(child)
+            if child.flags & FLAG_MULTI_EXTENT:
+                previous = child
+            else:
+                previous = None
+        return entries
+
+    def iterDirectory(self, entry=None):
+        """
+        Iterate on the entries of a directory (default: root directory):
+        IsoDirEntry objects. The "." and ".." entries are skipped.
+        """
+        if entry is None:
+            entry = self.root
+        for child in self.readDirectory(entry):
+            if child.name not in (".", ".."):
+                yield child
+
+    def walk(self, entry=None, path=""):
+        """
+        Walk the directory tree (default: from the root directory):
+        generate (path, IsoDirEntry) tuples, parents before their children.
+        """
+        visited = set()
+        stack = [(path, entry)]
+        while stack:
+            path, entry = stack.pop()
+            children = []
+            for child in self.iterDirectory(entry):
+                child_path = path + "/" + child.name
+                yield child_path, child
+                if child.isDirectory() and child.location not in visited:
+                    visited.add(child.location)
+                    children.append((child_path, child))
+            stack.extend(reversed(children))
+
+    def buildIndex(self):
+        """
+        Build the index of the files and directories: dictionary
+        path => IsoDirEntry
+        """
+        return dict(self.walk())
+
+    def getPathTable(self):
+        """
+        Read the path table of the volume descriptor: list of (name,
+        location, parent) tuples, parent is the number of the parent
+        directory (starting at 1, the first directory is the root)
+        """
+        size = struct.unpack_from("<L", self.descriptor, 132)[0]
+        location = struct.unpack_from("<L", self.descriptor, 140)[0]
+        if location:
+            endian = "<"
+        else:
+            location = struct.unpack_from(">L", self.descriptor, 148)[0]
+            endian = ">"
+        data = self.readBytes(location * self.block_size, size)
+        table = []
+        pos = 0
+        while pos + 8 <= len(data):
+            name_length, xa_length, location, parent = struct.unpack_from(
+                endian + "BBLH", data, pos)
+            if not name_length:
+                break
+            name = data[pos + 8:pos + 8 + name_length]
+            table.append((name, location, parent))
+            pos += 8 + name_length + name_length % 2
+        return table
+
+    def getDirectoryIndex(self):
+        """
+        Get the index of the directories built from the path table:
+        dictionary path => location (first block). Names are the names of
+        the volume descriptor (not the Rock Ridge names).
+        """
+        if self._directory_index is not None:
+            return self._directory_index
+        paths = []
+        index = {}
+        for number, (name, location, parent) in enumerate(self.getPathTable()):
+            if not number:
+                path = ""
+            elif not (1 <= parent <= number):
+                raise ParserError("Invalid path table parent directory")
+            else:
+                if self.joliet:
+                    name = name.decode("UTF-16-BE", "replace")
+                else:
+                    name = name.decode("ASCII", "replace")
+                path = paths[parent - 1] + "/" + name
+            paths.append(path)
+            index[path or "/"] = location
+        self._directory_index = index
+        return index
+
+    def getDirectory(self, location):
+        """
+        Get the directory starting at block location: IsoDirEntry read
+        from its "." record
+        """
+        offset = location * self.block_size
+        data = self.readBytes(offset, 34)
+        length = data[0]
+        if length < 34:
+            raise ParserError("Invalid directory at block %s" % location)
+        return self.parseRecord(self.readBytes(offset, length), offset)
+
+    def lookup(self, path):
+        """
+        Get the entry (IsoDirEntry) of an absolute path. Raise a KeyError
+        if a file does not exist.
+        """
+        names = [name for name in path.split("/") if name not in ("", ".")]
+        if not names:
+            return self.root
+        entry = self.root
+        if not self.rock_ridge:
+            # Locate the deepest parent directory using the path table
+            index = self.getDirectoryIndex()
+            for count in range(len(names), 0, -1):
+                location = index.get("/" + "/".join(names[:count]))
+                if location is None:
+                    continue
+                if count == len(names):
+                    entry = self.getDirectory(location)
+                    entry.name = names[-1]
+                    return entry
+                entry = self.getDirectory(location)
+                names = names[count:]
+                break
+        for name in names:
+            if not entry.isDirectory():
+                raise KeyError("No such file: %s" % path)
+            for child in self.iterDirectory(entry):
+                if child.name == name:
+                    entry = child
+                    break
+            else:
+                raise KeyError("No such file: %s" % path)
+        return entry
+
+    def openFile(self, entry):
+        """
+        Open the content of a file (IsoDirEntry): ExtentStream which only
+        reads the extents of the file. Raise a NullStreamError for
+        an empty file.
+        """
+        return ExtentStream(self.stream, entry.extents, entry.size,
+                            source="%s:%s" % (self.stream.source, entry.name))
+
+    def readFile(self, entry):
+        """
+        Read the content of a file (bytes)
+        """
+        return b"".join(self.readBytes(offset, size)
+                        for offset, size in entry.extents)
+
+
 class ISO9660(Parser):
     DEBUG = False
 
@@ -506,57 +877,44 @@ class ISO9660(Parser):
     # we need to build a list with DirRecords using random access since they are usually not linear in the data stream
     # and hachoir can only provide data in a stream
     def build_record_list(self, p_node_loc, p_node_len, p_rec_list):
-        l_read = 0
-        while l_read < p_node_len:
-            # read first byte of record structure at ex_loc (rec_length)
-            l_new_len = self.stream.readInteger((p_node_loc + 0) * 8, False, 8 * 1, LITTLE_ENDIAN)
-            if l_new_len == 0:
-                # we either have hit a boundary and the remaining space is <= 34 bytes or the end of the directory list
-                l_node_sec, l_node_rest = divmod(p_node_loc, SECTOR_SIZE)
-                l_read += (SECTOR_SIZE-l_node_rest)
-                if l_read < p_node_len:
-                    if self.DEBUG:
-                        print("sector boundary detected, skipping %d bytes" % (SECTOR_SIZE-l_node_rest))
-                    p_node_loc = (l_node_sec + 1) * SECTOR_SIZE
-                    l_new_len = self.stream.readInteger((p_node_loc + 0) * 8, False, 8 * 1, LITTLE_ENDIAN)
-                else:
-                    # end of the directory!
-                    break
-
-            # read new "extend_loc"
-            l_new_node_loc = self.stream.readInteger((p_node_loc + 2) * 8, False, 8 * 4, LITTLE_ENDIAN) * SECTOR_SIZE
-            # read new "size"
-            l_new_node_len = self.stream.readInteger((p_node_loc + 10) * 8, False, 8 * 4, LITTLE_ENDIAN)
-            # read new "file_flags"
-            l_new_flags = self.stream.readInteger((p_node_loc + 25) * 8, False, 8 * 1, LITTLE_ENDIAN)
-            if self.DEBUG:
-                # read "name_length"
-                l_name_len = self.stream.readInteger((p_node_loc + 32) * 8, False, 8 * 1, LITTLE_ENDIAN)
-                if l_name_len > 1:
-                    # read "filename"
-                    l_new_name = self.stream.readBytes((p_node_loc + 33) * 8, l_name_len)
-                else:
-                    if p_node_loc == l_new_node_loc:
-                        l_new_name = "."
-                    else:
-                        l_new_name = ".."
-                print("total read=%s/%s, read position @%#x-%#x[%d]: child node name=%s @%#x[%d]"
-                      % (l_read, p_node_len, p_node_loc, p_node_loc + l_new_len, l_new_len, l_new_name,
-                         l_new_node_loc, l_new_node_len))
-
-            if p_node_loc not in p_rec_list.keys():
-                p_rec_list[p_node_loc] = p_node_len
-                if l_new_flags & 2:
-                    if self.DEBUG:
-                        print("enter directory %s, length=%s {" % (l_new_name, l_new_node_len))
-                    self.build_record_list(l_new_node_loc, l_new_node_len, p_rec_list)
+        """
+        Add the locations (in bytes) of the directory records of the directory extent p_node_loc (of p_node_len
+        bytes) and of its subdirectories to p_rec_list: location => size of the directory extent. Each directory
+        extent is read at once, subdirectories are walked iteratively. An invalid directory record stops the
+        reading of its directory extent with a warning.
+        """
+        l_directories = [(p_node_loc, p_node_len)]
+        l_visited = set()
+        while l_directories:
+            l_dir_loc, l_dir_len = l_directories.pop()
+            if l_dir_loc in l_visited:
+                continue
+            l_visited.add(l_dir_loc)
+            l_data = self.stream.readBytes(l_dir_loc * 8, l_dir_len)
+            try:
+                for l_pos, l_record in iterDirectoryRecords(l_data, SECTOR_SIZE):
+                    l_rec_loc = l_dir_loc + l_pos
                     if self.DEBUG:
-                        print("leave directory %s }" % l_new_name)
-            else:
-                if self.DEBUG:
-                    print("skipping entry %s" % l_new_name)
-            l_read += l_new_len
-            p_node_loc += l_new_len
+                        print("read position @%#x[%d]" % (l_rec_loc, len(l_record)))
+                    if l_rec_loc in p_rec_list:
+                        continue
+                    p_rec_list[l_rec_loc] = l_dir_len
+                    l_new_node_loc, l_new_node_len = struct.unpack_from("<L4xL", l_record, 2)
+                    if l_record[25] & FLAG_DIRECTORY:
+                        l_directories.append((l_new_node_loc * SECTOR_SIZE, l_new_node_len))
+            except ParserError as err:
+                self.warning("Directory extent at %s: %s" % (l_dir_loc, err))
+
+    def getFileSystem(self):
+        """
+        Get the file system accessor (IsoFileSystem)
+        """
+        try:
+            return self._file_system
+        except AttributeError:
+            pass
+        self._file_system = IsoFileSystem(self)
+        return self._file_system
 
     def validate(self):
         if self.stream.readBytes(self.NULL_BYTES * 8, len(self.MAGIC)) != self.MAGIC:
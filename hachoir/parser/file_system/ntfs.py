@@ -15,11 +15,15 @@ from hachoir.parser import Parser
 from hachoir.field import (FieldSet, Enum,
                            UInt8, UInt16, UInt32, UInt64, TimestampWin64,
                            String, Bytes, Bit, Bits,
-                           NullBits, NullBytes, PaddingBytes, RawBytes)
+                           NullBits, NullBytes, PaddingBytes, RawBytes,
+                           ParserError, createOrphanField)
 from hachoir.core.endian import LITTLE_ENDIAN
 from hachoir.core.text_handler import textHandler, hexadecimal, filesizeHandler
 from hachoir.core.tools import humanFilesize, createDict
 from hachoir.parser.common.msdos import MSDOSFileAttr32
+from hachoir.stream import ExtentStream, StringInputStream
+from bisect import bisect_right
+import struct
 
 SECTOR_SIZE = 512
 
@@ -337,6 +341,496 @@ class File(FieldSet):
         return text
 
 
+# Special MFT records
+MFT_RECORD = 0
+ROOT_RECORD = 5
+
+# Attribute types
+ATTR_ATTRIBUTE_LIST = 0x20
+ATTR_FILE_NAME = 0x30
+ATTR_DATA = 0x80
+ATTR_END = 0xFFFFFFFF
+
+# Attribute flags
+ATTR_COMPRESSED = 0x0001
+ATTR_ENCRYPTED = 0x4000
+
+NAMESPACE_DOS = 2
+
+# The update sequence array protects the last two bytes of each block
+# of 512 bytes of a record
+FIXUP_BLOCK_SIZE = 512
+
+# Number of MFT records read at once by NtfsFileSystem.iterRecords()
+RECORD_CHUNK = 256
+
+
+def getRecordSize(value, cluster_size):
+    """
+    Get the size in bytes of a MFT record (or of an index block) from the
+    boot sector value: number of clusters, or if negative (signed byte),
+    log2 of the size in bytes
+    """
+    if 0x80 <= value:
+        return 1 << (256 - value)
+    return value * cluster_size
+
+
+def decodeRunList(data, pos=0):
+    """
+    Decode a runlist: list of (first cluster, length in clusters) tuples,
+    first cluster is None for a sparse run
+    """
+    runs = []
+    cluster = 0
+    while pos < len(data) and data[pos]:
+        lenlen = data[pos] & 0xf
+        offlen = data[pos] >> 4
+        pos += 1
+        if not lenlen or len(data) < pos + lenlen + offlen:
+            raise ParserError("Invalid runlist")
+        length = int.from_bytes(data[pos:pos + lenlen], "little")
+        pos += lenlen
+        if offlen:
+            cluster += int.from_bytes(data[pos:pos + offlen], "little",
+                                      signed=True)
+            runs.append((cluster, length))
+        else:
+            runs.append((None, length))
+        pos += offlen
+    return runs
+
+
+def applyFixups(data):
+    """
+    Check the update sequence number of each block of a record and restore
+    the original bytes: return the fixed record (bytes)
+    """
+    data = bytearray(data)
+    usa_ofs, usa_count = struct.unpack_from("<HH", data, 4)
+    if not usa_count or len(data) < usa_ofs + usa_count * 2 \
+            or len(data) < (usa_count - 1) * FIXUP_BLOCK_SIZE:
+        raise ParserError("Invalid update sequence array")
+    usn = data[usa_ofs:usa_ofs + 2]
+    for index in range(1, usa_count):
+        end = index * FIXUP_BLOCK_SIZE
+        if data[end - 2:end] != usn:
+            raise ParserError("Update sequence number mismatch (torn write)")
+        pos = usa_ofs + index * 2
+        data[end - 2:end] = data[pos:pos + 2]
+    return bytes(data)
+
+
+class NtfsAttribute:
+    """
+    Attribute of a MFT record read by NtfsFileSystem: type, name (str),
+    flags and record (number of the MFT record storing the attribute).
+
+    A resident attribute has its content in value (bytes). A non-resident
+    attribute has value=None, runs (see decodeRunList()) and start_vcn
+    (first virtual cluster described by the runs). size and
+    initialized_size are the size of the content in bytes.
+    """
+    __slots__ = ("type", "name", "flags", "record", "value", "runs",
+                 "start_vcn", "size", "initialized_size")
+
+    def __init__(self, record, type, data, pos, length):
+        self.record = record
+        self.type = type
+        non_resident, name_length, name_offset, self.flags = struct.unpack_from(
+            "<BBHH", data, pos + 8)
+        name = data[pos + name_offset:pos + name_offset + name_length * 2]
+        self.name = name.decode("UTF-16-LE", "replace")
+        if non_resident:
+            self.start_vcn, runlist_offset = struct.unpack_from(
+                "<Q8xH", data, pos + 16)
+            self.size, self.initialized_size = struct.unpack_from(
+                "<QQ", data, pos + 48)
+            self.runs = decodeRunList(data[pos + runlist_offset:pos + length])
+            self.value = None
+        else:
+            size, offset = struct.unpack_from("<LH", data, pos + 16)
+            if length < offset + size:
+                raise ParserError("Invalid resident attribute size")
+            self.value = data[pos + offset:pos + offset + size]
+            self.runs = None
+            self.start_vcn = 0
+            self.size = self.initialized_size = size
+
+    def isResident(self):
+        return self.value is not None
+
+    def __repr__(self):
+        return "<NtfsAttribute 0x%x %r: size=%s>" % (
+            self.type, self.name, self.size)
+
+
+class NtfsRecord:
+    """
+    MFT record read by NtfsFileSystem, with the fixups applied: number,
+    offset (in bytes), sequence (number of times the record has been
+    reused), flags, base_record (number of the base record for an
+    extension record, 0 otherwise) and attributes (list of NtfsAttribute).
+    """
+    __slots__ = ("number", "offset", "sequence", "flags", "base_record",
+                 "attributes")
+
+    IN_USE = 1
+    IS_DIRECTORY = 2
+
+    def __init__(self, number, offset, data):
+        if data[:4] != b"FILE":
+            raise ParserError("MFT record %s: invalid signature" % number)
+        data = applyFixups(data)
+        self.number = number
+        self.offset = offset
+        self.sequence, attrs_offset, self.flags, bytes_in_use, base_record = \
+            struct.unpack_from("<16xH2xHHL4xQ", data)
+        self.base_record = base_record & 0xFFFFFFFFFFFF
+        self.attributes = []
+        pos = attrs_offset
+        end = min(bytes_in_use, len(data))
+        while pos + 8 <= end:
+            type, length = struct.unpack_from("<LL", data, pos)
+            if type == ATTR_END:
+                break
+            if length < 24 or end < pos + length:
+                raise ParserError("MFT record %s: invalid attribute length"
+                                  % number)
+            self.attributes.append(
+                NtfsAttribute(number, type, data, pos, length))
+            pos += length
+
+    def isInUse(self):
+        return bool(self.flags & self.IN_USE)
+
+    def isDirectory(self):
+        return bool(self.flags & self.IS_DIRECTORY)
+
+    def findAttributes(self, type, name=None):
+        return [attr for attr in self.attributes
+                if attr.type == type and (name is None or attr.name == name)]
+
+    def getFileNames(self):
+        """
+        Get the names of the record stored in its $FILE_NAME attributes:
+        list of (parent record, parent sequence, namespace, name) tuples
+        """
+        names = []
+        for attr in self.findAttributes(ATTR_FILE_NAME):
+            value = attr.value
+            if value is None or len(value) < 66:
+                continue
+            parent, length, namespace = struct.unpack_from("<Q56xBB", value)
+            name = value[66:66 + length * 2].decode("UTF-16-LE", "replace")
+            names.append((parent & 0xFFFFFFFFFFFF, parent >> 48,
+                          namespace, name))
+        return names
+
+    def __repr__(self):
+        return "<NtfsRecord %s: flags=%s>" % (self.number, self.flags)
+
+
+class NtfsFileSystem:
+    """
+    Random access to the files of a NTFS file system, without parsing
+    the MFT:
+
+        fs = parser.getFileSystem()
+        record = fs.lookup("/Windows/System32/drivers/etc/hosts")
+        data = fs.readData(record)
+
+    The runlist of the $MFT is mapped once, so any record is read directly
+    from its number. lookup() uses an index of the paths built in a single
+    pass over the MFT from the $FILE_NAME attributes (see buildNameIndex()).
+
+    The content of a non-resident stream is described by extents in bytes
+    (see getExtents()), independent of the parser, so files can be
+    extracted in parallel by workers each reading the image with its own
+    file object.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.stream = parser.stream
+        bios = parser["mbr/bios"]
+        self.cluster_size = bios["sectors_per_cluster"].value \
+            * bios["bytes_per_sector"].value
+        self.record_size = getRecordSize(parser["mbr/cluster_per_mft"].value,
+                                         self.cluster_size)
+        if self.record_size < FIXUP_BLOCK_SIZE:
+            raise ParserError("Invalid MFT record size: %s" % self.record_size)
+        self._name_index = None
+
+        # Map the first extent of the $MFT to read the records of its
+        # attribute list, and then the whole $MFT
+        offset = parser["mbr/mft_cluster"].value * self.cluster_size
+        record = NtfsRecord(MFT_RECORD, offset,
+                            self.readBytes(offset, self.record_size))
+        self._mapMft(record.findAttributes(ATTR_DATA, ""))
+        if record.findAttributes(ATTR_ATTRIBUTE_LIST):
+            self._mapMft(self.getAttributes(record, ATTR_DATA, ""))
+
+    def readBytes(self, offset, size):
+        return self.stream.readBytes(offset * 8, size)
+
+    def _mapMft(self, attributes):
+        extents, size = self._getStreamExtents(attributes)
+        self.mft = ExtentStream(self.stream, extents, size,
+                                source="%s:$MFT" % self.stream.source)
+        self.mft_starts = self.mft.starts
+        self.mft_extents = self.mft.extents
+        self.record_count = size // self.record_size
+
+    def getRecordOffset(self, number):
+        """
+        Get the offset in bytes of the MFT record number
+        """
+        if not(0 <= number < self.record_count):
+            raise ParserError("Invalid MFT record number: %s" % number)
+        start = number * self.record_size
+        index = bisect_right(self.mft_starts, start) - 1
+        offset = self.mft_extents[index][0]
+        if offset is None:
+            raise ParserError("MFT record %s is in a sparse run" % number)
+        return offset + start - self.mft_starts[index]
+
+    def getRecord(self, number):
+        """
+        Read the MFT record number (NtfsRecord)
+        """
+        offset = self.getRecordOffset(number)
+        data = self.mft.readBytes(number * self.record_size * 8,
+                                  self.record_size)
+        return NtfsRecord(number, offset, data)
+
+    def getRecordField(self, number):
+        """
+        Create the field of the MFT record number (File field). The fixups
+        are not applied to the field values.
+        """
+        offset = self.getRecordOffset(number)
+        start = number * self.record_size
+        index = bisect_right(self.mft_starts, start) - 1
+        if self.mft_starts[index] + self.mft_extents[index][1] \
+                < start + self.record_size:
+            raise ParserError("MFT record %s is fragmented" % number)
+        return createOrphanField(self.parser, offset * 8, File,
+                                 "file[%u]" % number)
+
+    def iterRecords(self, start=0, stop=None):
+        """
+        Iterate on the MFT records in use, reading RECORD_CHUNK records
+        at once. Unused records and invalid records are skipped.
+        """
+        if stop is None or self.record_count < stop:
+            stop = self.record_count
+        for first in range(start, stop, RECORD_CHUNK):
+            count = min(RECORD_CHUNK, stop - first)
+            data = self.mft.readBytes(first * self.record_size * 8,
+                                      count * self.record_size)
+            for index in range(count):
+                pos = index * self.record_size
+                chunk = data[pos:pos + self.record_size]
+                if chunk[:4] != b"FILE":
+                    continue
+                number = first + index
+                try:
+                    record = NtfsRecord(number, self.getRecordOffset(number),
+                                        chunk)
+                except ParserError as err:
+                    self.parser.warning(str(err))
+                    continue
+                if record.isInUse():
+                    yield record
+
+    def getAttributes(self, record, type=None, name=None):
+        """
+        Get the attributes of a record, including the attributes stored
+        in extension records (listed by its $ATTRIBUTE_LIST attribute).
+        Filter by type and name if set.
+        """
+        attributes = list(record.attributes)
+        for attr_list in record.findAttributes(ATTR_ATTRIBUTE_LIST):
+            if attr_list.isResident():
+                data = attr_list.value
+            else:
+                data = self._openStream([attr_list]).readBytes(0, attr_list.size)
+            numbers = []
+            pos = 0
+            while pos + 26 <= len(data):
+                length, reference = struct.unpack_from("<4xH10xQ", data, pos)
+                if length < 26:
+                    raise ParserError("Invalid attribute list entry length")
+                number = reference & 0xFFFFFFFFFFFF
+                if number != record.number and number not in numbers:
+                    numbers.append(number)
+                pos += length
+            for number in numbers:
+                extension = self.getRecord(number)
+                if extension.base_record != record.number:
+                    raise ParserError("MFT record %s is not an extension of "
+                                      "record %s" % (number, record.number))
+                attributes.extend(attr for attr in extension.attributes
+                                  if attr.type != ATTR_ATTRIBUTE_LIST)
+        return [attr for attr in attributes
+                if (type is None or attr.type == type)
+                and (name is None or attr.name == name)]
+
+    def _getStreamExtents(self, attributes):
+        # Get the extents and the size of a non-resident stream stored in
+        # one or more attributes
+        attributes = sorted(attributes, key=lambda attr: attr.start_vcn)
+        if not attributes or attributes[0].start_vcn:
+            raise ParserError("Missing first non-resident attribute")
+        first = attributes[0]
+        if first.isResident():
+            raise ParserError("Attribute is resident")
+        if first.flags & (ATTR_COMPRESSED | ATTR_ENCRYPTED):
+            raise ParserError("Compressed and encrypted attributes "
+                              "are not supported")
+        extents = []
+
+        def addExtent(offset, length):
+            if length <= 0:
+                return
+            if offset is None and extents and extents[-1][0] is None:
+                # Merge holes
+                extents[-1] = (None, extents[-1][1] + length)
+            else:
+                extents.append((offset, length))
+
+        # position is the VCN in bytes: clusters after the initialized
+        # size are holes, clusters after the size are ignored
+        position = 0
+        for attr in attributes:
+            if attr.runs is None:
+                raise ParserError("Attribute is resident")
+            if attr.start_vcn * self.cluster_size != position:
+                raise ParserError("Runlists are not contiguous")
+            for cluster, length in attr.runs:
+                start = position
+                position += length * self.cluster_size
+                end = min(position, first.size)
+                data_end = max(min(end, first.initialized_size), start)
+                if cluster is not None:
+                    addExtent(cluster * self.cluster_size, data_end - start)
+                else:
+                    addExtent(None, data_end - start)
+                addExtent(None, end - data_end)
+        return extents, first.size
+
+    def _openStream(self, attributes, source=None):
+        extents, size = self._getStreamExtents(attributes)
+        return ExtentStream(self.stream, extents, size, source=source)
+
+    def getExtents(self, record, name=""):
+        """
+        Get the content of the $DATA stream name (default: unnamed stream)
+        of a record as a list of (offset, size) in bytes, offset is None for
+        sparse and uninitialized parts (see ExtentStream). Return None if the
+        stream is resident (stored in the record). Raise a KeyError if the
+        stream does not exist.
+        """
+        attributes = self.getAttributes(record, ATTR_DATA, name)
+        if not attributes:
+            raise KeyError("No data stream %r in MFT record %s"
+                           % (name, record.number))
+        if attributes[0].isResident():
+            return None
+        return self._getStreamExtents(attributes)[0]
+
+    def openData(self, record, name=""):
+        """
+        Open the $DATA stream name (default: unnamed stream) of a record:
+        ExtentStream which only reads the clusters of the stream, or
+        StringInputStream for a resident stream. Raise a KeyError if the
+        stream does not exist.
+        """
+        attributes = self.getAttributes(record, ATTR_DATA, name)
+        if not attributes:
+            raise KeyError("No data stream %r in MFT record %s"
+                           % (name, record.number))
+        source = "%s:record%s" % (self.stream.source, record.number)
+        if name:
+            source += ":" + name
+        if attributes[0].isResident():
+            return StringInputStream(attributes[0].value, source=source)
+        return self._openStream(attributes, source)
+
+    def readData(self, record, name=""):
+        """
+        Read the $DATA stream name of a record (bytes)
+        """
+        stream = self.openData(record, name)
+        return stream.readBytes(0, stream.size // 8)
+
+    def buildNameIndex(self):
+        """
+        Build the index of the paths of the files in use: dictionary
+        path => record number, read in a single pass over the MFT.
+        DOS names are only used if a file has no other name.
+        """
+        sequences = {}
+        links = {}
+        for record in self.iterRecords():
+            if record.base_record:
+                continue
+            sequences[record.number] = record.sequence
+            names = record.getFileNames()
+            long_names = [entry for entry in names if entry[2] != NAMESPACE_DOS]
+            links[record.number] = long_names or names
+
+        directories = {ROOT_RECORD: ""}
+
+        def getDirectory(number):
+            # Get the path of a directory, None if it is an orphan
+            chain = []
+            while number not in directories:
+                if number in chain or number not in links \
+                        or not links[number]:
+                    return None
+                chain.append(number)
+                parent, sequence, namespace, name = links[number][0]
+                if sequences.get(parent) != sequence:
+                    return None
+                number = parent
+            path = directories[number]
+            for number in reversed(chain):
+                path += "/" + links[number][0][3]
+                directories[number] = path
+            return path
+
+        index = {"/": ROOT_RECORD}
+        for number, names in links.items():
+            if number == ROOT_RECORD:
+                continue
+            for parent, sequence, namespace, name in names:
+                if sequences.get(parent) != sequence:
+                    continue
+                path = getDirectory(parent)
+                if path is not None:
+                    index[path + "/" + name] = number
+        self._name_index = index
+        return index
+
+    def lookup(self, path):
+        """
+        Get the MFT record (NtfsRecord) of an absolute path. The name index
+        is built at the first call (see buildNameIndex()). Raise a KeyError
+        if a file does not exist.
+        """
+        if self._name_index is None:
+            self.buildNameIndex()
+        names = [name for name in path.split("/") if name not in ("", ".")]
+        key = "/" + "/".join(names)
+        try:
+            number = self._name_index[key]
+        except KeyError:
+            raise KeyError("No such file: %s" % path)
+        return self.getRecord(number)
+
+
 class NTFS(Parser):
     MAGIC = b"\xEB\x52\x90NTFS    "
     PARSER_TAGS = {
@@ -373,3 +867,14 @@ class NTFS(Parser):
         size = (self.size - self.current_size) // 8
         if size:
             yield RawBytes(self, "end", size)
+
+    def getFileSystem(self):
+        """
+        Get the file system accessor (NtfsFileSystem)
+        """
+        try:
+            return self._file_system
+        except AttributeError:
+            pass
+        self._file_system = NtfsFileSystem(self)
+        return self._file_system
@@ -5,6 +5,7 @@ Parser list managment:
 
 import os
 from hachoir.core.error import warning, info
+from hachoir.core.budget import BudgetExceeded, runWithBudget
 from hachoir.parser import ValidateError, HachoirParserList
 from hachoir.stream import FileInputStream
 import weakref
@@ -119,19 +120,31 @@ class QueryParser(object):
             return fb(stream)
 
 
-def guessParser(stream):
-    return QueryParser(stream.tags).parse(stream)
+def guessParser(stream, budget=None):
+    """
+    Guess the parser of a stream, returns None on error.
+
+    If budget (ParseBudget) is set, raise a BudgetExceeded error
+    if the budget is exceeded.
+    """
+    return runWithBudget(budget, QueryParser(stream.tags).parse, stream)
 
 
-def createParser(filename, real_filename=None, tags=None):
+def createParser(filename, real_filename=None, tags=None, budget=None):
     """
     Create a parser from a file or returns None on error.
 
     Options:
     - filename (unicode): Input file name ;
-    - real_filename (str|unicode): Real file name.
+    - real_filename (str|unicode): Real file name ;
+    - budget (ParseBudget): Raise a BudgetExceeded error if the budget
+      is exceeded.
     """
     if not tags:
         tags = []
     stream = FileInputStream(filename, real_filename, tags=tags)
-    return guessParser(stream)
+    try:
+        return guessParser(stream, budget)
+    except BudgetExceeded:
+        stream.close()
+        raise
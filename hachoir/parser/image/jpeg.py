@@ -15,7 +15,7 @@ Author: Victor Stinner, Robert Xiao
 """
 
 from hachoir.parser import Parser
-from hachoir.field import (FieldSet, ParserError, FieldError,
+from hachoir.field import (FieldSet, ParserError, FieldError, createOrphanField,
                            UInt8, UInt16, Enum, Field,
                            Bit, Bits, NullBits, NullBytes, PaddingBits,
                            String, RawBytes)
@@ -29,6 +29,58 @@ from hachoir.core.tools import paddingSize, alignValue
 
 MAX_FILESIZE = 100 * 1024 * 1024
 
+# Size in bytes of the blocks read to search markers in the image data
+SEARCH_BLOCK_SIZE = 256 * 1024
+# Size in bytes of the blocks read to index header segments
+HEADER_BLOCK_SIZE = 64 * 1024
+
+
+def readBlock(stream, address, size=SEARCH_BLOCK_SIZE):
+    """
+    Read at most size bytes at address (in bits): stop at the end of
+    the stream
+    """
+    if stream.size is not None:
+        size = min(size, (stream.size - address) // 8)
+    if size <= 0:
+        return b""
+    return stream.read(address, size * 8)[1]
+
+
+def findMarker(stream, address, skip_restart=False):
+    """
+    Find the end of entropy-coded data starting at address (in bits): bulk
+    search of the first 0xFF byte which is not followed by 0x00 (stuffed
+    byte). If skip_restart is True, restart markers (RSTn) and fill bytes
+    (0xFF) are considered as part of the data.
+
+    Return the address (in bits) of the marker, or None if there is no
+    marker (ex: truncated image).
+    """
+    end = address + MAX_FILESIZE * 8
+    while address < end:
+        data = readBlock(stream, address)
+        pos = data.find(b"\xff")
+        while 0 <= pos:
+            if pos + 1 == len(data):
+                break
+            next = data[pos + 1]
+            if next == 0:
+                pos = data.find(b"\xff", pos + 2)
+            elif skip_restart and (0xD0 <= next <= 0xD7 or next == 0xFF):
+                pos = data.find(b"\xff", pos + 1)
+            else:
+                return address + pos * 8
+        if len(data) < SEARCH_BLOCK_SIZE:
+            return None
+        if 0 <= pos:
+            # 0xFF at the end of the block: read it again
+            address += pos * 8
+        else:
+            address += len(data) * 8
+    return None
+
+
 # The four tables (hash/sum for color/grayscale JPEG) comes
 # from ImageMagick project
 QUALITY_HASH_COLOR = (
@@ -381,21 +433,11 @@ class JpegImageData(FieldSet):
         self.scan = scan
         self.restart_interval = restart_interval
         self.restart_offset = restart_offset
-        # try to figure out where this field ends
-        start = self.absolute_address
-        while True:
-            end = self.stream.searchBytes(b"\xff", start, MAX_FILESIZE * 8)
-            if end is None:
-                # this is a bad sign, since it means there is no terminator
-                # we ignore this; it likely means a truncated image
-                break
-            if self.stream.readBytes(end, 2) == b'\xff\x00':
-                # padding: false alarm
-                start = end + 16
-                continue
-            else:
-                self._size = end - self.absolute_address
-                break
+        # try to figure out where this field ends: if there is no
+        # terminator, it likely means a truncated image
+        end = findMarker(self.stream, self.absolute_address)
+        if end is not None:
+            self._size = end - self.absolute_address
 
     def createFields(self):
         if self.frame["../type"].value in [0xC0, 0xC1]:
@@ -545,6 +587,83 @@ class JpegChunk(FieldSet):
         return "Chunk: %s" % self["type"].display
 
 
+class JpegMarkerIndex:
+    """
+    Index of the JPEG segments built by a single buffered scan: header
+    segments are skipped using their size and entropy-coded data is
+    skipped using a bulk search of the next marker (see findMarker()).
+
+    Attributes (offsets and sizes in bytes):
+    - segments: list of (marker, offset, size) of the segments, size
+      includes the marker
+    - scans: list of (offset, size) of the entropy-coded data, including
+      restart markers
+    - end: offset of the end of the image (after EOI), or None if the EOI
+      marker is missing
+    - complete: False if the index stopped at the first SOS segment
+    """
+
+    def __init__(self, stream, size=None, stop_at_scan=False):
+        self.stream = stream
+        self.segments = []
+        self.scans = []
+        self.end = None
+        self.complete = not stop_at_scan
+        self._buffer = b""
+        self._buffer_offset = 0
+        if size is None:
+            size = MAX_FILESIZE
+        offset = 0
+        while offset + 2 <= size:
+            header = self._read(offset, 4)
+            if len(header) < 2 or header[0] != 0xFF:
+                break
+            marker = header[1]
+            if marker == 0xFF:
+                # Fill byte
+                offset += 1
+                continue
+            if marker in (JpegChunk.TAG_SOI, JpegChunk.TAG_EOI) \
+                    or 0xD0 <= marker <= 0xD7:
+                segment_size = 2
+            elif len(header) < 4:
+                break
+            else:
+                segment_size = 2 + ((header[2] << 8) | header[3])
+            self.segments.append((marker, offset, segment_size))
+            offset += segment_size
+            if marker == JpegChunk.TAG_EOI:
+                self.end = offset
+                break
+            if marker == JpegChunk.TAG_SOS:
+                if stop_at_scan:
+                    break
+                end = findMarker(stream, offset * 8, True)
+                if end is None:
+                    break
+                end //= 8
+                self.scans.append((offset, end - offset))
+                offset = end
+
+    def _read(self, offset, size):
+        start = offset - self._buffer_offset
+        if start < 0 or len(self._buffer) < start + size:
+            self._buffer = readBlock(self.stream, offset * 8,
+                                     max(size, HEADER_BLOCK_SIZE))
+            self._buffer_offset = offset
+            start = 0
+        return self._buffer[start:start + size]
+
+    def getHeaderSegments(self):
+        """
+        Get the segments before the first SOS segment (included)
+        """
+        for segment in self.segments:
+            yield segment
+            if segment[0] == JpegChunk.TAG_SOS:
+                break
+
+
 class JpegFile(Parser):
     endian = BIG_ENDIAN
     PARSER_TAGS = {
@@ -631,16 +750,49 @@ class JpegFile(Parser):
                                         header["height"].value)
         return desc
 
-    def createContentSize(self):
-        if "end" in self:
-            return self["end"].absolute_address + self["end"].size
-        if "data" in self:
-            start = self["data"].absolute_address
-        elif "image_data[0]" in self:
-            start = self["image_data[0]"].absolute_address
+    def getMarkerIndex(self, stop_at_scan=False):
+        """
+        Get the marker index (JpegMarkerIndex). If stop_at_scan is True,
+        the index may stop at the first SOS segment.
+        """
+        try:
+            index = self._marker_index
+            if index.complete or stop_at_scan:
+                return index
+        except AttributeError:
+            pass
+        if self._size is not None:
+            size = self._size // 8
         else:
-            return None
-        end = self.stream.searchBytes(b"\xff\xd9", start, MAX_FILESIZE * 8)
+            size = None
+        index = JpegMarkerIndex(self.stream, size, stop_at_scan)
+        self._marker_index = index
+        return index
+
+    def getHeaderChunks(self):
+        """
+        Get the chunks of the header segments (until the first SOS segment)
+        without parsing the image data: list of orphan JpegChunk fields
+        """
+        try:
+            return self._header_chunks
+        except AttributeError:
+            pass
+        chunks = []
+        names = {}
+        for marker, offset, size in self.getMarkerIndex(True).getHeaderSegments():
+            chunk = createOrphanField(self, offset * 8, JpegChunk, "chunk[]")
+            name = chunk.name
+            if name.endswith("[]"):
+                count = names.get(name, 0)
+                names[name] = count + 1
+                chunk._name = name[:-2] + "[%u]" % count
+            chunks.append(chunk)
+        self._header_chunks = chunks
+        return chunks
+
+    def createContentSize(self):
+        end = self.getMarkerIndex().end
         if end is not None:
-            return end + 16
+            return end * 8
         return None
@@ -47,7 +47,7 @@ class RootEntry(OLE2FragmentParser):
         previous = None
         size = 0
         fragment_group = None
-        chain = ole2.getChain(property["start"].value, ole2.ss_fat)
+        chain = ole2.getChain(property["start"].value, use_sfat=True)
         while True:
             try:
                 block = next(chain)
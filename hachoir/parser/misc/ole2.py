@@ -29,6 +29,10 @@ from hachoir.core.text_handler import filesizeHandler
 from hachoir.core.endian import LITTLE_ENDIAN
 from hachoir.parser.common.win32 import GUID
 from hachoir.parser.misc.msoffice import PROPERTY_NAME, RootEntry, RawParser
+from hachoir.stream import ExtentStream
+from array import array
+import struct
+import sys
 
 MIN_BIG_BLOCK_LOG2 = 6   # 512 bytes
 MAX_BIG_BLOCK_LOG2 = 14  # 64 kB
@@ -168,6 +172,43 @@ class SectFat(FieldSet):
             yield SECT(self, "index[%u]" % i)
 
 
+def decodeSects(data):
+    """
+    Decode little endian SECT values: array of integers
+    """
+    values = array("I")
+    values.frombytes(data[:len(data) - len(data) % 4])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class DirectoryEntry:
+    """
+    Entry of the directory (property) read by OLE2_File.getDirectory():
+    index, name, type (see Property.TYPE_NAME), left, right and child
+    (indexes of the red-black tree), start (first sector) and size
+    (in bytes).
+    """
+    __slots__ = ("index", "name", "type", "left", "right", "child",
+                 "start", "size")
+
+    def __init__(self, index, data, version):
+        self.index = index
+        namelen, self.type, self.left, self.right, self.child = \
+            struct.unpack_from("<HBxLLL", data, 64)
+        name = data[:min(max(namelen - 2, 0), 64)]
+        self.name = name.decode("UTF-16-LE", "replace")
+        self.start, self.size = struct.unpack_from("<LQ", data, 116)
+        if version < 4:
+            # The high 32 bits of the size may not be initialized
+            self.size &= 0xFFFFFFFF
+
+    def __repr__(self):
+        return "<DirectoryEntry %s: %r size=%s>" % (
+            self.index, self.name, self.size)
+
+
 class OLE2_File(HachoirParser, RootSeekableFieldSet):
     PARSER_TAGS = {
         "id": "ole2",
@@ -312,12 +353,10 @@ class OLE2_File(HachoirParser, RootSeekableFieldSet):
 
     def getChain(self, start, use_sfat=False):
         if use_sfat:
-            fat = self.ss_fat
-            items_per_fat = self.items_per_ssfat
+            fat = self.getSFAT()
             err_prefix = "SFAT chain"
         else:
-            fat = self.bb_fat
-            items_per_fat = self.items_per_bbfat
+            fat = self.getBFAT()
             err_prefix = "BFAT chain"
         block = start
         block_set = set()
@@ -332,11 +371,163 @@ class OLE2_File(HachoirParser, RootSeekableFieldSet):
             block_set.add(block)
             yield block
             previous = block
-            index = block // items_per_fat
             try:
-                block = fat[index]["index[%u]" % block].value
-            except LookupError as err:
+                block = fat[block]
+            except IndexError:
+                break
+
+    def getSectorSize(self):
+        """
+        Get the size of a sector in bytes
+        """
+        return 1 << self["header/bb_shift"].value
+
+    def readSectors(self, blocks):
+        # Read sectors: contiguous sectors are read at once
+        data = []
+        for offset, length in self.getSectorExtents(blocks):
+            data.append(self.stream.readBytes(offset * 8, length))
+        return b"".join(data)
+
+    def getSectorExtents(self, blocks, sector_size=None, base=None):
+        """
+        Coalesce a list of sectors into extents: list of (offset, size)
+        in bytes. By default, blocks are big blocks of the file.
+        """
+        if sector_size is None:
+            sector_size = self.getSectorSize()
+            base = sector_size
+        extents = []
+        first = previous = None
+        for block in blocks:
+            if previous is not None and block == previous + 1:
+                previous = block
+                continue
+            if first is not None:
+                extents.append((base + first * sector_size,
+                                (previous - first + 1) * sector_size))
+            first = previous = block
+        if first is not None:
+            extents.append((base + first * sector_size,
+                            (previous - first + 1) * sector_size))
+        return extents
+
+    def getDIFAT(self):
+        """
+        Get the DIFAT decoded: array of the big block FAT sectors
+        """
+        try:
+            return self._difat
+        except AttributeError:
+            pass
+        header_size = (64 + Header.static_size) // 8
+        difat = decodeSects(self.stream.readBytes(header_size * 8, NB_DIFAT * 4))
+        block = self["header/db_start"].value
+        for index in range(self["header/db_count"].value):
+            if block in SECT.SPECIALS:
                 break
+            sects = decodeSects(self.readSectors([block]))
+            difat.extend(sects[:-1])
+            block = sects[-1]
+        count = len(difat)
+        for index, block in enumerate(difat):
+            if block in SECT.SPECIALS:
+                count = index
+                break
+        self._difat = difat[:count]
+        return self._difat
+
+    def getBFAT(self):
+        """
+        Get the big block FAT decoded: array, entry n is the sector
+        following sector n
+        """
+        try:
+            return self._bfat
+        except AttributeError:
+            pass
+        self._bfat = decodeSects(self.readSectors(self.getDIFAT()))
+        return self._bfat
+
+    def getSFAT(self):
+        """
+        Get the small block FAT decoded: array, entry n is the small sector
+        following small sector n
+        """
+        try:
+            return self._sfat
+        except AttributeError:
+            pass
+        chain = list(self.getChain(self["header/sb_start"].value))
+        self._sfat = decodeSects(self.readSectors(chain))
+        return self._sfat
+
+    def getDirectory(self):
+        """
+        Read the directory: list of DirectoryEntry, the first entry is the
+        root entry. Unused entries are skipped.
+        """
+        try:
+            return self._directory
+        except AttributeError:
+            pass
+        version = self["header/ver_maj"].value
+        data = self.readSectors(self.getChain(self["header/bb_start"].value))
+        entries = []
+        for index in range(len(data) // 128):
+            entry = DirectoryEntry(index, data[index * 128:(index + 1) * 128],
+                                   version)
+            if entry.type:
+                entries.append(entry)
+        self._directory = entries
+        return self._directory
+
+    def getStreamExtents(self, entry):
+        """
+        Get the content of a directory entry (DirectoryEntry) as a list of
+        (offset, size) in bytes. If the stream is stored in small blocks,
+        offsets are relative to the content of the root entry (the
+        mini stream).
+        """
+        if self.isSmallStream(entry):
+            ss_size = 1 << self["header/sb_shift"].value
+            blocks = self.getChain(entry.start, use_sfat=True)
+            extents = self.getSectorExtents(blocks, ss_size, 0)
+        else:
+            extents = self.getSectorExtents(self.getChain(entry.start))
+        size = entry.size
+        result = []
+        for offset, length in extents:
+            if size <= 0:
+                break
+            length = min(length, size)
+            result.append((offset, length))
+            size -= length
+        return result
+
+    def isSmallStream(self, entry):
+        return entry.index != 0 \
+            and entry.size < self["header/threshold"].value
+
+    def openStream(self, entry):
+        """
+        Open the content of a directory entry (DirectoryEntry):
+        ExtentStream which only reads the sectors of the stream. Raise
+        a NullStreamError for an empty stream.
+        """
+        stream = self.stream
+        if self.isSmallStream(entry):
+            stream = self.openStream(self.getDirectory()[0])
+        return ExtentStream(stream, self.getStreamExtents(entry), entry.size,
+                            source="%s:%s" % (self.stream.source, entry.name))
+
+    def readStream(self, entry):
+        """
+        Read the content of a directory entry (bytes)
+        """
+        if not entry.size:
+            return b""
+        return self.openStream(entry).readBytes(0, entry.size)
 
     def readBFAT(self):
         self.bb_fat = []
@@ -374,15 +565,12 @@ class OLE2_File(HachoirParser, RootSeekableFieldSet):
 
     def createContentSize(self):
         max_block = 0
-        for fat in self.array("bbfat"):
-            for entry in fat:
-                block = entry.value
-                if block not in SECT.SPECIALS:
-                    max_block = max(block, max_block)
-        if max_block in SECT.SPECIALS:
-            return None
-        else:
-            return HEADER_SIZE + (max_block + 1) * self.sector_size
+        for block in self.getBFAT():
+            if block not in SECT.SPECIALS and max_block < block:
+                max_block = block
+        # The header uses the first sector
+        return (max_block + 2) * self.getSectorSize() * 8
 
     def seekBlock(self, block):
-        self.seekBit(HEADER_SIZE + block * self.sector_size)
+        # The header uses the first sector
+        self.seekBit((block + 1) * self.sector_size)
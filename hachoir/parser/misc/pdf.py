@@ -2,6 +2,9 @@
 Adobe Portable Document Format (PDF) parser.
 
 Author: Christophe Gisquet <christophe.gisquet@free.fr>
+
+Objects can also be read by number without parsing the body, using the
+cross-reference sections: see PDFDocument.getObjectReader().
 """
 
 from hachoir.parser import Parser
@@ -14,6 +17,10 @@ from hachoir.field import (
     RawBytes)
 from hachoir.core.endian import LITTLE_ENDIAN
 from hachoir.core.text_handler import textHandler, hexadecimal
+from array import array
+from collections import OrderedDict, namedtuple
+from zlib import decompressobj, error as ZlibError
+import re
 
 MAGIC = b"%PDF-"
 ENDMAGIC = b"%%EOF"
@@ -393,7 +400,7 @@ class CrossReferenceTable(FieldSet):
         pos = self.stream.searchBytesLength(Trailer.MAGIC, False)
         if pos is None:
             raise ParserError("Can't find '%s' starting at %u"
-                              (Trailer.MAGIC, self.absolute_address // 8))
+                              % (Trailer.MAGIC, self.absolute_address // 8))
         self._size = 8 * pos - self.absolute_address
 
     def createFields(self):
@@ -473,6 +480,749 @@ class Trailer(FieldSet):
         yield LineEnd(self, "line_end[]")
 
 
+# Number of bytes read at the end of the document to find "startxref"
+TAIL_SIZE = 1024
+# Size in bytes of the blocks read by PDFLexer
+READ_SIZE = 4096
+# Number of objects and of decoded object streams kept in memory
+OBJECT_CACHE_SIZE = 1024
+OBJECT_STREAM_CACHE_SIZE = 16
+# Highest object number (implementation limit of PDF 1.7)
+MAX_OBJECT_NUMBER = 8388607
+MAX_REFERENCE_DEPTH = 32
+
+# Types of the cross-reference entries
+XREF_FREE = 0
+XREF_OFFSET = 1
+XREF_COMPRESSED = 2
+XREF_UNKNOWN = 0xFF
+XREF_ENTRY_SIZE = 20
+
+SPACE_REGEX = re.compile(rb"(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*")
+TOKEN_REGEX = re.compile(rb"[^\x00\t\n\x0c\r ()<>\[\]{}/%]*")
+REFERENCE_REGEX = re.compile(
+    rb"[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])")
+NAME_ESCAPE_REGEX = re.compile(rb"#([0-9A-Fa-f]{2})")
+STRING_SPECIAL_REGEX = re.compile(rb"[()\\\r]")
+HEX_SPACE_REGEX = re.compile(rb"[\x00\t\n\x0c\r ]+")
+STARTXREF_REGEX = re.compile(rb"startxref[\x00\t\n\x0c\r ]*(\d+)")
+XREF_ENTRY_REGEX = re.compile(rb"(\d{10}) (\d{5}) ([nf])[\r\n ]{0,2}")
+STRING_ESCAPES = {ord("n"): 0x0A, ord("r"): 0x0D, ord("t"): 0x09,
+                  ord("b"): 0x08, ord("f"): 0x0C}
+
+# Indirect reference ("12 0 R")
+PDFReference = namedtuple("PDFReference", "number generation")
+
+
+class PDFStream:
+    """
+    Stream object: dictionary and offset in bytes of the encoded data
+    (see PDFObjectReader.getStreamData())
+    """
+    __slots__ = ("dictionary", "offset")
+
+    def __init__(self, dictionary, offset):
+        self.dictionary = dictionary
+        self.offset = offset
+
+    def __getitem__(self, key):
+        return self.dictionary[key]
+
+    def get(self, key, default=None):
+        return self.dictionary.get(key, default)
+
+    def __repr__(self):
+        return "<PDFStream offset=%s %r>" % (self.offset, self.dictionary)
+
+
+def decodeTextString(data):
+    """
+    Decode a PDF text string (bytes): UTF-16 or UTF-8 if it starts with
+    a byte order mark, PDFDocEncoding (read as ISO-8859-1) otherwise
+    """
+    if data.startswith(b"\xFE\xFF"):
+        return data[2:].decode("utf-16-be", "replace")
+    if data.startswith(b"\xEF\xBB\xBF"):
+        return data[3:].decode("utf-8", "replace")
+    return data.decode("iso-8859-1")
+
+
+def decodePngPredictor(data, columns, colors=1, bits=8):
+    """
+    Undo the PNG predictors (Predictor >= 10) of decoded stream data:
+    each row starts with the number of its filter
+    """
+    bpp = max(1, colors * bits // 8)
+    width = (columns * colors * bits + 7) // 8
+    result = bytearray()
+    previous = bytearray(width)
+    for start in range(0, len(data) - width, width + 1):
+        method = data[start]
+        row = bytearray(data[start + 1:start + 1 + width])
+        if method == 1:
+            for index in range(bpp, width):
+                row[index] = (row[index] + row[index - bpp]) & 0xFF
+        elif method == 2:
+            for index in range(width):
+                row[index] = (row[index] + previous[index]) & 0xFF
+        elif method == 3:
+            for index in range(width):
+                left = row[index - bpp] if bpp <= index else 0
+                row[index] = (row[index] + (left + previous[index]) // 2) & 0xFF
+        elif method == 4:
+            for index in range(width):
+                if bpp <= index:
+                    left = row[index - bpp]
+                    upper_left = previous[index - bpp]
+                else:
+                    left = upper_left = 0
+                up = previous[index]
+                estimate = left + up - upper_left
+                dleft = abs(estimate - left)
+                dup = abs(estimate - up)
+                dupper_left = abs(estimate - upper_left)
+                if dleft <= dup and dleft <= dupper_left:
+                    value = left
+                elif dup <= dupper_left:
+                    value = up
+                else:
+                    value = upper_left
+                row[index] = (row[index] + value) & 0xFF
+        elif method:
+            raise ParserError("Invalid PNG predictor: %s" % method)
+        result += row
+        previous = row
+    return bytes(result)
+
+
+def decodeStreamData(data, filters, parameters):
+    """
+    Decode the data of a stream: filters is the list of the filter names,
+    parameters the list of their parameters (dictionary or None). Only
+    FlateDecode is supported.
+    """
+    for name, params in zip(filters, parameters):
+        if name not in ("FlateDecode", "Fl"):
+            raise ParserError("Unsupported PDF filter: %s" % name)
+        try:
+            data = decompressobj().decompress(data)
+        except ZlibError as err:
+            raise ParserError("Invalid FlateDecode data: %s" % err)
+        if not isinstance(params, dict):
+            continue
+        predictor = params.get("Predictor", 1)
+        if not isinstance(predictor, int):
+            raise ParserError("Invalid PDF predictor: %r" % (predictor,))
+        if 10 <= predictor:
+            data = decodePngPredictor(data, params.get("Columns", 1),
+                                      params.get("Colors", 1),
+                                      params.get("BitsPerComponent", 8))
+        elif predictor != 1:
+            raise ParserError("Unsupported PDF predictor: %s" % predictor)
+    return data
+
+
+class PDFLexer:
+    """
+    Parser of the PDF object syntax. Data is read from the input stream
+    by blocks of READ_SIZE bytes starting at offset (in bytes), or from
+    data if stream is None (content of an object stream).
+
+    Values are read as Python objects: None, bool, int, float, bytes
+    (string), str (name), list (array), dict (dictionary), PDFReference
+    and PDFStream.
+    """
+
+    def __init__(self, stream, offset, data=b""):
+        self.stream = stream
+        if stream is not None:
+            self.end = stream.size // 8
+            self.base = offset
+            self.pos = 0
+        else:
+            self.end = len(data)
+            self.base = 0
+            self.pos = offset
+        self.data = data
+
+    def tell(self):
+        """
+        Current offset in bytes
+        """
+        return self.base + self.pos
+
+    def _more(self, size=READ_SIZE):
+        if self.stream is None:
+            return False
+        start = self.base + len(self.data)
+        size = min(size, self.end - start)
+        if size <= 0:
+            return False
+        data = self.data
+        if READ_SIZE <= self.pos:
+            # Drop the parsed data
+            data = data[self.pos:]
+            self.base += self.pos
+            self.pos = 0
+        self.data = data + self.stream.readBytes(start * 8, size)
+        return True
+
+    def ensure(self, size):
+        """
+        Read data until size bytes are available at the current offset:
+        return False if the end of the data is reached before
+        """
+        while len(self.data) - self.pos < size:
+            if not self._more(max(READ_SIZE, size - len(self.data) + self.pos)):
+                return False
+        return True
+
+    def peek(self, size):
+        self.ensure(size)
+        return self.data[self.pos:self.pos + size]
+
+    def skipSpace(self):
+        """
+        Skip white spaces and comments
+        """
+        while True:
+            end = SPACE_REGEX.match(self.data, self.pos).end()
+            if end < len(self.data) or not self._more():
+                self.pos = end
+                return
+
+    def readToken(self):
+        """
+        Read a sequence of regular characters (number, keyword, name)
+        """
+        while True:
+            end = TOKEN_REGEX.match(self.data, self.pos).end()
+            if end < len(self.data) or not self._more():
+                break
+        token = self.data[self.pos:end]
+        self.pos = end
+        return token
+
+    def readInteger(self):
+        self.skipSpace()
+        offset = self.tell()
+        token = self.readToken()
+        try:
+            return int(token)
+        except ValueError:
+            raise ParserError("Invalid PDF integer %r at offset %s"
+                              % (token, offset))
+
+    def readObject(self):
+        """
+        Read a direct object or a reference
+        """
+        self.skipSpace()
+        chars = self.peek(2)
+        char = chars[:1]
+        if not char:
+            raise ParserError("Unexpected end of PDF data at offset %s"
+                              % self.tell())
+        if char == b"/":
+            self.pos += 1
+            return self.readName()
+        if chars == b"<<":
+            self.pos += 2
+            return self.readDictionary()
+        if char == b"<":
+            self.pos += 1
+            return self.readHexString()
+        if char == b"(":
+            self.pos += 1
+            return self.readLiteralString()
+        if char == b"[":
+            self.pos += 1
+            return self.readArray()
+        offset = self.tell()
+        token = self.readToken()
+        if not token:
+            raise ParserError("Unexpected %r in PDF data at offset %s"
+                              % (char, offset))
+        if token[:1] in b"+-.0123456789":
+            try:
+                value = int(token)
+            except ValueError:
+                try:
+                    return float(token)
+                except ValueError:
+                    raise ParserError("Invalid PDF number %r at offset %s"
+                                      % (token, offset))
+            self.ensure(32)
+            match = REFERENCE_REGEX.match(self.data, self.pos)
+            if match is not None and 0 <= value:
+                self.pos = match.end()
+                return PDFReference(value, int(match.group(1)))
+            return value
+        if token == b"true":
+            return True
+        if token == b"false":
+            return False
+        if token == b"null":
+            return None
+        raise ParserError("Unexpected PDF keyword %r at offset %s"
+                          % (token, offset))
+
+    def readName(self):
+        name = NAME_ESCAPE_REGEX.sub(lambda match: bytes((int(match.group(1), 16),)),
+                                     self.readToken())
+        return name.decode("iso-8859-1")
+
+    def readDictionary(self):
+        dictionary = {}
+        while True:
+            self.skipSpace()
+            if self.peek(2) == b">>":
+                self.pos += 2
+                return dictionary
+            offset = self.tell()
+            key = self.readObject()
+            if not isinstance(key, str):
+                raise ParserError("Invalid PDF dictionary key at offset %s"
+                                  % offset)
+            dictionary[key] = self.readObject()
+
+    def readArray(self):
+        values = []
+        while True:
+            self.skipSpace()
+            if self.peek(1) == b"]":
+                self.pos += 1
+                return values
+            values.append(self.readObject())
+
+    def readHexString(self):
+        offset = self.tell()
+        while True:
+            end = self.data.find(b">", self.pos)
+            if 0 <= end or not self._more():
+                break
+        if end < 0:
+            raise ParserError("Unterminated PDF string at offset %s" % offset)
+        content = HEX_SPACE_REGEX.sub(b"", self.data[self.pos:end])
+        self.pos = end + 1
+        if len(content) % 2:
+            content += b"0"
+        try:
+            return bytes.fromhex(content.decode("ascii"))
+        except ValueError:
+            raise ParserError("Invalid PDF string at offset %s" % offset)
+
+    def readLiteralString(self):
+        result = bytearray()
+        depth = 1
+        while True:
+            if not self.ensure(1):
+                raise ParserError("Unterminated PDF string")
+            data = self.data
+            pos = self.pos
+            match = STRING_SPECIAL_REGEX.search(data, pos)
+            if match is None:
+                result += data[pos:]
+                self.pos = len(data)
+                continue
+            index = match.start()
+            result += data[pos:index]
+            char = data[index]
+            self.pos = index + 1
+            if char == 0x28:   # "("
+                depth += 1
+                result.append(char)
+            elif char == 0x29:   # ")"
+                depth -= 1
+                if not depth:
+                    return bytes(result)
+                result.append(char)
+            elif char == 0x0D:
+                # CR and CR LF are read as LF
+                result.append(0x0A)
+                if self.peek(1) == b"\n":
+                    self.pos += 1
+            else:
+                self.readEscape(result)
+
+    def readEscape(self, result):
+        chars = self.peek(3)
+        if not chars:
+            raise ParserError("Unterminated PDF string")
+        char = chars[0]
+        self.pos += 1
+        if char in STRING_ESCAPES:
+            result.append(STRING_ESCAPES[char])
+        elif 0x30 <= char <= 0x37:
+            code = char - 0x30
+            for char in chars[1:]:
+                if not (0x30 <= char <= 0x37):
+                    break
+                code = code * 8 + char - 0x30
+                self.pos += 1
+            result.append(code & 0xFF)
+        elif char == 0x0D:
+            # Line continuation
+            if chars[1:2] == b"\n":
+                self.pos += 1
+        elif char != 0x0A:
+            result.append(char)
+
+    def readIndirectObject(self):
+        """
+        Read an indirect object ("12 0 obj ... endobj"): return
+        (number, generation, value). The value of a stream object is
+        a PDFStream.
+        """
+        number = self.readInteger()
+        generation = self.readInteger()
+        self.skipSpace()
+        offset = self.tell()
+        if self.readToken() != b"obj":
+            raise ParserError("Invalid PDF object header at offset %s"
+                              % offset)
+        value = self.readObject()
+        if isinstance(value, dict):
+            self.skipSpace()
+            if self.peek(6) == b"stream":
+                self.pos += 6
+                end_of_line = self.peek(2)
+                if end_of_line == b"\r\n":
+                    self.pos += 2
+                elif end_of_line[:1] in (b"\n", b"\r"):
+                    self.pos += 1
+                value = PDFStream(value, self.tell())
+        return number, generation, value
+
+
+class PDFObjectReader:
+    """
+    Random access to the objects of a PDF document, without parsing
+    the body:
+
+        reader = parser.getObjectReader()
+        info = reader.getInfo()
+        count = reader.getPageCount()
+
+    The offset of the last cross-reference section is read from
+    "startxref" at the end of the document. Cross-reference tables and
+    cross-reference streams of all incremental updates (Prev chain) are
+    decoded once into arrays indexed by object number, the newest entry of
+    an object wins. Objects are only read when requested (getObject()),
+    including objects compressed in object streams, so the amount of data
+    read does not depend on the size of the document.
+
+    Encrypted documents are not decrypted: strings and streams are
+    returned encrypted.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.stream = parser.stream
+        # Object number => entry type, offset in bytes (or number of
+        # the object stream) and generation (or index in the object stream)
+        self.types = array("B")
+        self.offsets = array("Q")
+        self.generations = array("L")
+        self.trailer = {}
+        self.sections = []
+        self._objects = OrderedDict()
+        self._object_streams = OrderedDict()
+        self._readSections(self.findStartXref())
+
+    def findStartXref(self):
+        """
+        Get the offset in bytes of the last cross-reference section
+        """
+        size = self.stream.size // 8
+        start = max(size - TAIL_SIZE, 0)
+        tail = self.stream.readBytes(start * 8, size - start)
+        index = tail.rfind(b"startxref")
+        match = STARTXREF_REGEX.match(tail, index)
+        if index < 0 or match is None:
+            raise ParserError("Unable to find startxref")
+        return int(match.group(1))
+
+    def _readSections(self, offset):
+        while offset is not None:
+            if offset in self.sections:
+                self.parser.warning("Loop in the cross-reference sections")
+                break
+            free_numbers = set()
+            trailer = self.readSection(offset, free_numbers)
+            # Hybrid-reference file: the entries of the cross-reference
+            # stream are read after the table of the same section. Objects
+            # of object streams are free in the table (for old readers):
+            # the stream overrides these entries.
+            stream_offset = trailer.get("XRefStm")
+            if isinstance(stream_offset, int) \
+                    and stream_offset not in self.sections:
+                self.readSection(stream_offset, free_numbers)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get("Prev")
+            if not isinstance(offset, int):
+                offset = None
+
+    def readSection(self, offset, free_numbers=None):
+        """
+        Read the cross-reference section (table or stream) at offset in
+        bytes: return its trailer dictionary. Entries of objects which
+        have already been read are ignored.
+
+        free_numbers is an optional set: a table adds the numbers of the
+        free entries that it reads, a stream overrides the free entries of
+        these numbers.
+        """
+        if not (0 <= offset < self.stream.size // 8):
+            raise ParserError("Invalid cross-reference offset: %s" % offset)
+        self.sections.append(offset)
+        lexer = PDFLexer(self.stream, offset)
+        lexer.skipSpace()
+        if lexer.peek(4) == CrossReferenceTable.MAGIC:
+            lexer.pos += 4
+            return self._readTable(lexer, free_numbers)
+        number, generation, value = lexer.readIndirectObject()
+        if not isinstance(value, PDFStream) or value.get("Type") != "XRef":
+            raise ParserError("No cross-reference section at offset %s"
+                              % offset)
+        self._readStream(value, free_numbers)
+        return value.dictionary
+
+    def _reserve(self, start, count):
+        if start < 0 or MAX_OBJECT_NUMBER < start + count - 1:
+            raise ParserError("Invalid object numbers: %s..%s"
+                              % (start, start + count - 1))
+        missing = start + count - len(self.types)
+        if 0 < missing:
+            self.types.frombytes(bytes((XREF_UNKNOWN,)) * missing)
+            self.offsets.frombytes(bytes(self.offsets.itemsize * missing))
+            self.generations.frombytes(bytes(self.generations.itemsize * missing))
+
+    def _readTable(self, lexer, free_numbers):
+        while True:
+            lexer.skipSpace()
+            offset = lexer.tell()
+            token = lexer.readToken()
+            if token == Trailer.MAGIC:
+                break
+            try:
+                start = int(token)
+            except ValueError:
+                raise ParserError("Invalid cross-reference subsection "
+                                  "at offset %s" % offset)
+            count = lexer.readInteger()
+            lexer.skipSpace()
+            if count < 0 or not lexer.ensure(count * (XREF_ENTRY_SIZE - 1)):
+                raise ParserError("Truncated cross-reference subsection "
+                                  "at offset %s" % offset)
+            self._reserve(start, count)
+            types = self.types
+            for number in range(start, start + count):
+                lexer.ensure(XREF_ENTRY_SIZE)
+                match = XREF_ENTRY_REGEX.match(lexer.data, lexer.pos)
+                if match is None:
+                    raise ParserError("Invalid cross-reference entry "
+                                      "at offset %s" % lexer.tell())
+                lexer.pos = match.end()
+                if types[number] != XREF_UNKNOWN:
+                    continue
+                if match.group(3) == b"n":
+                    types[number] = XREF_OFFSET
+                    self.offsets[number] = int(match.group(1))
+                    self.generations[number] = int(match.group(2))
+                else:
+                    types[number] = XREF_FREE
+                    if free_numbers is not None:
+                        free_numbers.add(number)
+        trailer = lexer.readObject()
+        if not isinstance(trailer, dict):
+            raise ParserError("Invalid trailer at offset %s" % lexer.tell())
+        return trailer
+
+    def _readStream(self, stream, free_numbers):
+        widths = stream.get("W")
+        if not isinstance(widths, list) or len(widths) != 3 \
+                or not all(isinstance(width, int) and 0 <= width
+                           for width in widths):
+            raise ParserError("Invalid cross-reference stream widths: %r"
+                              % (widths,))
+        entry_size = sum(widths)
+        if not entry_size:
+            raise ParserError("Empty cross-reference stream entries")
+        index = stream.get("Index", [0, stream.get("Size")])
+        data = self.getStreamData(stream)
+        type_end = widths[0]
+        offset_end = type_end + widths[1]
+        types = self.types
+        pos = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            if not isinstance(start, int) or not isinstance(count, int):
+                raise ParserError("Invalid cross-reference stream index")
+            count = min(count, (len(data) - pos) // entry_size)
+            self._reserve(start, count)
+            for number in range(start, start + count):
+                entry = data[pos:pos + entry_size]
+                pos += entry_size
+                if types[number] != XREF_UNKNOWN \
+                        and not (free_numbers and number in free_numbers):
+                    continue
+                if type_end:
+                    entry_type = int.from_bytes(entry[:type_end], "big")
+                else:
+                    entry_type = XREF_OFFSET
+                if entry_type in (XREF_OFFSET, XREF_COMPRESSED):
+                    types[number] = entry_type
+                    self.offsets[number] = int.from_bytes(entry[type_end:offset_end], "big")
+                    self.generations[number] = int.from_bytes(entry[offset_end:], "big")
+                else:
+                    types[number] = XREF_FREE
+
+    def getStreamData(self, stream):
+        """
+        Read and decode the data of a stream (PDFStream)
+        """
+        length = self.resolve(stream.get("Length"))
+        if not isinstance(length, int) or length < 0:
+            raise ParserError("Invalid PDF stream length: %r" % (length,))
+        length = min(length, self.stream.size // 8 - stream.offset)
+        data = self.stream.readBytes(stream.offset * 8, length)
+        filters = self.resolve(stream.get("Filter"))
+        if filters is None:
+            return data
+        parameters = self.resolve(stream.get("DecodeParms"))
+        if not isinstance(filters, list):
+            filters = [filters]
+            parameters = [parameters]
+        elif not isinstance(parameters, list):
+            parameters = [parameters] * len(filters)
+        return decodeStreamData(data, filters, parameters)
+
+    def getObjectOffset(self, number):
+        """
+        Get the offset in bytes of the object number, None if the object
+        is free, unknown or compressed in an object stream
+        """
+        if 0 <= number < len(self.types) \
+                and self.types[number] == XREF_OFFSET:
+            return self.offsets[number]
+        return None
+
+    def getObject(self, number):
+        """
+        Read the object number: None if the object is free or unknown
+        (a reference to such object is a reference to the null object)
+        """
+        try:
+            value = self._objects[number]
+            self._objects.move_to_end(number)
+            return value
+        except KeyError:
+            pass
+        if not (0 <= number < len(self.types)):
+            return None
+        entry_type = self.types[number]
+        if entry_type == XREF_OFFSET:
+            offset = self.offsets[number]
+            found, generation, value = PDFLexer(self.stream, offset).readIndirectObject()
+            if found != number:
+                raise ParserError("Object %s not found at offset %s"
+                                  % (number, offset))
+        elif entry_type == XREF_COMPRESSED:
+            value = self._readCompressedObject(number)
+        else:
+            value = None
+        self._objects[number] = value
+        if OBJECT_CACHE_SIZE < len(self._objects):
+            self._objects.popitem(last=False)
+        return value
+
+    def _getObjectStream(self, number):
+        try:
+            content = self._object_streams[number]
+            self._object_streams.move_to_end(number)
+            return content
+        except KeyError:
+            pass
+        # Object streams can not be stored in an object stream
+        if self.getObjectOffset(number) is None:
+            raise ParserError("Invalid object stream: %s" % number)
+        stream = self.getObject(number)
+        if not isinstance(stream, PDFStream) or stream.get("Type") != "ObjStm":
+            raise ParserError("Object %s is not an object stream" % number)
+        count = stream.get("N")
+        first = stream.get("First")
+        if not isinstance(count, int) or not isinstance(first, int):
+            raise ParserError("Invalid object stream: %s" % number)
+        data = self.getStreamData(stream)
+        lexer = PDFLexer(None, 0, data)
+        objects = [(lexer.readInteger(), lexer.readInteger())
+                   for index in range(count)]
+        content = (objects, first, data)
+        self._object_streams[number] = content
+        if OBJECT_STREAM_CACHE_SIZE < len(self._object_streams):
+            self._object_streams.popitem(last=False)
+        return content
+
+    def _readCompressedObject(self, number):
+        objects, first, data = self._getObjectStream(self.offsets[number])
+        index = self.generations[number]
+        if not (index < len(objects)) or objects[index][0] != number:
+            raise ParserError("Object %s not found in object stream %s"
+                              % (number, self.offsets[number]))
+        return PDFLexer(None, first + objects[index][1], data).readObject()
+
+    def resolve(self, value):
+        """
+        Get the object of a reference (PDFReference), or value if it is
+        not a reference
+        """
+        depth = 0
+        while isinstance(value, PDFReference):
+            depth += 1
+            if MAX_REFERENCE_DEPTH < depth:
+                raise ParserError("Too many indirect references")
+            value = self.getObject(value.number)
+        return value
+
+    def getCatalog(self):
+        """
+        Get the document catalog (dictionary)
+        """
+        catalog = self.resolve(self.trailer.get("Root"))
+        if not isinstance(catalog, dict):
+            raise ParserError("Invalid PDF document catalog")
+        return catalog
+
+    def getPageCount(self):
+        """
+        Get the number of pages from the root of the page tree
+        """
+        pages = self.resolve(self.getCatalog().get("Pages"))
+        if not isinstance(pages, dict):
+            raise ParserError("Invalid PDF page tree")
+        count = self.resolve(pages.get("Count"))
+        if not isinstance(count, int):
+            raise ParserError("Invalid PDF page count: %r" % (count,))
+        return count
+
+    def getInfo(self):
+        """
+        Get the document information dictionary: text strings are decoded,
+        empty dictionary if the document has no information dictionary
+        """
+        info = self.resolve(self.trailer.get("Info"))
+        if not isinstance(info, dict):
+            return {}
+        values = {}
+        for key, value in info.items():
+            value = self.resolve(value)
+            if isinstance(value, bytes):
+                value = decodeTextString(value)
+            values[key] = value
+        return values
+
+
 class PDFDocument(Parser):
     endian = LITTLE_ENDIAN
     PARSER_TAGS = {
@@ -500,3 +1250,15 @@ class PDFDocument(Parser):
         yield Body(self, "body")
         yield CrossReferenceTable(self, "cross_ref_table")
         yield Trailer(self, "trailer")
+
+    def getObjectReader(self):
+        """
+        Get the object reader using the cross-reference sections
+        (PDFObjectReader)
+        """
+        try:
+            return self._object_reader
+        except AttributeError:
+            pass
+        self._object_reader = PDFObjectReader(self)
+        return self._object_reader
@@ -1 +1,2 @@
 from hachoir.parser.network.tcpdump import TcpdumpFile  # noqa
+from hachoir.parser.network.pcapng import PcapNgFile  # noqa
@@ -2,32 +2,7 @@ from hachoir.field import FieldSet, Field, Bits
 from hachoir.core.bits import str2hex
 from hachoir.parser.network.ouid import REGISTERED_OUID
 from hachoir.core.endian import BIG_ENDIAN
-from socket import gethostbyaddr, herror as socket_host_error
-
-
-def ip2name(addr):
-    if not ip2name.resolve:
-        return addr
-    try:
-        if addr in ip2name.cache:
-            return ip2name.cache[addr]
-        # FIXME: Workaround Python bug
-        # Need double try/except to catch the bug
-        try:
-            name = gethostbyaddr(addr)[0]
-        except KeyboardInterrupt:
-            raise
-    except (socket_host_error, ValueError):
-        name = addr
-    except (socket_host_error, KeyboardInterrupt, ValueError):
-        ip2name.resolve = False
-        name = addr
-    ip2name.cache[addr] = name
-    return name
-
-
-ip2name.cache = {}
-ip2name.resolve = True
+from hachoir.parser.network.resolver import ip2name
 
 
 class IPv4_Address(Field):
@@ -39,7 +14,8 @@ class IPv4_Address(Field):
         value = self._parent.stream.readBytes(self.absolute_address, 4)
         return ".".join("%u" % byte for byte in value)
 
-    def createDisplay(self):
+    def _getDisplay(self):
+        # Not cached: the name can be resolved later
         return ip2name(self.value)
 
 
@@ -0,0 +1,656 @@
+"""
+Pcap-ng (pcapng) parser: capture file format of Wireshark and dumpcap.
+
+Packets are parsed using the layers of the tcpdump parser.
+
+Source:
+ * PCAP Next Generation (pcapng) Capture File Format
+   https://github.com/pcapng/pcapng
+
+Creation: 19 october 2026
+"""
+
+from hachoir.parser import Parser
+from hachoir.field import (FieldSet, Enum, RawBytes, PaddingBytes, String,
+                           UInt8, UInt16, UInt32, UInt64, Int64,
+                           createOrphanField)
+from hachoir.core.endian import LITTLE_ENDIAN, BIG_ENDIAN
+from hachoir.core.text_handler import textHandler, hexadecimal
+from hachoir.core.tools import paddingSize, UNIX_TIMESTAMP_T0
+from hachoir.parser.network.common import IPv4_Address
+from hachoir.parser.network.tcpdump import TcpdumpFile
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
+import struct
+
+SECTION_HEADER = 0x0A0D0D0A
+INTERFACE_DESCRIPTION = 0x00000001
+OBSOLETE_PACKET = 0x00000002
+SIMPLE_PACKET = 0x00000003
+NAME_RESOLUTION = 0x00000004
+INTERFACE_STATISTICS = 0x00000005
+ENHANCED_PACKET = 0x00000006
+
+BLOCK_TYPE_NAME = {
+    SECTION_HEADER: "Section header",
+    INTERFACE_DESCRIPTION: "Interface description",
+    OBSOLETE_PACKET: "Packet (obsolete)",
+    SIMPLE_PACKET: "Simple packet",
+    NAME_RESOLUTION: "Name resolution",
+    INTERFACE_STATISTICS: "Interface statistics",
+    ENHANCED_PACKET: "Enhanced packet",
+    0x0000000A: "Decryption secrets",
+    0x00000BAD: "Custom (copiable)",
+    0x40000BAD: "Custom",
+}
+
+# Byte order magic => endian
+BYTE_ORDER_MAGIC = {
+    b"\x4d\x3c\x2b\x1a": LITTLE_ENDIAN,
+    b"\x1a\x2b\x3c\x4d": BIG_ENDIAN,
+}
+
+OPT_ENDOFOPT = 0
+OPT_COMMENT = 1
+OPT_IF_TSRESOL = 9
+
+COMMON_OPTIONS = {
+    OPT_ENDOFOPT: "End of options",
+    OPT_COMMENT: "Comment",
+    2988: "Custom (UTF-8, copiable)",
+    2989: "Custom (copiable)",
+    19372: "Custom (UTF-8)",
+    19373: "Custom",
+}
+
+
+def optionNames(names):
+    result = dict(COMMON_OPTIONS)
+    result.update(names)
+    return result
+
+
+class Option(FieldSet):
+
+    def __init__(self, parent, name):
+        FieldSet.__init__(self, parent, name)
+        length = self["length"].value
+        self._size = (4 + length + paddingSize(length, 4)) * 8
+
+    def createFields(self):
+        yield Enum(UInt16(self, "code", "Option code"), self.parent.OPTION_NAME)
+        yield UInt16(self, "length", "Value length")
+        code = self["code"].value
+        length = self["length"].value
+        if not length:
+            return
+        if code == OPT_COMMENT or code in self.parent.TEXT_OPTIONS:
+            yield String(self, "value", length, charset="UTF-8", strip="\0")
+        elif code in self.parent.TIMESTAMP_OPTIONS and length == 8:
+            yield UInt32(self, "ts_high", "Timestamp (high)")
+            yield UInt32(self, "ts_low", "Timestamp (low)")
+        elif length == 1:
+            yield UInt8(self, "value")
+        elif length == 2:
+            yield UInt16(self, "value")
+        elif length == 4:
+            yield UInt32(self, "value")
+        elif length == 8:
+            yield UInt64(self, "value")
+        else:
+            yield RawBytes(self, "value", length)
+        size = paddingSize(length, 4)
+        if size:
+            yield PaddingBytes(self, "padding", size)
+
+    def createDescription(self):
+        text = "Option: %s" % self["code"].display
+        if "value" in self:
+            text += " = %s" % self["value"].display
+        return text
+
+
+class Block(FieldSet):
+    """
+    Generic block: the body of unknown blocks is kept as raw bytes
+    """
+    OPTION_NAME = COMMON_OPTIONS
+    TEXT_OPTIONS = ()
+    TIMESTAMP_OPTIONS = ()
+    has_options = False
+
+    def __init__(self, *args, **kw):
+        FieldSet.__init__(self, *args, **kw)
+        self._size = self["block_length"].value * 8
+
+    def createFields(self):
+        yield Enum(textHandler(UInt32(self, "block_type", "Block type"),
+                               hexadecimal), BLOCK_TYPE_NAME)
+        yield UInt32(self, "block_length", "Block total length")
+        yield from self.createBody()
+        if self.has_options:
+            while self.current_size < self.size - 32:
+                option = Option(self, "option[]")
+                yield option
+                if option["code"].value == OPT_ENDOFOPT:
+                    break
+        size = (self.size - self.current_size) // 8 - 4
+        if size:
+            yield RawBytes(self, "data", size)
+        yield UInt32(self, "block_length2", "Block total length")
+
+    def createBody(self):
+        return ()
+
+    def createDescription(self):
+        return self["block_type"].display
+
+    def getOption(self, code):
+        """
+        Get the option field with the specified code, or None
+        """
+        for field in self:
+            if isinstance(field, Option) and field["code"].value == code:
+                return field
+        return None
+
+
+class SectionHeader(Block):
+    OPTION_NAME = optionNames({
+        2: "Hardware",
+        3: "Operating system",
+        4: "User application",
+    })
+    TEXT_OPTIONS = (2, 3, 4)
+    has_options = True
+
+    def createBody(self):
+        yield textHandler(UInt32(self, "byte_order_magic", "Byte order magic"), hexadecimal)
+        yield UInt16(self, "major_version", "Major version")
+        yield UInt16(self, "minor_version", "Minor version")
+        yield Int64(self, "section_length", "Section length (-1 if unknown)")
+
+    def createDescription(self):
+        return "Section header (version %s.%s)" % (
+            self["major_version"].value, self["minor_version"].value)
+
+
+class InterfaceDescription(Block):
+    OPTION_NAME = optionNames({
+        2: "Name",
+        3: "Description",
+        4: "IPv4 address",
+        5: "IPv6 address",
+        6: "MAC address",
+        7: "EUI address",
+        8: "Speed (bits per second)",
+        9: "Timestamp resolution",
+        10: "Time zone",
+        11: "Filter",
+        12: "Operating system",
+        13: "FCS length",
+        14: "Timestamp offset",
+        15: "Hardware",
+    })
+    TEXT_OPTIONS = (2, 3, 12, 15)
+    has_options = True
+
+    def createBody(self):
+        yield Enum(UInt16(self, "link_type", "Link type"), TcpdumpFile.LINK_TYPE_DESC)
+        yield UInt16(self, "reserved", "Reserved")
+        yield UInt32(self, "snap_len", "Maximum number of captured bytes per packet")
+
+    def createDescription(self):
+        return "Interface description: %s" % self["link_type"].display
+
+
+class Frame(FieldSet):
+    """
+    Captured data of a packet, parsed using the layers of the link type
+    """
+
+    def __init__(self, parent, name, size, link_type):
+        FieldSet.__init__(self, parent, name, size=size * 8)
+        self.link_type = link_type
+
+    def createFields(self):
+        if self.link_type in TcpdumpFile.LINK_TYPE:
+            name, parser = TcpdumpFile.LINK_TYPE[self.link_type]
+            field = parser(self, name)
+            while field:
+                yield field
+                field = field.parseNext(self)
+        size = (self.size - self.current_size) // 8
+        if size:
+            yield RawBytes(self, "data", size)
+
+    def createDescription(self):
+        for name in ("icmp", "tcp", "udp", "arp"):
+            if name in self:
+                return self[name].description
+        return "Frame"
+
+
+class PacketBlock(Block):
+    """
+    Base class of the blocks containing a packet
+    """
+    has_options = True
+
+    def getInterface(self):
+        """
+        Get the interface (Interface object) of the packet, or None
+        """
+        return self.root.getBlockIndex().getInterface(
+            self.absolute_address // 8, self["interface_id"].value)
+
+    def getTimestamp(self):
+        """
+        Get the timestamp (datetime) of the packet
+        """
+        interface = self.getInterface()
+        if interface is not None:
+            units = interface.ts_units
+        else:
+            units = 10 ** 6
+        value = (self["ts_high"].value << 32) | self["ts_low"].value
+        return UNIX_TIMESTAMP_T0 + timedelta(microseconds=value * 10 ** 6 / units)
+
+    def createFrame(self, caplen):
+        interface = self.getInterface()
+        if interface is not None:
+            link_type = interface.link_type
+        else:
+            link_type = None
+        yield Frame(self, "frame", caplen, link_type)
+        size = paddingSize(caplen, 4)
+        if size:
+            yield PaddingBytes(self, "padding", size)
+
+    def createDescription(self):
+        return "%s: %s" % (self.getTimestamp(), self["frame"].description)
+
+
+class EnhancedPacket(PacketBlock):
+    OPTION_NAME = optionNames({
+        2: "Flags",
+        3: "Hash",
+        4: "Drop count",
+        5: "Packet identifier",
+        6: "Queue",
+        7: "Verdict",
+    })
+
+    def createBody(self):
+        yield UInt32(self, "interface_id", "Interface identifier")
+        yield UInt32(self, "ts_high", "Timestamp (high)")
+        yield UInt32(self, "ts_low", "Timestamp (low)")
+        yield UInt32(self, "caplen", "Captured packet length")
+        yield UInt32(self, "len", "Original packet length")
+        yield from self.createFrame(self["caplen"].value)
+
+
+class ObsoletePacket(PacketBlock):
+    OPTION_NAME = optionNames({
+        2: "Flags",
+        3: "Hash",
+    })
+
+    def createBody(self):
+        yield UInt16(self, "interface_id", "Interface identifier")
+        yield UInt16(self, "drops_count", "Drops count")
+        yield UInt32(self, "ts_high", "Timestamp (high)")
+        yield UInt32(self, "ts_low", "Timestamp (low)")
+        yield UInt32(self, "caplen", "Captured packet length")
+        yield UInt32(self, "len", "Original packet length")
+        yield from self.createFrame(self["caplen"].value)
+
+
+class SimplePacket(PacketBlock):
+    has_options = False
+
+    def createBody(self):
+        yield UInt32(self, "len", "Original packet length")
+        caplen = min(self["len"].value, self["block_length"].value - 16)
+        yield from self.createFrame(caplen)
+
+    def getInterface(self):
+        return self.root.getBlockIndex().getInterface(
+            self.absolute_address // 8, 0)
+
+    def createDescription(self):
+        return "Simple packet: %s" % self["frame"].description
+
+
+class NameRecord(FieldSet):
+    RECORD_TYPE = {
+        0: "End of records",
+        1: "IPv4",
+        2: "IPv6",
+        3: "EUI-48",
+        4: "EUI-64",
+    }
+
+    def __init__(self, parent, name):
+        FieldSet.__init__(self, parent, name)
+        length = self["length"].value
+        self._size = (4 + length + paddingSize(length, 4)) * 8
+
+    def createFields(self):
+        yield Enum(UInt16(self, "type", "Record type"), self.RECORD_TYPE)
+        yield UInt16(self, "length", "Value length")
+        length = self["length"].value
+        if self["type"].value == 1 and 4 < length:
+            yield IPv4_Address(self, "address")
+            yield String(self, "names", length - 4, charset="UTF-8", strip="\0")
+        elif length:
+            yield RawBytes(self, "value", length)
+        size = paddingSize(length, 4)
+        if size:
+            yield PaddingBytes(self, "padding", size)
+
+    def createDescription(self):
+        if "names" in self:
+            return "%s: %s" % (self["address"].value, self["names"].value)
+        return "Name record: %s" % self["type"].display
+
+
+class NameResolution(Block):
+    OPTION_NAME = optionNames({
+        2: "DNS server name",
+        3: "DNS server IPv4 address",
+        4: "DNS server IPv6 address",
+    })
+    TEXT_OPTIONS = (2,)
+    has_options = True
+
+    def createBody(self):
+        while self.current_size < self.size - 32:
+            record = NameRecord(self, "record[]")
+            yield record
+            if not record["type"].value:
+                break
+
+
+class InterfaceStatistics(Block):
+    OPTION_NAME = optionNames({
+        2: "Capture start time",
+        3: "Capture end time",
+        4: "Packets received",
+        5: "Packets dropped by the interface",
+        6: "Packets accepted by the filter",
+        7: "Packets dropped by the operating system",
+        8: "Packets delivered to the user",
+    })
+    TIMESTAMP_OPTIONS = (2, 3)
+    has_options = True
+
+    def createBody(self):
+        yield UInt32(self, "interface_id", "Interface identifier")
+        yield UInt32(self, "ts_high", "Timestamp (high)")
+        yield UInt32(self, "ts_low", "Timestamp (low)")
+
+
+BLOCK_INFO = {
+    SECTION_HEADER: ("section[]", SectionHeader),
+    INTERFACE_DESCRIPTION: ("interface[]", InterfaceDescription),
+    OBSOLETE_PACKET: ("packet[]", ObsoletePacket),
+    SIMPLE_PACKET: ("packet[]", SimplePacket),
+    NAME_RESOLUTION: ("name_resolution[]", NameResolution),
+    INTERFACE_STATISTICS: ("statistics[]", InterfaceStatistics),
+    ENHANCED_PACKET: ("packet[]", EnhancedPacket),
+}
+
+
+class Interface:
+    """
+    Interface of a section: link type, snapshot length and timestamp
+    resolution (ts_units: number of timestamp units per second)
+    """
+    __slots__ = ("offset", "section", "link_type", "snap_len", "ts_units")
+
+    def __init__(self, offset, section, link_type, snap_len, ts_units):
+        self.offset = offset
+        self.section = section
+        self.link_type = link_type
+        self.snap_len = snap_len
+        self.ts_units = ts_units
+
+
+# Size in bytes of the blocks read by BlockIndex
+INDEX_BLOCK_SIZE = 1024 * 1024
+# Maximum timestamp in nanoseconds of BlockIndex (signed 64-bit)
+MAX_TIMESTAMP = 2 ** 63 - 1
+
+
+class BlockIndex:
+    """
+    Index of the blocks built from their type and length fields, without
+    creating fields. Blocks are indexed lazily: only up to the requested
+    packet, reading the file by large blocks.
+
+    Packet columns (simple packets have no timestamp: -1):
+    - offsets: offset in bytes of the block (array)
+    - interface_numbers: interface number, index in the interfaces list
+      (array)
+    - timestamps: timestamp in nanoseconds since the Epoch, clamped to
+      MAX_TIMESTAMP (array)
+    - caplens: length in bytes of the captured data (array)
+
+    Other blocks: sections (offsets of the section headers), interfaces
+    (list of Interface objects), statistics (offsets of the interface
+    statistics blocks).
+    """
+
+    def __init__(self, parser):
+        self.stream = parser.stream
+        self.size = parser.size // 8
+        self.sections = []
+        self.section_interfaces = []    # first interface of each section
+        self.interfaces = []
+        self.statistics = []
+        self.offsets = array("Q")
+        self.interface_numbers = array("l")
+        self.timestamps = array("q")
+        self.caplens = array("L")
+        self.offset = 0
+        self.done = False
+        self.truncated = False
+        self._endian = None
+        self._data = b""
+        self._data_offset = 0
+
+    def _read(self, offset, size):
+        start = offset - self._data_offset
+        if start < 0 or len(self._data) < start + size:
+            self._data_offset = offset
+            self._data = self.stream.readBytes(
+                offset * 8, min(max(INDEX_BLOCK_SIZE, size), self.size - offset))
+            start = 0
+        return self._data[start:start + size]
+
+    def _stop(self, truncated):
+        self.done = True
+        self.truncated = truncated
+
+    def _getInterface(self, interface_id):
+        number = self.section_interfaces[-1] + interface_id
+        if number < len(self.interfaces):
+            return number, self.interfaces[number]
+        return -1, None
+
+    def _addPacket(self, offset, interface_id, ticks, caplen):
+        number, interface = self._getInterface(interface_id)
+        if ticks is None:
+            timestamp = -1
+        elif interface is not None:
+            timestamp = ticks * 10 ** 9 // interface.ts_units
+        else:
+            timestamp = ticks * 1000
+        # Don't overflow the signed 64-bit array
+        timestamp = min(timestamp, MAX_TIMESTAMP)
+        self.offsets.append(offset)
+        self.interface_numbers.append(number)
+        self.timestamps.append(timestamp)
+        self.caplens.append(caplen)
+
+    def _readTimestampResolution(self, data, pos, end):
+        units = 10 ** 6
+        while pos + 4 <= end:
+            code, length = struct.unpack_from(self._endian + "HH", data, pos)
+            if code == OPT_ENDOFOPT:
+                break
+            if code == OPT_IF_TSRESOL and length == 1:
+                value = data[pos + 4]
+                if value & 0x80:
+                    units = 2 ** (value & 0x7f)
+                else:
+                    units = 10 ** value
+            pos += 4 + length + paddingSize(length, 4)
+        return units
+
+    def _indexBlock(self):
+        offset = self.offset
+        if self.size < offset + 12:
+            self._stop(offset != self.size)
+            return
+        header = self._read(offset, 12)
+        if header[:4] == b"\x0a\x0d\x0d\x0a":
+            if header[8:12] not in BYTE_ORDER_MAGIC:
+                self._stop(True)
+                return
+            if BYTE_ORDER_MAGIC[header[8:12]] == BIG_ENDIAN:
+                self._endian = ">"
+            else:
+                self._endian = "<"
+        elif self._endian is None:
+            self._stop(True)
+            return
+        endian = self._endian
+        block_type, length = struct.unpack_from(endian + "LL", header)
+        if length < 12 or length % 4 or self.size < offset + length:
+            self._stop(True)
+            return
+
+        if block_type == SECTION_HEADER:
+            self.sections.append(offset)
+            self.section_interfaces.append(len(self.interfaces))
+        elif block_type == ENHANCED_PACKET and 28 <= length:
+            interface_id, high, low, caplen = struct.unpack_from(
+                endian + "4L", self._read(offset + 8, 16))
+            self._addPacket(offset, interface_id, (high << 32) | low, caplen)
+        elif block_type == SIMPLE_PACKET and 16 <= length:
+            caplen = struct.unpack_from(endian + "L", self._read(offset + 8, 4))[0]
+            self._addPacket(offset, 0, None, min(caplen, length - 16))
+        elif block_type == OBSOLETE_PACKET and 28 <= length:
+            interface_id, drops, high, low, caplen = struct.unpack_from(
+                endian + "HH3L", self._read(offset + 8, 16))
+            self._addPacket(offset, interface_id, (high << 32) | low, caplen)
+        elif block_type == INTERFACE_DESCRIPTION and 20 <= length:
+            data = self._read(offset, length)
+            link_type, reserved, snap_len = struct.unpack_from(
+                endian + "HHL", data, 8)
+            units = self._readTimestampResolution(data, 16, length - 4)
+            self.interfaces.append(Interface(offset, len(self.sections) - 1,
+                                             link_type, snap_len, units))
+        elif block_type == INTERFACE_STATISTICS:
+            self.statistics.append(offset)
+        self.offset = offset + length
+
+    def _scan(self, packet=None, offset=None):
+        while not self.done:
+            if packet is not None and packet < len(self.offsets):
+                break
+            if offset is not None and offset < self.offset:
+                break
+            self._indexBlock()
+
+    def getPacketOffset(self, index):
+        """
+        Get the offset in bytes of the block of the packet index
+        """
+        self._scan(packet=index)
+        return self.offsets[index]
+
+    def getPacketCount(self):
+        """
+        Get the number of packets (index the whole file)
+        """
+        self._scan()
+        return len(self.offsets)
+
+    def getInterface(self, offset, interface_id):
+        """
+        Get the interface interface_id (Interface object) of the section
+        of the block at the specified offset, or None
+        """
+        self._scan(offset=offset)
+        section = bisect_right(self.sections, offset) - 1
+        if section < 0:
+            return None
+        number = self.section_interfaces[section] + interface_id
+        if number < len(self.interfaces) \
+                and self.interfaces[number].section == section:
+            return self.interfaces[number]
+        return None
+
+
+class PcapNgFile(Parser):
+    PARSER_TAGS = {
+        "id": "pcapng",
+        "category": "misc",
+        "file_ext": ("pcapng",),
+        "min_size": 28 * 8,
+        "description": "Pcap-ng file (network)",
+        "magic": ((b"\x0a\x0d\x0d\x0a", 0),),
+    }
+    # Correct endian is set in constructor, using the byte order magic of
+    # the first section
+    endian = LITTLE_ENDIAN
+
+    def __init__(self, stream, **args):
+        magic = stream.readBytes(8 * 8, 4)
+        if magic in BYTE_ORDER_MAGIC:
+            self.endian = BYTE_ORDER_MAGIC[magic]
+        Parser.__init__(self, stream, **args)
+
+    def validate(self):
+        if self.stream.readBytes(0, 4) != b"\x0a\x0d\x0d\x0a":
+            return "Wrong block type"
+        if self.stream.readBytes(8 * 8, 4) not in BYTE_ORDER_MAGIC:
+            return "Wrong byte order magic"
+        length = self["section[0]/block_length"].value
+        if length < 28 or length % 4:
+            return "Invalid block length"
+        if self["section[0]/major_version"].value != 1:
+            return "Unknown major version"
+        return True
+
+    def createFields(self):
+        while not self.eof:
+            block_type = self.stream.readBits(
+                self.absolute_address + self.current_size, 32, self.endian)
+            name, cls = BLOCK_INFO.get(block_type, ("block[]", Block))
+            yield cls(self, name)
+
+    def getBlockIndex(self):
+        """
+        Get the index of the blocks (BlockIndex)
+        """
+        try:
+            return self._block_index
+        except AttributeError:
+            pass
+        self._block_index = BlockIndex(self)
+        return self._block_index
+
+    def packet(self, index):
+        """
+        Get the packet number index (orphan block field) using the block
+        index: its frame is only parsed on demand
+        """
+        offset = self.getBlockIndex().getPacketOffset(index)
+        block_type = self.stream.readBits(offset * 8, 32, self.endian)
+        cls = BLOCK_INFO[block_type][1]
+        return createOrphanField(self, offset * 8, cls, "packet[%u]" % index)
@@ -0,0 +1,189 @@
+"""
+Reverse DNS resolver used to display IP addresses (see ip2name()).
+
+Name resolution is disabled by default. Once a resolver is installed,
+addresses are resolved concurrently by a pool of threads: getName() never
+blocks, it returns the numeric address until the name is resolved.
+
+    setResolver(Resolver(callback=redraw))
+
+Results (including failures) are kept in a LRU cache for ttl seconds.
+A lookup which takes longer than timeout seconds is considered as failed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+from socket import gethostbyaddr
+from threading import Lock
+from time import monotonic
+
+DEFAULT_WORKERS = 8
+DEFAULT_CACHE_SIZE = 4096   # number of addresses
+DEFAULT_TTL = 600.0         # seconds
+DEFAULT_TIMEOUT = 2.0       # seconds
+
+
+def lookupName(addr):
+    """
+    Get the host name of the address addr using the system resolver
+    (blocking): return None if the address has no name.
+    """
+    try:
+        return gethostbyaddr(addr)[0]
+    except (OSError, ValueError):
+        return None
+
+
+class Resolver:
+    """
+    Reverse DNS resolver with a LRU cache.
+
+    lookup(addr) is called in a worker thread and returns the name of the
+    address or None. callback(addr, name) is called in a worker thread
+    each time a name is resolved.
+    """
+
+    def __init__(self, lookup=lookupName, workers=DEFAULT_WORKERS,
+                 cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL,
+                 timeout=DEFAULT_TIMEOUT, callback=None):
+        self.lookup = lookup
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self.callback = callback
+        self.cache = OrderedDict()    # addr => (name, expiration time)
+        self.pending = {}             # addr => (deadline, future)
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(workers)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _getCached(self, addr, now):
+        try:
+            name, expire = self.cache[addr]
+        except KeyError:
+            return None
+        if expire <= now:
+            del self.cache[addr]
+            return None
+        self.cache.move_to_end(addr)
+        return name
+
+    def _store(self, addr, name, now):
+        self.cache[addr] = (name, now + self.ttl)
+        self.cache.move_to_end(addr)
+        while self.cache_size < len(self.cache):
+            self.cache.popitem(last=False)
+
+    def _submit(self, addr, now):
+        if addr in self.pending:
+            deadline, future = self.pending[addr]
+            if now < deadline:
+                return future
+            # Lookup too slow: give up
+            del self.pending[addr]
+            self._store(addr, addr, now)
+            return None
+        future = self.executor.submit(self._resolve, addr)
+        self.pending[addr] = (now + self.timeout, future)
+        return future
+
+    def _resolve(self, addr):
+        try:
+            name = self.lookup(addr)
+        except Exception:
+            name = None
+        if not name:
+            name = addr
+        now = monotonic()
+        with self.lock:
+            if addr not in self.pending:
+                return addr
+            deadline = self.pending.pop(addr)[0]
+            if deadline < now:
+                name = addr
+            self._store(addr, name, now)
+        if name != addr and self.callback is not None:
+            self.callback(addr, name)
+        return name
+
+    def getName(self, addr):
+        """
+        Get the name of the address addr: return addr if the name is not
+        resolved yet (start a lookup in the background) or if the address
+        has no name.
+        """
+        now = monotonic()
+        with self.lock:
+            name = self._getCached(addr, now)
+            if name is not None:
+                return name
+            self._submit(addr, now)
+        return addr
+
+    def resolve(self, addresses, timeout=None):
+        """
+        Resolve concurrently a batch of addresses and wait until all names
+        are resolved, or until timeout seconds (default: lookup timeout).
+        Return a dictionary: address => name (address if unresolved).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        names = {}
+        futures = {}
+        now = monotonic()
+        with self.lock:
+            for addr in addresses:
+                name = self._getCached(addr, now)
+                if name is None:
+                    future = self._submit(addr, now)
+                    if future is not None:
+                        futures[addr] = future
+                    name = addr
+                names[addr] = name
+        if futures:
+            wait(futures.values(), timeout)
+        for addr, future in futures.items():
+            if future.done():
+                names[addr] = future.result()
+        return names
+
+
+_resolver = None
+
+
+def getResolver():
+    """
+    Get the installed resolver, None if name resolution is disabled
+    """
+    return _resolver
+
+
+def setResolver(resolver):
+    """
+    Install a resolver, or disable name resolution if resolver is None.
+    Return the previous resolver.
+    """
+    global _resolver
+    previous = _resolver
+    _resolver = resolver
+    return previous
+
+
+def ip2name(addr):
+    """
+    Get the name of the address addr using the installed resolver:
+    return addr if name resolution is disabled or if the name is not
+    resolved yet.
+    """
+    resolver = _resolver
+    if resolver is None:
+        return addr
+    return resolver.getName(addr)
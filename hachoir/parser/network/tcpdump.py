@@ -16,12 +16,16 @@ from hachoir.parser import Parser
 from hachoir.field import (FieldSet, ParserError,
                            Enum, Bytes, NullBytes, RawBytes,
                            UInt8, UInt16, UInt32, Int32, TimestampUnix32,
-                           Bit, Bits, NullBits)
-from hachoir.core.endian import NETWORK_ENDIAN, LITTLE_ENDIAN
-from hachoir.core.tools import humanDuration
+                           Bit, Bits, NullBits, createOrphanField)
+from hachoir.core.endian import NETWORK_ENDIAN, LITTLE_ENDIAN, BIG_ENDIAN
+from hachoir.core.tools import humanDuration, UNIX_TIMESTAMP_T0
 from hachoir.core.text_handler import textHandler, hexadecimal
 from hachoir.core.tools import createDict
 from hachoir.parser.network.common import MAC48_Address, IPv4_Address, IPv6_Address
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import struct
 
 
 def diff(field):
@@ -435,7 +439,6 @@ class Ethernet(Layer2):
 
 
 class Packet(FieldSet):
-    endian = LITTLE_ENDIAN
 
     def __init__(self, parent, name, parser, first_name):
         FieldSet.__init__(self, parent, name)
@@ -445,7 +448,10 @@ class Packet(FieldSet):
 
     def createFields(self):
         yield TimestampUnix32(self, "ts_epoch", "Timestamp (Epoch)")
-        yield UInt32(self, "ts_nanosec", "Timestamp (nano second)")
+        if self.root.nanosecond:
+            yield UInt32(self, "ts_nanosec", "Timestamp (nanoseconds)")
+        else:
+            yield UInt32(self, "ts_nanosec", "Timestamp (microseconds)")
         yield UInt32(self, "caplen", "length of portion present")
         yield UInt32(self, "len", "length this packet (off wire)")
 
@@ -461,15 +467,13 @@ class Packet(FieldSet):
             yield RawBytes(self, "data", size)
 
     def getTimestamp(self):
-        nano_sec = float(self["ts_nanosec"].value) / 100
-        from datetime import timedelta
-        return self["ts_epoch"].value + timedelta(microseconds=nano_sec)
+        fraction = self["ts_nanosec"].value
+        if self.root.nanosecond:
+            fraction /= 1000
+        return self["ts_epoch"].value + timedelta(microseconds=fraction)
 
     def createDescription(self):
-        t0 = self["/packet[0]"].getTimestamp()
-#        ts = max(self.getTimestamp() - t0, t0)
-        ts = self.getTimestamp() - t0
-        # text = ["%1.6f: " % ts]
+        ts = self.getTimestamp() - self.root.getFirstTimestamp()
         text = ["%s: " % ts]
         if "icmp" in self:
             text.append(self["icmp"].description)
@@ -484,15 +488,92 @@ class Packet(FieldSet):
         return "".join(text)
 
 
+# Size in bytes of the blocks read by PacketIndex
+INDEX_BLOCK_SIZE = 1024 * 1024
+
+
+class PacketIndex:
+    """
+    Index of the packet records built from the 16-byte record headers
+    (read by large blocks), without creating fields.
+
+    Columns (one entry per complete record):
+    - offsets: offset in bytes of the record header (array)
+    - timestamps: timestamp in nanoseconds since the Epoch (array)
+    - caplens: length in bytes of the captured data (array)
+
+    truncated is True if the last record is truncated.
+    """
+
+    def __init__(self, parser):
+        if parser.endian == BIG_ENDIAN:
+            header = struct.Struct(">4L")
+        else:
+            header = struct.Struct("<4L")
+        if parser.nanosecond:
+            scale = 1
+        else:
+            scale = 1000
+        self.offsets = array("Q")
+        self.timestamps = array("q")
+        self.caplens = array("L")
+        self.truncated = False
+
+        stream = parser.stream
+        size = parser.size // 8
+        offset = 24
+        data = b""
+        data_offset = offset
+        while offset + header.size <= size:
+            pos = offset - data_offset
+            if len(data) < pos + header.size:
+                data_offset = offset
+                data = stream.readBytes(offset * 8,
+                                        min(INDEX_BLOCK_SIZE, size - offset))
+                pos = 0
+            seconds, fraction, caplen, length = header.unpack_from(data, pos)
+            if size < offset + header.size + caplen:
+                break
+            self.offsets.append(offset)
+            self.timestamps.append(seconds * 1000000000 + fraction * scale)
+            self.caplens.append(caplen)
+            offset += header.size + caplen
+        self.truncated = (offset != size)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def findTimestamp(self, timestamp):
+        """
+        Get the index of the first packet with a timestamp greater or
+        equal to timestamp (in nanoseconds since the Epoch). Packets
+        have to be sorted by timestamp.
+        """
+        return bisect_left(self.timestamps, timestamp)
+
+
 class TcpdumpFile(Parser):
     PARSER_TAGS = {
         "id": "tcpdump",
         "category": "misc",
         "min_size": 24 * 8,
         "description": "Tcpdump file (network)",
-        "magic": ((b"\xd4\xc3\xb2\xa1", 0),),
+        "magic": ((b"\xd4\xc3\xb2\xa1", 0),
+                  (b"\xa1\xb2\xc3\xd4", 0),
+                  (b"\x4d\x3c\xb2\xa1", 0),
+                  (b"\xa1\xb2\x3c\x4d", 0)),
     }
+    # Correct endian is set in constructor
     endian = LITTLE_ENDIAN
+    nanosecond = False
+
+    # Magic => (endian, nanosecond timestamps)
+    MAGIC = {
+        b"\xd4\xc3\xb2\xa1": (LITTLE_ENDIAN, False),
+        b"\xa1\xb2\xc3\xd4": (BIG_ENDIAN, False),
+        b"\x4d\x3c\xb2\xa1": (LITTLE_ENDIAN, True),
+        b"\xa1\xb2\x3c\x4d": (BIG_ENDIAN, True),
+    }
 
     LINK_TYPE = {
         1: ("ethernet", Ethernet),
@@ -500,8 +581,14 @@ class TcpdumpFile(Parser):
     }
     LINK_TYPE_DESC = createDict(LINK_TYPE, 0)
 
+    def __init__(self, stream, **args):
+        magic = stream.readBytes(0, 4)
+        if magic in self.MAGIC:
+            self.endian, self.nanosecond = self.MAGIC[magic]
+        Parser.__init__(self, stream, **args)
+
     def validate(self):
-        if self["id"].value != b"\xd4\xc3\xb2\xa1":
+        if self["id"].value not in self.MAGIC:
             return "Wrong file signature"
         if self["link_type"].value not in self.LINK_TYPE:
             return "Unknown link type"
@@ -521,3 +608,49 @@ class TcpdumpFile(Parser):
         name, parser = self.LINK_TYPE[link]
         while self.current_size < self.size:
             yield Packet(self, "packet[]", parser, name)
+
+    def getFirstTimestamp(self):
+        """
+        Get the timestamp (datetime) of the first packet
+        """
+        try:
+            return self._first_timestamp
+        except AttributeError:
+            pass
+        self._first_timestamp = self["packet[0]"].getTimestamp()
+        return self._first_timestamp
+
+    def getPacketIndex(self):
+        """
+        Get the index of the packet records (PacketIndex)
+        """
+        try:
+            return self._packet_index
+        except AttributeError:
+            pass
+        self._packet_index = PacketIndex(self)
+        return self._packet_index
+
+    def packet(self, index):
+        """
+        Get the packet number index (orphan Packet field) using the
+        packet index: its layers are only parsed on demand
+        """
+        offset = self.getPacketIndex().offsets[index]
+        name, parser = self.LINK_TYPE[self["link_type"].value]
+        return createOrphanField(self, offset * 8, Packet,
+                                 "packet[%u]" % index, parser, name)
+
+    def findPacket(self, timestamp):
+        """
+        Get the index of the first packet sent at timestamp or later:
+        timestamp is a datetime or a number of seconds since the Epoch.
+        Packets have to be sorted by timestamp.
+        """
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp - UNIX_TIMESTAMP_T0
+            timestamp = ((timestamp.days * 86400 + timestamp.seconds) * 1000000000
+                         + timestamp.microseconds * 1000)
+        else:
+            timestamp = int(timestamp * 1000000000)
+        return self.getPacketIndex().findTimestamp(timestamp)
@@ -19,16 +19,20 @@ Creation: 2 august 2006
 
 from hachoir.parser import Parser
 from hachoir.parser.common.win32 import GUID
-from hachoir.field import (ParserError, FieldSet, MissingField,
+from hachoir.field import (ParserError, FieldSet, MissingField, createOrphanField,
                            Enum,
                            Bit, NullBits, Bits, UInt8, Int16, UInt16, Int32, UInt32, Int64, UInt64, TimestampMac32,
                            String, PascalString8, PascalString16, CString,
                            RawBytes, NullBytes)
 from hachoir.field.timestamp import timestampFactory
 from hachoir.core.endian import BIG_ENDIAN
+from hachoir.stream import InputStreamError
 from hachoir.core.text_handler import textHandler
 
 from hachoir.core.tools import MAC_TIMESTAMP_T0, timedelta
+from array import array
+import struct
+import sys
 
 
 def timestampMac64(value):
@@ -907,6 +911,183 @@ class Atom(FieldSet):
         return "Atom: %s" % self["tag"].value
 
 
+ATOM_HEADER = struct.Struct(">L4s")
+
+
+def iterAtomHeaders(stream, address, end):
+    """
+    Generate (tag, address, size, header_size) of the atoms from address
+    to end (in bytes), only reading the atom headers (8 bytes, or 16 bytes
+    for a 64-bit size). size is the total size of the atom in bytes.
+    """
+    while address + ATOM_HEADER.size <= end:
+        size, tag = ATOM_HEADER.unpack(stream.readBytes(address * 8,
+                                                        ATOM_HEADER.size))
+        header_size = ATOM_HEADER.size
+        if size == 1:
+            size = stream.readBits((address + 8) * 8, 64, BIG_ENDIAN)
+            header_size += 8
+        elif size == 0:
+            # Unbounded atom
+            size = end - address
+        if size < header_size:
+            raise ParserError("MOV: invalid size of the atom at %s" % address)
+        yield tag.decode("ISO-8859-1"), address, size, header_size
+        address += size
+
+
+def findAtom(stream, address, end, path):
+    """
+    Find the first atom of the path (list of tags, ex: ["mdia", "minf"])
+    starting at address: return (address, size, header_size) or None.
+    """
+    for index, tag in enumerate(path):
+        for atom in iterAtomHeaders(stream, address, end):
+            if atom[0] == tag:
+                address, size, header_size = atom[1:]
+                end = address + size
+                if index < len(path) - 1:
+                    address += header_size
+                break
+        else:
+            return None
+    return address, size, header_size
+
+
+def _decodeArray(typecode, data):
+    values = array(typecode)
+    if values.itemsize != struct.calcsize("=" + typecode):
+        raise ParserError("MOV: unsupported array type %r" % typecode)
+    values.frombytes(data)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+
+class SampleTable:
+    """
+    Sample table of a track: the stsz/stz2, stco/co64, stsc and stts atoms
+    are read in bulk into arrays, without creating fields.
+
+    Attributes:
+    - handler: handler type of the track ("vide", "soun", ...)
+    - time_scale: time units per second of the media
+    - sample_sizes: size in bytes of each sample
+    - chunk_offsets: offset in bytes of each chunk in the file
+    - sample_to_chunk: list of (first chunk, samples per chunk, sample
+      description index), chunks are numbered from 1
+    - time_to_sample: list of (sample count, sample delta)
+    """
+
+    def __init__(self, stream, address, size):
+        end = address + size
+        self.handler = None
+        self.time_scale = None
+        self.sample_sizes = array("I")
+        self.chunk_offsets = array("Q")
+        self.sample_to_chunk = []
+        self.time_to_sample = []
+
+        atom = findAtom(stream, address, end, ("mdia", "hdlr"))
+        if atom:
+            data = self._readData(stream, atom, 12)
+            self.handler = data[8:12].decode("ISO-8859-1")
+        atom = findAtom(stream, address, end, ("mdia", "mdhd"))
+        if atom:
+            data = self._readData(stream, atom, 32)
+            if data[0] == 1:
+                self.time_scale = struct.unpack_from(">L", data, 20)[0]
+            else:
+                self.time_scale = struct.unpack_from(">L", data, 12)[0]
+
+        stbl = findAtom(stream, address, end, ("mdia", "minf", "stbl"))
+        if not stbl:
+            return
+        address = stbl[0] + stbl[2]
+        end = stbl[0] + stbl[1]
+        for tag, address, size, header_size in iterAtomHeaders(stream, address, end):
+            if tag not in ("stsz", "stz2", "stco", "co64", "stsc", "stts"):
+                continue
+            data = self._readData(stream, (address, size, header_size))
+            count = struct.unpack_from(">L", data, 4)[0]
+            if tag == "stsz":
+                uniform_size, count = struct.unpack_from(">LL", data, 4)
+                if uniform_size:
+                    self.sample_sizes = array("I", [uniform_size]) * count
+                else:
+                    self.sample_sizes = _decodeArray("I", data[12:12 + count * 4])
+            elif tag == "stz2":
+                field_size = data[7]
+                count = struct.unpack_from(">L", data, 8)[0]
+                data = data[12:]
+                if field_size == 4:
+                    sizes = array("I")
+                    for byte in data[:(count + 1) // 2]:
+                        sizes.append(byte >> 4)
+                        sizes.append(byte & 15)
+                    del sizes[count:]
+                elif field_size == 8:
+                    sizes = array("I", data[:count])
+                elif field_size == 16:
+                    sizes = array("I", _decodeArray("H", data[:count * 2]))
+                else:
+                    raise ParserError("MOV: invalid stz2 field size: %s"
+                                      % field_size)
+                self.sample_sizes = sizes
+            elif tag == "stco":
+                self.chunk_offsets = array("Q", _decodeArray("I", data[8:8 + count * 4]))
+            elif tag == "co64":
+                self.chunk_offsets = _decodeArray("Q", data[8:8 + count * 8])
+            elif tag == "stsc":
+                values = _decodeArray("I", data[8:8 + count * 12])
+                self.sample_to_chunk = list(zip(values[0::3], values[1::3], values[2::3]))
+            else:
+                values = _decodeArray("I", data[8:8 + count * 8])
+                self.time_to_sample = list(zip(values[0::2], values[1::2]))
+
+    @staticmethod
+    def _readData(stream, atom, max_size=None):
+        address, size, header_size = atom
+        size -= header_size
+        if max_size is not None:
+            size = min(size, max_size)
+        return stream.readBytes((address + header_size) * 8, size)
+
+    def getSampleCount(self):
+        return len(self.sample_sizes)
+
+    def getDuration(self):
+        """
+        Get the duration of the track in seconds (float), or None if
+        the time scale is unknown
+        """
+        if not self.time_scale:
+            return None
+        duration = sum(count * delta for count, delta in self.time_to_sample)
+        return duration / self.time_scale
+
+    def getSampleOffsets(self):
+        """
+        Get the offset in bytes of each sample in the file (array)
+        """
+        offsets = array("Q")
+        sizes = self.sample_sizes
+        sample = 0
+        entries = self.sample_to_chunk
+        for index, (first_chunk, samples_per_chunk, description) in enumerate(entries):
+            if index + 1 < len(entries):
+                last_chunk = entries[index + 1][0]
+            else:
+                last_chunk = len(self.chunk_offsets) + 1
+            for chunk in range(first_chunk, last_chunk):
+                offset = self.chunk_offsets[chunk - 1]
+                for size in sizes[sample:sample + samples_per_chunk]:
+                    offsets.append(offset)
+                    offset += size
+                sample += samples_per_chunk
+        return offsets
+
+
 class MovFile(Parser):
     PARSER_TAGS = {
         "id": "mov",
@@ -946,6 +1127,67 @@ class MovFile(Parser):
         while not self.eof:
             yield Atom(self, "atom[]")
 
+    def getAtomIndex(self):
+        """
+        Get the index of the top-level atoms: list of (tag, address, size,
+        header_size) in bytes, built from the atom headers
+        """
+        try:
+            return self._atom_index
+        except AttributeError:
+            pass
+        index = []
+        try:
+            for atom in iterAtomHeaders(self.stream, 0, self.size // 8):
+                index.append(atom)
+        except (ParserError, InputStreamError) as err:
+            self.warning("Unable to index atoms: %s" % err)
+        self._atom_index = index
+        return index
+
+    def getTopAtom(self, tag):
+        """
+        Get the first top-level atom with the specified tag (ex: "moov")
+        without parsing the previous atoms: orphan Atom field, or None
+        if there is no such atom
+        """
+        for index, atom in enumerate(self.getAtomIndex()):
+            if atom[0] == tag:
+                break
+        else:
+            return None
+        name = "atom[%u]" % index
+        if name in self._fields:
+            # Already parsed
+            return self[name]
+        try:
+            return self._top_atoms[name]
+        except AttributeError:
+            self._top_atoms = {}
+        except KeyError:
+            pass
+        field = createOrphanField(self, atom[1] * 8, Atom, name,
+                                  size=atom[2] * 8)
+        self._top_atoms[name] = field
+        return field
+
+    def getSampleTables(self):
+        """
+        Get the sample table (SampleTable) of each track of the movie
+        """
+        for tag, address, size, header_size in self.getAtomIndex():
+            if tag == "moov":
+                break
+        else:
+            return []
+        tables = []
+        for atom in iterAtomHeaders(self.stream, address + header_size,
+                                    address + size):
+            if atom[0] == "trak":
+                tables.append(SampleTable(self.stream, atom[1] + atom[3],
+                                          atom[2] - atom[3]))
+        return tables
+
     def createMimeType(self):
         first = self[0]
         try:
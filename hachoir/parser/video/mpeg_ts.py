@@ -11,9 +11,17 @@ Creation date: 13 january 2007
 
 from hachoir.parser import Parser
 from hachoir.field import (FieldSet, ParserError, MissingField,
-                           UInt8, Enum, Bit, Bits, RawBytes, RawBits)
+                           UInt8, Enum, Bit, Bits, RawBytes, RawBits,
+                           createOrphanField)
 from hachoir.core.endian import BIG_ENDIAN
 from hachoir.core.text_handler import textHandler, hexadecimal
+from array import array
+
+try:
+    import numpy
+    has_numpy = True
+except ImportError:
+    has_numpy = False
 
 
 class AdaptationField(FieldSet):
@@ -118,6 +126,165 @@ class Packet(FieldSet):
 # M2TS 4 bytes + 188 bytes payload + 4 errors
 MAX_PACKET_SIZE = 208
 
+SYNC_BYTE = 0x47
+
+# Number of packets read at once by PacketTable
+PACKETS_PER_BLOCK = 4096
+
+
+class PacketTable:
+    """
+    Table of the packets of a transport stream built by reading large
+    blocks: the synchronization byte of all packets of a block is checked
+    at once and packet headers are decoded into columnar arrays. Packet
+    fields are only created on demand by getPacket().
+
+    Columns (one entry per packet):
+    - offsets: offset in bytes of the packet (array)
+    - pids: program identifier (array)
+    - pusi: payload unit start indicator (array of 0/1)
+    - counters: continuity counter (array)
+    - adaptation: adaptation field flag (array of 0/1)
+
+    Bytes which are not part of a packet (synchronization lost) are counted
+    in lost_bytes. NumPy is used to decode headers if it is installed.
+    """
+
+    def __init__(self, parser, m2ts=False, use_numpy=None):
+        self.parser = parser
+        self.m2ts = m2ts
+        if m2ts:
+            self.packet_size = 192
+            self.sync_offset = 4
+        else:
+            self.packet_size = 188
+            self.sync_offset = 0
+        if use_numpy is None:
+            use_numpy = has_numpy
+        self.use_numpy = use_numpy
+        self.offsets = array("Q")
+        self.pids = array("H")
+        self.pusi = array("B")
+        self.counters = array("B")
+        self.adaptation = array("B")
+        self.lost_bytes = 0
+        self._pid_index = None
+        self._build()
+
+    def _build(self):
+        stream = self.parser.stream
+        size = self.parser.size // 8
+        packet_size = self.packet_size
+        offset = 0
+        while offset + packet_size <= size:
+            count = min(PACKETS_PER_BLOCK, (size - offset) // packet_size)
+            data = stream.readBytes(offset * 8, count * packet_size)
+            count = self._decodeBlock(data, offset, count)
+            offset += count * packet_size
+            if count < PACKETS_PER_BLOCK:
+                # Synchronization lost or end of the stream
+                sync = self._resync(offset, size)
+                if sync is None:
+                    self.lost_bytes += size - offset
+                    break
+                self.lost_bytes += sync - offset
+                offset = sync
+
+    def _resync(self, offset, size):
+        """
+        Find the next packet followed by another packet (or by the end of
+        the stream) starting at offset: return its offset, or None.
+        """
+        stream = self.parser.stream
+        packet_size = self.packet_size
+        first = self.sync_offset
+        last = first + packet_size
+        while offset + packet_size <= size:
+            data = stream.readBytes(offset * 8,
+                                    min(2 * packet_size + first, size - offset))
+            pos = data.find(SYNC_BYTE, first, last)
+            while 0 <= pos:
+                next = pos + packet_size
+                if len(data) <= next or data[next] == SYNC_BYTE:
+                    start = offset + pos - first
+                    if start + packet_size <= size:
+                        return start
+                pos = data.find(SYNC_BYTE, pos + 1, last)
+            offset += packet_size
+        return None
+
+    def _decodeBlock(self, data, offset, count):
+        """
+        Decode the headers of count packets of data: stop at the first
+        packet with an invalid synchronization byte. Return the number of
+        decoded packets.
+        """
+        packet_size = self.packet_size
+        sync = self.sync_offset
+        syncs = data[sync::packet_size][:count]
+        if syncs.count(SYNC_BYTE) != count:
+            for index, byte in enumerate(syncs):
+                if byte != SYNC_BYTE:
+                    count = index
+                    break
+        if not count:
+            return 0
+        if self.use_numpy:
+            packets = numpy.frombuffer(data, numpy.uint8, count * packet_size)
+            packets = packets.reshape(count, packet_size)
+            byte1 = packets[:, sync + 1]
+            byte3 = packets[:, sync + 3]
+            pids = ((byte1.astype(numpy.uint16) & 0x1F) << 8) | packets[:, sync + 2]
+            self.pids.frombytes(pids.astype(numpy.uint16).tobytes())
+            self.pusi.frombytes(((byte1 >> 6) & 1).astype(numpy.uint8).tobytes())
+            self.counters.frombytes((byte3 & 0x0F).astype(numpy.uint8).tobytes())
+            self.adaptation.frombytes(((byte3 >> 5) & 1).astype(numpy.uint8).tobytes())
+        else:
+            byte1 = data[sync + 1::packet_size][:count]
+            byte2 = data[sync + 2::packet_size][:count]
+            byte3 = data[sync + 3::packet_size][:count]
+            self.pids.extend(((high & 0x1F) << 8) | low
+                             for high, low in zip(byte1, byte2))
+            self.pusi.extend((byte >> 6) & 1 for byte in byte1)
+            self.counters.extend(byte & 0x0F for byte in byte3)
+            self.adaptation.extend((byte >> 5) & 1 for byte in byte3)
+        self.offsets.extend(range(offset, offset + count * packet_size,
+                                  packet_size))
+        return count
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def getPidIndex(self):
+        """
+        Get the mapping PID => array of packet indexes
+        """
+        if self._pid_index is not None:
+            return self._pid_index
+        index = {}
+        if self.use_numpy and len(self.pids):
+            pids = numpy.frombuffer(self.pids, numpy.uint16)
+            order = numpy.argsort(pids, kind="stable")
+            values, starts = numpy.unique(pids[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+            for pid, start, end in zip(values, starts, ends):
+                index[int(pid)] = array("L", order[start:end].tolist())
+        else:
+            for packet, pid in enumerate(self.pids):
+                try:
+                    index[pid].append(packet)
+                except KeyError:
+                    index[pid] = array("L", (packet,))
+        self._pid_index = index
+        return index
+
+    def getPacket(self, index):
+        """
+        Create the field of the packet index: orphan Packet field
+        """
+        return createOrphanField(self.parser, self.offsets[index] * 8,
+                                 Packet, "packet[%u]" % index, m2ts=self.m2ts)
+
 
 class MPEG_TS(Parser):
     PARSER_TAGS = {
@@ -156,6 +323,17 @@ class MPEG_TS(Parser):
                 return "Packet #%u is invalid: %s" % (index, err)
         return True
 
+    def getPacketTable(self):
+        """
+        Get the packet table (PacketTable) of the stream
+        """
+        try:
+            return self._packet_table
+        except AttributeError:
+            pass
+        self._packet_table = PacketTable(self, self.is_m2ts())
+        return self._packet_table
+
     def createFields(self):
         m2ts = self.is_m2ts()
 
@@ -164,6 +342,11 @@ class MPEG_TS(Parser):
             next_sync = current
             if m2ts:
                 next_sync += 4 * 8
+            if (self._size is None or next_sync + 8 <= self._size) \
+                    and self.stream.readBits(next_sync, 8, self.endian) == SYNC_BYTE:
+                # Fast path: the packet starts at the expected address
+                yield Packet(self, "packet[]", m2ts=m2ts)
+                continue
             sync = self.stream.searchBytes(b"\x47", current,
                                            current + MAX_PACKET_SIZE * 8)
             if sync is None:
@@ -0,0 +1,374 @@
+"""
+hachoir-server: long-running server keeping Hachoir parsers warm and
+serving requests over a local Unix socket.
+
+Protocol: a client sends one JSON object per line and the server answers
+one JSON object per line, in the same order. Requests:
+
+    {"command": "guess", "filename": "image.jpg"}
+    {"command": "metadata", "filename": "video.mkv", "quality": 0.5}
+    {"command": "fields", "filename": "image.jpg", "path": "/exif",
+     "limit": 100}
+
+Each request can also set "timeout", "max_read" and "max_fields" to
+override the parse budget of the server (see hachoir.core.budget).
+Responses are {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+The "id" key of a request is copied into its response.
+
+Requests are processed in a pool of worker processes where parsers and
+metadata extractors are only loaded once. If a request runs longer than its
+timeout plus RESULT_TIMEOUT_MARGIN seconds (ex: stuck in C code which
+doesn't check the budget), the pool is killed and replaced. Requests
+interrupted by a replaced pool are submitted again once.
+
+The socket is only accessible by the user running the server (permissions
+0600) unless another mode is given.
+"""
+
+from hachoir.core.budget import ParseBudget, BudgetExceeded
+from hachoir.core.cmd_line import displayVersion
+from hachoir.metadata import extractMetadata
+from hachoir.metadata.batch import killPool
+from hachoir.metadata.export import exportValue
+from hachoir.metadata.metadata_item import QUALITY_NORMAL
+from hachoir.parser import createParser, HachoirParserList
+from hachoir.stream import InputStreamError
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from optparse import OptionParser
+import hachoir.core.config as config
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+DEFAULT_TIMEOUT = 10.0   # seconds
+DEFAULT_LIMIT = 100      # number of fields of the "fields" command
+DEFAULT_MODE = 0o600     # permissions of the socket
+# Time in seconds given to a worker process after the budget timeout before
+# its pool is killed
+RESULT_TIMEOUT_MARGIN = 10.0
+POLL_INTERVAL = 0.5      # seconds
+
+
+class RequestError(Exception):
+    """
+    Invalid request, or request which can not be processed
+    """
+    pass
+
+
+# Default parse budget of the worker process, see initWorker()
+_budget_options = {}
+
+
+def initWorker(timeout=DEFAULT_TIMEOUT, max_read=None, max_fields=None):
+    """
+    Initialize a worker process: set the default budget and build
+    the parser list
+    """
+    _budget_options.update(timeout=timeout, max_read=max_read,
+                           max_fields=max_fields)
+    config.quiet = True
+    HachoirParserList.getInstance()
+
+
+def createBudget(request):
+    options = dict(_budget_options)
+    for key in ("timeout", "max_read", "max_fields"):
+        if key in request:
+            options[key] = request[key]
+    return ParseBudget(**options)
+
+
+def openParser(request, budget):
+    try:
+        filename = request["filename"]
+    except KeyError:
+        raise RequestError("missing filename")
+    try:
+        parser = createParser(filename, budget=budget)
+    except InputStreamError as err:
+        raise RequestError(str(err))
+    if not parser:
+        raise RequestError("unable to parse file: %s" % filename)
+    return parser
+
+
+def commandGuess(request, budget):
+    with openParser(request, budget) as parser:
+        return {"parser": parser.getParserTags()["id"],
+                "description": parser.description,
+                "mime_type": parser.mime_type}
+
+
+def commandMetadata(request, budget):
+    quality = request.get("quality", QUALITY_NORMAL)
+    with openParser(request, budget) as parser:
+        metadata = extractMetadata(parser, quality, budget)
+        if not metadata:
+            raise RequestError("unable to extract metadata")
+        return {"parser": parser.getParserTags()["id"],
+                "metadata": metadata.exportValues(),
+                "text": metadata.exportPlaintext()}
+
+
+def describeField(field):
+    info = {"name": field.name,
+            "path": field.path,
+            "address": field.absolute_address,
+            "size": field.size,
+            "description": field.description,
+            "is_field_set": field.is_field_set}
+    if field.hasValue():
+        value = field.value
+        if isinstance(value, bytes):
+            value = value.hex()
+        else:
+            value = exportValue(value)
+        info["value"] = value
+        info["display"] = field.display
+    return info
+
+
+def commandFields(request, budget):
+    path = request.get("path", "/")
+    limit = request.get("limit", DEFAULT_LIMIT)
+    with openParser(request, budget) as parser:
+        with budget:
+            try:
+                field = parser[path]
+            except (KeyError, IndexError, ValueError) as err:
+                raise RequestError("no field %s: %s" % (path, err))
+            info = describeField(field)
+            if field.is_field_set:
+                fields = []
+                for index, child in enumerate(field):
+                    if limit is not None and limit <= index:
+                        info["truncated"] = True
+                        break
+                    fields.append(describeField(child))
+                info["fields"] = fields
+        return info
+
+
+COMMANDS = {
+    "guess": commandGuess,
+    "metadata": commandMetadata,
+    "fields": commandFields,
+}
+
+
+def handleRequest(request):
+    """
+    Process a request (dictionary): return the response (dictionary).
+    Called in a worker process.
+    """
+    response = {}
+    if "id" in request:
+        response["id"] = request["id"]
+    try:
+        try:
+            command = COMMANDS[request.get("command")]
+        except KeyError:
+            raise RequestError("unknown command: %r"
+                               % request.get("command"))
+        budget = createBudget(request)
+        response["result"] = command(request, budget)
+        response["ok"] = True
+    except (BudgetExceeded, Exception) as err:
+        response.update(ok=False, error=str(err))
+    return response
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as err:
+                response = {"ok": False, "error": "invalid request: %s" % err}
+            else:
+                try:
+                    response = self.server.submit(request)
+                except Exception as err:
+                    response = {"ok": False, "error": "server error: %s" % err}
+                    if "id" in request:
+                        response["id"] = request["id"]
+            data = json.dumps(response) + "\n"
+            self.wfile.write(data.encode("utf-8"))
+
+
+class HachoirServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server listening on the Unix socket address (created with the
+    permissions mode): each client is handled by a thread, requests are
+    processed by a pool of jobs worker processes.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, jobs=None, timeout=DEFAULT_TIMEOUT,
+                 max_read=None, max_fields=None, mode=DEFAULT_MODE):
+        if os.path.exists(address):
+            os.unlink(address)
+        self.mode = mode
+        socketserver.UnixStreamServer.__init__(self, address, RequestHandler)
+        self.jobs = jobs
+        self.budget_options = (timeout, max_read, max_fields)
+        self.executor_lock = threading.Lock()
+        self.executor = self.createExecutor()
+
+    def server_bind(self):
+        # Create the socket with the right permissions: other users must not
+        # be able to connect between bind() and chmod()
+        old_umask = os.umask(0o777 & ~self.mode)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.server_address, self.mode)
+
+    def createExecutor(self):
+        return ProcessPoolExecutor(self.jobs, initializer=initWorker,
+                                   initargs=self.budget_options)
+
+    def replaceExecutor(self, executor, kill=False):
+        """
+        Replace the pool executor, if it was not already replaced by another
+        thread, and shut it down. If kill is True, kill its worker processes.
+        """
+        with self.executor_lock:
+            if self.executor is not executor:
+                return
+            self.executor = self.createExecutor()
+        if kill:
+            killPool(executor)
+        else:
+            executor.shutdown(wait=False)
+
+    def getResultTimeout(self, request):
+        """
+        Get the maximum duration in seconds of a request in a worker
+        process, or None if the request has no timeout
+        """
+        timeout = request.get("timeout", self.budget_options[0])
+        if not timeout:
+            return None
+        return timeout + RESULT_TIMEOUT_MARGIN
+
+    def waitResult(self, future, timeout):
+        # The timeout starts when a worker process gets the request
+        if timeout is not None:
+            while not future.running() and not future.done():
+                wait([future], POLL_INTERVAL)
+        return future.result(timeout)
+
+    def submit(self, request):
+        timeout = self.getResultTimeout(request)
+        retry = True
+        while True:
+            with self.executor_lock:
+                executor = self.executor
+            try:
+                future = executor.submit(handleRequest, request)
+                return self.waitResult(future, timeout)
+            except BrokenProcessPool:
+                # A worker died (ex: killed by the kernel) or the pool was
+                # killed: replace the pool and submit the request again
+                self.replaceExecutor(executor)
+                if not retry:
+                    raise
+                retry = False
+            except futures.TimeoutError:
+                self.replaceExecutor(executor, kill=True)
+                raise RequestError("timeout (%s sec)" % timeout)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.executor.shutdown()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class HachoirClient:
+    """
+    Client of hachoir-server:
+
+        with HachoirClient("/tmp/hachoir.sock") as client:
+            print(client.request("guess", filename="image.jpg"))
+
+    request() raises a RequestError if the server returns an error.
+    """
+
+    def __init__(self, address):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.rfile = self.socket.makefile("rb")
+
+    def close(self):
+        self.rfile.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def request(self, command, **options):
+        request = dict(options, command=command)
+        self.socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        response = json.loads(self.rfile.readline().decode("utf-8"))
+        if not response["ok"]:
+            raise RequestError(response["error"])
+        return response["result"]
+
+
+def parseOptions():
+    parser = OptionParser(usage="%prog [options] --socket=PATH")
+    parser.add_option("--socket", help="Path of the Unix socket",
+                      type="str", default=None)
+    parser.add_option("--jobs", help="Number of worker processes (default: number of CPUs)",
+                      type="int", default=None)
+    parser.add_option("--timeout", help="Maximum duration in seconds of a request (default: %s)" % DEFAULT_TIMEOUT,
+                      type="float", default=DEFAULT_TIMEOUT)
+    parser.add_option("--max-read", help="Maximum number of bytes read by a request (default: no limit)",
+                      type="int", default=None)
+    parser.add_option("--max-fields", help="Maximum number of fields created by a request (default: no limit)",
+                      type="int", default=None)
+    parser.add_option("--mode", help="Permissions of the socket in octal (default: %o)" % DEFAULT_MODE,
+                      type="str", default="%o" % DEFAULT_MODE)
+    parser.add_option("--version", help="Display version and exit",
+                      action="callback", callback=displayVersion)
+    values, arguments = parser.parse_args()
+    if arguments or not values.socket:
+        parser.print_help()
+        sys.exit(1)
+    if values.jobs is not None and values.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    try:
+        values.mode = int(values.mode, 8)
+    except ValueError:
+        parser.error("invalid --mode: %r" % values.mode)
+    return values
+
+
+def main():
+    values = parseOptions()
+    server = HachoirServer(values.socket, values.jobs, values.timeout,
+                           values.max_read, values.max_fields, values.mode)
+    print("Listening on %s" % values.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Program interrupted (CTRL+C).")
+    finally:
+        server.server_close()
@@ -4,9 +4,14 @@ from hachoir.core.log import Logger
 from hachoir.core.bits import str2long
 from hachoir.core.tools import lowerBound
 from hachoir.core.tools import alignValue
+from bisect import bisect_right
 from errno import ESPIPE
+from io import UnsupportedOperation
 from weakref import ref as weakref_ref
 from hachoir.stream import StreamError
+from hachoir.stream.stats import StreamStats
+from hachoir.core import budget
+import hachoir.core.config as config
 
 
 class InputStreamError(StreamError):
@@ -128,6 +133,7 @@ class FileFromInputStream:
 class InputStream(Logger):
     _set_size = None
     _current_size = 0
+    stats = None
 
     def __init__(self, source=None, size=None, packets=None, **args):
         self.source = source
@@ -136,6 +142,8 @@ class InputStream(Logger):
             raise NullStreamError(source)
         self.tags = tuple(args.get("tags", tuple()))
         self.packets = packets
+        if config.io_stats:
+            self.stats = StreamStats(config.io_trace)
 
     def close(self):
         raise NotImplementedError
@@ -275,6 +283,16 @@ class InputStream(Logger):
             if found >= 0:
                 return start_address + (found - len(buffer)) * 8
 
+    def getFileRange(self, address, nb_bytes):
+        """
+        If nb_bytes bytes starting at address (in bits) are directly stored
+        in a regular file, return a tuple (file descriptor, offset in bytes).
+        Return None otherwise.
+
+        It is used to let the kernel copy data without reading them.
+        """
+        return None
+
     def file(self):
         return FileFromInputStream(self)
 
@@ -426,6 +444,10 @@ class InputIOStream(InputStream):
         if not size:
             return (0, b'', False)
         assert size > 0
+        if self.stats is not None:
+            self.stats.record(address, size)
+        if budget.current is not None:
+            budget.current.addRead(size)
         _size = self._size
         address, shift = divmod(address, 8)
         self._input.seek(address)
@@ -437,6 +459,17 @@ class InputIOStream(InputStream):
             raise ReadStreamError(8 * size, 8 * address, 8 * got)
         return shift, data, missing
 
+    def getFileRange(self, address, nb_bytes):
+        if address % 8 or isinstance(self._input, InputPipe):
+            return None
+        if self._size is None or self._size < address + nb_bytes * 8:
+            return None
+        try:
+            fd = self._input.fileno()
+        except (AttributeError, UnsupportedOperation, OSError):
+            return None
+        return (fd, address // 8)
+
     def file(self):
         if hasattr(self._input, "fileno"):
             from os import dup, fdopen
@@ -458,6 +491,10 @@ class StringInputStream(InputStream):
         pass
 
     def read(self, address, size):
+        if self.stats is not None:
+            self.stats.record(address, size)
+        if budget.current is not None:
+            budget.current.addRead(size)
         address, shift = divmod(address, 8)
         size = (size + shift + 7) >> 3
         data = self.data[address:address + size]
@@ -491,8 +528,15 @@ class InputSubStream(InputStream):
         self.stream = None
 
     def read(self, address, size):
+        if self.stats is not None:
+            self.stats.record(address, size)
         return self.stream.read(self._offset + address, size)
 
+    def getFileRange(self, address, nb_bytes):
+        if self._size is None or self._size < address + nb_bytes * 8:
+            return None
+        return self.stream.getFileRange(self._offset + address, nb_bytes)
+
 
 def InputFieldStream(field, **args):
     if not field.parent:
@@ -549,6 +593,8 @@ class FragmentedStream(InputStream):
 
     def read(self, address, size):
         assert size > 0
+        if self.stats is not None:
+            self.stats.record(address, size)
         missing = self._feed(address + size)
         if missing:
             size = self._size - address
@@ -577,6 +623,63 @@ class FragmentedStream(InputStream):
             i += 1
 
 
+class ExtentStream(InputStream):
+    """
+    Stream made of extents of another stream, for example the content of
+    a file of a file system image. extents is a list of (offset, size)
+    tuples in bytes, offset is None for a hole (read as null bytes).
+    If size (in bytes) is bigger than the total size of the extents,
+    the end of the stream is also a hole.
+    """
+
+    def __init__(self, stream, extents, size=None, **args):
+        self.stream = stream
+        self.starts = []
+        self.extents = []
+        start = 0
+        for offset, length in extents:
+            if length <= 0:
+                continue
+            self.starts.append(start)
+            self.extents.append((offset, length))
+            start += length
+        if size is None:
+            size = start
+        args.setdefault("source", "<extents of %s>" % stream.source)
+        InputStream.__init__(self, size=size * 8, **args)
+        self._current_size = self._size
+
+    def close(self):
+        self.stream = None
+
+    def read(self, address, size):
+        if self.stats is not None:
+            self.stats.record(address, size)
+        start, shift = divmod(address, 8)
+        nbytes = (size + shift + 7) >> 3
+        end = min(start + nbytes, self._size // 8)
+        data = []
+        pos = start
+        index = bisect_right(self.starts, pos) - 1
+        while pos < end:
+            if index < 0 or len(self.extents) <= index:
+                data.append(bytes(end - pos))
+                break
+            offset, length = self.extents[index]
+            length = min(self.starts[index] + length, end) - pos
+            if offset is None:
+                data.append(bytes(length))
+            else:
+                offset += pos - self.starts[index]
+                data.append(self.stream.readBytes(offset * 8, length))
+            pos += length
+            index += 1
+        data = b"".join(data)
+        if len(data) != nbytes:
+            raise ReadStreamError(8 * nbytes, 8 * start, 8 * len(data))
+        return shift, data, False
+
+
 class ConcatStream(InputStream):
     # TODO: concatene any number of any type of stream
 
@@ -597,6 +700,8 @@ class ConcatStream(InputStream):
         self.__streams = None
 
     def read(self, address, size):
+        if self.stats is not None:
+            self.stats.record(address, size)
         _size = self._size
         s = self.__size0 - address
         shift, data, missing = None, '', False
@@ -1,10 +1,16 @@
-from io import StringIO
+from io import StringIO, UnsupportedOperation
 from hachoir.core.endian import BIG_ENDIAN, LITTLE_ENDIAN
 from hachoir.core.bits import long2raw
 from hachoir.stream import StreamError
-from errno import EBADF
+from errno import EBADF, EINVAL, ENOSYS, EOPNOTSUPP, EXDEV
+import os
 
 MAX_READ_NBYTES = 2 ** 16
+COPY_BUFFER_SIZE = 2 ** 20   # 1 MB
+
+# errno values meaning "the kernel can't copy between these two files":
+# fallback to the next copy method
+_COPY_FALLBACK_ERRORS = (EBADF, EINVAL, ENOSYS, EOPNOTSUPP, EXDEV)
 
 
 class OutputStreamError(StreamError):
@@ -57,6 +63,9 @@ class OutputStream(object):
         assert endian in (BIG_ENDIAN, LITTLE_ENDIAN)
         assert 0 <= value < 2**count
 
+        # Bytes are collected and written with a single write() call
+        data = bytearray()
+
         # Feed bits to align to byte address
         if self._bit_pos != 0:
             n = 8 - self._bit_pos
@@ -68,8 +77,7 @@ class OutputStream(object):
                 else:
                     self._byte |= (value & ((1 << n) - 1)) << self._bit_pos
                     value >>= n
-                byte = bytes((self._byte,))
-                self._output.write(byte)
+                data.append(self._byte)
                 self._bit_pos = 0
                 self._byte = 0
             else:
@@ -80,16 +88,18 @@ class OutputStream(object):
                 self._bit_pos += count
                 return
 
-        # Write byte per byte
-        while 8 <= count:
-            count -= 8
+        # Convert all complete bytes at once
+        nbytes = count >> 3
+        if nbytes:
+            count -= nbytes * 8
             if endian is BIG_ENDIAN:
-                byte = (value >> count)
+                data += (value >> count).to_bytes(nbytes, "big")
                 value &= ((1 << count) - 1)
             else:
-                byte = (value & 0xFF)
-                value >>= 8
-            self._output.write(bytes([byte]))
+                data += (value & ((1 << (nbytes * 8)) - 1)).to_bytes(nbytes, "little")
+                value >>= nbytes * 8
+        if data:
+            self._output.write(data)
 
         # Keep last bits
         assert 0 <= count < 8
@@ -121,10 +131,24 @@ class OutputStream(object):
             self.writeBits(nb_bits, data, endian)
 
     def copyBytesFrom(self, input, address, nb_bytes):
+        """
+        Copy nb_bytes bytes of the input stream starting at address (in bits)
+        to the output.
+
+        If the input data are stored in a regular file and the output is a
+        file, the kernel copies the data (os.copy_file_range(), or
+        os.sendfile()). Otherwise, data are copied using a large buffer.
+        """
         if (address % 8):
             raise OutputStreamError(
                 "Unable to copy bytes with address with bit granularity")
-        buffer_size = 1 << 12   # 8192 (8 KB)
+        if nb_bytes <= 0:
+            return
+        copied = self._copyFileRange(input, address, nb_bytes)
+        address += copied * 8
+        nb_bytes -= copied
+
+        buffer_size = COPY_BUFFER_SIZE
         while 0 < nb_bytes:
             # Compute buffer size
             if nb_bytes < buffer_size:
@@ -140,6 +164,52 @@ class OutputStream(object):
             address += buffer_size * 8
             nb_bytes -= buffer_size
 
+    def _copyFileRange(self, input, address, nb_bytes):
+        """
+        Try to copy bytes using the kernel: os.copy_file_range(), or
+        os.sendfile().
+
+        Return the number of copied bytes, it can be smaller than nb_bytes
+        (ex: 0 if the kernel is unable to copy the data).
+        """
+        if self._bit_pos != 0:
+            return 0
+        file_range = input.getFileRange(address, nb_bytes)
+        if file_range is None:
+            return 0
+        in_fd, in_offset = file_range
+        try:
+            self._output.flush()
+            out_fd = self._output.fileno()
+            out_offset = self._output.tell()
+        except (AttributeError, UnsupportedOperation, OSError):
+            return 0
+
+        copied = 0
+        try:
+            for copy in (_copyFileRange, _sendFile):
+                if copy is None:
+                    continue
+                try:
+                    while copied < nb_bytes:
+                        size = copy(in_fd, out_fd,
+                                    in_offset + copied, out_offset + copied,
+                                    nb_bytes - copied)
+                        if not size:
+                            # end of the input file: let readBytes()
+                            # raise the error
+                            return copied
+                        copied += size
+                    return copied
+                except OSError as err:
+                    if err.errno not in _COPY_FALLBACK_ERRORS:
+                        raise
+            return copied
+        finally:
+            # Synchronize the position of the Python file object
+            # with the position of the file descriptor
+            self._output.seek(out_offset + copied)
+
     def writeBytes(self, bytes):
         if self._bit_pos != 0:
             raise NotImplementedError()
@@ -172,6 +242,21 @@ class OutputStream(object):
             self._output.seek(oldpos)
 
 
+if hasattr(os, "copy_file_range"):
+    def _copyFileRange(in_fd, out_fd, in_offset, out_offset, size):
+        return os.copy_file_range(in_fd, out_fd, size, in_offset, out_offset)
+else:
+    _copyFileRange = None
+
+if hasattr(os, "sendfile"):
+    def _sendFile(in_fd, out_fd, in_offset, out_offset, size):
+        # sendfile() writes at the current position of out_fd
+        os.lseek(out_fd, out_offset, os.SEEK_SET)
+        return os.sendfile(out_fd, in_fd, in_offset, size)
+else:
+    _sendFile = None
+
+
 def StringOutputStream():
     """
     Create an output stream into a string.
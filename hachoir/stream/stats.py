@@ -0,0 +1,121 @@
+"""
+Input stream I/O statistics: number of read() calls, read bytes, seeks
+and backward seeks, also aggregated per field set class.
+
+Statistics are disabled by default. Set hachoir.core.config.io_stats to True
+before creating a stream to get statistics in its "stats" attribute
+(set hachoir.core.config.io_trace to True to also record each read).
+"""
+
+from hachoir.core.tools import humanFilesize
+
+# Stack of the field sets which are creating fields (see traceFields())
+_fieldsets = []
+
+NO_FIELDSET = "(no field set)"
+
+
+class StreamStats:
+    """
+    I/O statistics of an input stream:
+    - read_calls: number of read() calls ;
+    - read_bits: number of read bits (see also read_bytes) ;
+    - seeks: number of reads which don't start where the previous read ended ;
+    - backward_seeks: number of reads starting before the end of the
+      previous read ;
+    - fieldsets: dictionary: field set class name => [read calls, read bits] ;
+    - trace: list of (address, size, field set class name) tuples, addresses
+      and sizes in bits (None if the trace is disabled).
+    """
+
+    def __init__(self, trace=False):
+        self.read_calls = 0
+        self.read_bits = 0
+        self.seeks = 0
+        self.backward_seeks = 0
+        self.fieldsets = {}
+        if trace:
+            self.trace = []
+        else:
+            self.trace = None
+        self._end = 0
+
+    read_bytes = property(lambda self: self.read_bits // 8)
+
+    def record(self, address, size):
+        """
+        Record a read of size bits at address (in bits)
+        """
+        self.read_calls += 1
+        self.read_bits += size
+        if address != self._end:
+            self.seeks += 1
+            if address < self._end:
+                self.backward_seeks += 1
+        self._end = address + size
+
+        if _fieldsets:
+            name = _fieldsets[-1].__class__.__name__
+        else:
+            name = NO_FIELDSET
+        try:
+            counters = self.fieldsets[name]
+        except KeyError:
+            counters = self.fieldsets[name] = [0, 0]
+        counters[0] += 1
+        counters[1] += size
+
+        if self.trace is not None:
+            self.trace.append((address, size, name))
+
+    def update(self, stats):
+        """
+        Add statistics of another stream
+        """
+        self.read_calls += stats.read_calls
+        self.read_bits += stats.read_bits
+        self.seeks += stats.seeks
+        self.backward_seeks += stats.backward_seeks
+        for name, (calls, bits) in stats.fieldsets.items():
+            counters = self.fieldsets.setdefault(name, [0, 0])
+            counters[0] += calls
+            counters[1] += bits
+        if self.trace is not None and stats.trace is not None:
+            self.trace.extend(stats.trace)
+
+    def exportPlaintext(self, limit=10):
+        """
+        Format statistics as a list of lines: global counters and then
+        the 'limit' field set classes which read the most bytes.
+        """
+        text = ["I/O statistics:",
+                "- read() calls: %s" % self.read_calls,
+                "- read: %s" % humanFilesize(self.read_bytes),
+                "- seeks: %s (backward: %s)"
+                % (self.seeks, self.backward_seeks)]
+        fieldsets = sorted(self.fieldsets.items(),
+                           key=lambda item: (-item[1][1], item[0]))
+        if limit:
+            fieldsets = fieldsets[:limit]
+        if fieldsets:
+            text.append("Reads per field set class:")
+        for name, (calls, bits) in fieldsets:
+            text.append("- %s: %s calls, %s"
+                        % (name, calls, humanFilesize(bits // 8)))
+        return text
+
+
+def traceFields(fieldset, fields):
+    """
+    Wrap the createFields() generator of a field set to attribute
+    the reads done while creating fields to the field set class.
+    """
+    while True:
+        _fieldsets.append(fieldset)
+        try:
+            field = next(fields)
+        except StopIteration:
+            return
+        finally:
+            del _fieldsets[-1]
+        yield field
@@ -1,8 +1,8 @@
 from hachoir.stream import FileInputStream
 from hachoir.core import config
-from hachoir.subfile.search import SearchSubfile
+from hachoir.subfile.search import SearchSubfile, GUESS_TIMEOUT
 from hachoir.core.cmd_line import displayVersion
-from sys import exit
+from sys import exit, stderr
 from optparse import OptionGroup, OptionParser
 
 
@@ -19,12 +19,17 @@ def parseOptions():
                       action="store", type='str', default=None)
     common.add_option("--parser", help="Parser identifier list (separated with a comma)",
                       action="store", type='str', default=None)
+    common.add_option("--timeout",
+                      help="Maximum duration in seconds to validate a subfile, 0 means unlimited (default: %s)" % GUESS_TIMEOUT,
+                      action="store", type='float', default=GUESS_TIMEOUT)
     common.add_option("--version", help="Display version and exit",
                       action="callback", callback=displayVersion)
     common.add_option("--quiet", help="Be quiet",
                       action="store_true", default=False)
     common.add_option("--profiler", help="Run profiler",
                       action="store_true", default=False)
+    common.add_option("--io-stats", help="Display I/O statistics on stderr",
+                      action="store_true", default=False)
     common.add_option("--debug", help="Enable debug mode",
                       action="store_true", default=False)
     parser.add_option_group(common)
@@ -82,11 +87,14 @@ def main():
     # Initialize
     values, filename, output = parseOptions()
     config.quiet = True
+    if values.io_stats:
+        config.io_stats = True
     stream = FileInputStream(filename)
     with stream:
         subfile = SearchSubfile(stream, values.offset, values.size)
         subfile.verbose = not(values.quiet)
         subfile.debug = values.debug
+        subfile.guess_timeout = values.timeout or None
         if output:
             subfile.setOutput(output)
         if values.profiler:
@@ -94,4 +102,7 @@ def main():
             ok = runProfiler(runSearch, (subfile, values))
         else:
             ok = runSearch(subfile, values)
+    if values.io_stats:
+        for line in stream.stats.exportPlaintext():
+            print(line, file=stderr)
     exit(int(not ok))
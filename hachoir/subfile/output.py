@@ -38,11 +38,10 @@ class Output:
 
         # Create output file
         filename = path.join(self.directory, filename)
-        output = FileOutputStream(filename)
-
-        # Write output
-        try:
-            output.copyBytesFrom(stream, offset, size // 8)
-        except StreamError as err:
-            error("copyBytesFrom() error: %s" % err)
+        with FileOutputStream(filename) as output:
+            # Write output
+            try:
+                output.copyBytesFrom(stream, offset, size // 8)
+            except StreamError as err:
+                error("copyBytesFrom() error: %s" % err)
         return filename
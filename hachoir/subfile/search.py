@@ -1,6 +1,7 @@
 from hachoir.stream import InputSubStream
 from hachoir.core.tools import humanFilesize, humanDuration
 from hachoir.core.memory import limitedMemory
+from hachoir.core.budget import ParseBudget, BudgetExceeded
 from hachoir.subfile.data_rate import DataRate
 from hachoir.subfile.output import Output
 from hachoir.subfile.pattern import HachoirPatternMatching as PatternMatching
@@ -16,6 +17,7 @@ def skipSubfile(parser):
 FILE_MAX_SIZE = 100 * 1024 * 1024   # Max. file size in bytes (100 MB)
 SLICE_SIZE = 64 * 1024                # Slice size in bytes (64 KB)
 MEMORY_LIMIT = 50 * 1024 * 1024
+GUESS_TIMEOUT = 5.0     # Maximum duration (in second) to validate a subfile
 PROGRESS_UPDATE = 1.5   # Minimum number of second between two progress messages
 
 
@@ -63,6 +65,11 @@ class SearchSubfile:
         self.output = None
         self.filter = None
 
+        # Budget of guess(): see ParseBudget
+        self.guess_timeout = GUESS_TIMEOUT
+        self.guess_max_read = None
+        self.guess_max_fields = None
+
     def setOutput(self, directory):
         self.output = Output(directory)
 
@@ -217,11 +224,24 @@ class SearchSubfile:
         """
         Try the specified parser at stream offset 'offset'.
 
-        Return the parser object, or None on failure.
+        Return the parser object, or None on failure or if the budget
+        (guess_timeout, guess_max_read and guess_max_fields attributes)
+        is exceeded.
         """
         substream = InputSubStream(self.stream, offset)
+        budget = ParseBudget(self.guess_timeout, self.guess_max_read,
+                             self.guess_max_fields)
         try:
-            return parser_cls(substream, validate=True)
+            with budget:
+                parser = parser_cls(substream, validate=True)
+                # content size is used by processParser() and findMagic()
+                parser.content_size
+            return parser
+        except BudgetExceeded as err:
+            if self.debug:
+                print("Skip %s at offset %s: %s" % (
+                    parser_cls.__name__, offset // 8, err), file=stderr)
+            return None
         except Exception:
             return None
 
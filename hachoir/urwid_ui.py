@@ -7,6 +7,7 @@ from hachoir.core.cmd_line import displayVersion
 from hachoir.field import Field, MissingField
 from hachoir.stream import InputFieldStream, InputStreamError, FileInputStream
 from hachoir.parser import guessParser, HachoirParserList
+from hachoir.parser.network.resolver import Resolver, setResolver
 from urwid import (AttrWrap, BoxAdapter, CanvasJoin, Edit, Frame, ListBox,
                    Pile, Text, WidgetPlaceholder)
 from shutil import copyfileobj
@@ -191,6 +192,13 @@ class Walker(ListWalker):
             self.set_focus(self.fromField(root, path))
             assert not self.event
 
+    def invalidate(self):
+        """
+        Update the text of all nodes (ex: new host names are resolved)
+        """
+        self.getRoot().refresh()
+        self._modified()
+
     def read(self, pos, number, first=False):
         if first:
             number = number - pos.field.current_length
@@ -649,6 +657,15 @@ def exploreFieldSet(field_set, args, options={}):
         top.set_focus('body')
     input = Input(input_enter, input_leave)
 
+    # Addresses resolved by the resolver thread pool
+    resolved = []
+    if args.resolve:
+        resolver = Resolver(callback=lambda addr, name: resolved.append(addr))
+        previous_resolver = setResolver(resolver)
+        ui.set_input_timeouts(max_wait=0.5)
+    else:
+        resolver = None
+
     def run():
         msg = _resize = retry = 0
         events = ("window resize", )
@@ -735,6 +752,12 @@ def exploreFieldSet(field_set, args, options={}):
                 events = ui.get_input()
                 if events:
                     break
+                if resolved:
+                    del resolved[:]
+                    for name, tab in body.tabs:
+                        if isinstance(tab, TreeBox):
+                            tab.body.invalidate()
+                    break
 
     try:
         ui.run_wrapper(run)
@@ -745,6 +768,10 @@ def exploreFieldSet(field_set, args, options={}):
         if pending:
             print("\nPending messages:\n" + '\n'.join(pending))
         raise
+    finally:
+        if resolver is not None:
+            setResolver(previous_resolver)
+            resolver.close()
 
 
 def displayParserList(*args):
@@ -776,6 +803,8 @@ def parseOptions():
                       action="store_false", default=True)
     common.add_option("--hide-size", dest="display_size", help="Don't display size",
                       action="store_false", default=True)
+    common.add_option("--no-resolve", dest="resolve", help="Don't resolve IP addresses to host names",
+                      action="store_false", default=True)
     common.add_option("--version", help="Display version and exit",
                       action="callback", callback=displayVersion)
     parser.add_option_group(common)
@@ -33,6 +33,7 @@ ENTRY_POINTS = {
     'console_scripts': [
         "hachoir-grep = hachoir.grep:main",
         "hachoir-metadata = hachoir.metadata.main:main",
+        "hachoir-server = hachoir.server:main",
         "hachoir-strip = hachoir.strip:main",
         "hachoir-urwid = hachoir.urwid_ui:main"
     ],
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test hachoir.core tools.
+"""
+
+from hachoir.core import budget
+from hachoir.core.budget import ParseBudget, BudgetExceeded
+from hachoir.core.profiler import FieldSetProfiler
+from hachoir.metadata import extractMetadata
+from hachoir.parser import createParser
+from hachoir.test import setup_tests
+import os
+import time
+import unittest
+
+DATADIR = os.path.join(os.path.dirname(__file__), "files")
+GEORGIA_CAB = os.path.join(DATADIR, 'georgia.cab')
+
+
+def parseAll(fieldset):
+    for field in fieldset:
+        if field.is_field_set:
+            parseAll(field)
+
+
+class TestFieldSetProfiler(unittest.TestCase):
+
+    def test_profile(self):
+        with FieldSetProfiler() as profiler:
+            parser = createParser(GEORGIA_CAB)
+            with parser:
+                parseAll(parser)
+
+        stats = profiler.stats
+        self.assertEqual(stats[("CabFile", "CabFile")][1], len(parser))
+        self.assertEqual(stats[("CabFile", "Folder")][1], 6)
+        parsers = profiler.getParserStats()
+        self.assertEqual(list(parsers), ["CabFile"])
+        self.assertEqual(parsers["CabFile"][1],
+                         sum(stat[1] for stat in stats.values()))
+
+        data = profiler.exportJSON()
+        self.assertEqual(data["parsers"][0]["parser"], "CabFile")
+        self.assertEqual(len(data["fieldsets"]), len(stats))
+        self.assertEqual(len(profiler.exportPlaintext(limit=3)), 4)
+
+    def test_stopped(self):
+        with FieldSetProfiler(memory=False) as profiler:
+            pass
+        parser = createParser(GEORGIA_CAB)
+        with parser:
+            parseAll(parser)
+        self.assertEqual(profiler.stats, {})
+
+
+class TestParseBudget(unittest.TestCase):
+
+    def test_max_fields(self):
+        parser = createParser(GEORGIA_CAB)
+        with parser:
+            with self.assertRaises(BudgetExceeded) as cm:
+                with ParseBudget(max_fields=20):
+                    parseAll(parser)
+        self.assertEqual(cm.exception.resource, "fields")
+        self.assertIsNone(budget.current)
+
+    def test_max_read(self):
+        with self.assertRaises(BudgetExceeded) as cm:
+            createParser(GEORGIA_CAB, budget=ParseBudget(max_read=2))
+        self.assertEqual(cm.exception.resource, "read")
+
+    def test_timeout(self):
+        parser_budget = ParseBudget(timeout=1e-6)
+        parser = createParser(GEORGIA_CAB)
+        with parser:
+            time.sleep(0.001)
+            with self.assertRaises(BudgetExceeded) as cm:
+                extractMetadata(parser, budget=parser_budget)
+        self.assertEqual(cm.exception.resource, "time")
+
+    def test_shared_budget(self):
+        parser_budget = ParseBudget(timeout=60.0, max_fields=10000)
+        parser = createParser(GEORGIA_CAB, budget=parser_budget)
+        with parser:
+            fields = parser_budget.fields
+            metadata = extractMetadata(parser, budget=parser_budget)
+        self.assertEqual(metadata.get('compression'), 'LZX (level 21)')
+        self.assertLess(fields, parser_budget.fields)
+        self.assertLess(0, parser_budget.read_bits)
+
+
+if __name__ == "__main__":
+    setup_tests()
+    unittest.main()
@@ -59,6 +59,7 @@ class TestDoc(unittest.TestCase):
         self.check_module("hachoir.core.tools")
 
     def test_hachoir_metadata(self):
+        self.check_module("hachoir.metadata.export")
         self.check_module("hachoir.metadata.metadata")
         self.check_module("hachoir.metadata.setter")
 
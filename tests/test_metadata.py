@@ -3,15 +3,30 @@
 Test hachoir-metadata using the testcase.
 """
 
-from hachoir.parser import createParser
+from hachoir.parser import createParser, guessParser
 from hachoir.core.language import Language
 from hachoir.metadata import extractMetadata
+from hachoir.metadata import config as metadata_config
+from hachoir.metadata.batch import iterFiles, runPool, BatchSummary
+from hachoir.metadata.cache import MetadataCache
+from hachoir.metadata.export import (getColumns, createRecord, filterRecord,
+                                     formatCSV)
+from hachoir.metadata.metadata import RootMetadata
 from hachoir.metadata.timezone import createTimezone
+from hachoir.stream import StringInputStream
 from hachoir.test import setup_tests
+from concurrent.futures.process import BrokenProcessPool
 from datetime import date, timedelta, datetime
+import csv
+import io
+import json
 import os
+import shutil
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import time
 import unittest
 
 DATADIR = os.path.join(os.path.dirname(__file__), 'files')
@@ -48,10 +63,13 @@ class TestMetadata(unittest.TestCase):
 
     def test_dict_output(self):
         required_meta = {'Common': {'duration': '0:00:17.844000',
-                                    'creation_date': '2006-08-16 11:04:36',
+                                    'creation_date': '2006-06-09',
                                     'producer': 'libebml v0.7.7 + libmatroska v0.8.0',
                                     'mime_type': 'video/x-matroska',
-                                    'endian': 'Big endian'
+                                    'endian': 'Big endian',
+                                    'title': 'flash-mob FNAC Montparnasse du 9 juin à Paris (extraits)',
+                                    'copyright': '© dadaprod, licence Creative Commons by-nc-sa 2.0 fr',
+                                    'url': 'http://stopdrm.info/index.php?2006/06/11/89-on-remet-ca-paris'
                                     },
                          'video[1]': {'language': 'French',
                                       'width': '384',
@@ -156,6 +174,12 @@ class TestMetadata(unittest.TestCase):
         self.check_attr(
             metadata, "comment", "Stainless Steel Provider is compilated to the car of Twinstar.")
 
+    def test_mp3_vbr(self):
+        # duration computed from the Xing header
+        metadata = self.extract("steganography.mp3")
+        self.check_attr(metadata, "duration",
+                        timedelta(seconds=9570 * 1152 / 44100))
+
     def test_png2(self):
         metadata = self.extract("png_331x90x8_truncated.png")
         self.check_attr(metadata, "width", 331)
@@ -173,6 +197,28 @@ class TestMetadata(unittest.TestCase):
         self.check_attr(metadata, "duration", timedelta(
             seconds=17, milliseconds=844))
 
+    def test_mkv_invalid_seek_head(self):
+        with open(os.path.join(DATADIR, "flashmob.mkv"), "rb") as fp:
+            data = bytearray(fp.read())
+        # unknown length of the first Seek element
+        data[43] = 0xFF
+        with guessParser(StringInputStream(bytes(data))) as parser:
+            # metadata are extracted by walking the fields of the segment
+            metadata = extractMetadata(parser, 1.0)
+        self.check_attr(metadata, "copyright",
+                        "© dadaprod, licence Creative Commons by-nc-sa 2.0 fr")
+        self.check_attr(metadata, "video[1]/width", 384)
+
+    def test_mkv_truncated(self):
+        with open(os.path.join(DATADIR, "flashmob.mkv"), "rb") as fp:
+            data = fp.read(150000)
+        # the SeekHead and the Cues point after the end of the file
+        with guessParser(StringInputStream(data)) as parser:
+            metadata = extractMetadata(parser)
+        self.check_attr(metadata, "duration", timedelta(
+            seconds=17, milliseconds=844))
+        self.check_attr(metadata, "video[1]/width", 384)
+
     def test_mkv2(self):
         meta = self.extract("10min.mkv")
         self.check_attr(meta, "duration", timedelta(minutes=10))
@@ -351,6 +397,8 @@ class TestMetadata(unittest.TestCase):
         self.check_attr(meta, "file[2]/filename",
                         "Configurations2/accelerator/current.xml")
         self.check_attr(meta, "file[2]/compression", "Deflate")
+        self.check_attr(meta, "file[2]/file_size", 0)
+        self.check_attr(meta, "file[15]/filename", "META-INF/manifest.xml")
 
     def test_rm(self):
         meta = self.extract("firstrun.rm")
@@ -499,6 +547,120 @@ class TestMetadata(unittest.TestCase):
         self.check_attr(meta, 'camera_model', 'Canon EOS REBEL T5i')
 
 
+class TestMetadataItems(unittest.TestCase):
+
+    def test_sparse(self):
+        meta = RootMetadata()
+        self.assertFalse(meta)
+        self.assertEqual(list(meta), [])
+        self.assertFalse(meta.has('title'))
+        self.assertEqual(meta.getValues('title'), [])
+        self.assertIsNone(meta.getItem('title', 0))
+        self.assertRaises(KeyError, setattr, meta, 'unknown_key', 1)
+        self.assertRaises(ValueError, meta.getItems, 'unknown_key')
+
+        # value rejected by the filter
+        meta.width = 0
+        self.assertEqual(list(meta), [])
+
+        meta.title = "Title"
+        meta.width = 640
+        self.assertEqual([data.key for data in meta], ['title', 'width'])
+        self.assertEqual(meta.get('width'), 640)
+        self.assertIs(meta.getItems('width').metadata, meta)
+
+        # definitions are shared, values are not
+        other = RootMetadata()
+        self.assertFalse(other.has('title'))
+        self.assertIs(meta.getItems('title').text_handler,
+                      other.getItems('title').text_handler)
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache(self):
+        filename = os.path.join(DATADIR, '10min.mkv')
+        with MetadataCache(self.filename) as cache:
+            parser_id, metadata = cache.extractMetadata(filename)
+            self.assertEqual((cache.hits, cache.misses), (0, 1))
+        with MetadataCache(self.filename) as cache:
+            parser_id2, metadata2 = cache.extractMetadata(filename)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            self.assertEqual(cache.getStats()['entries'], 1)
+        self.assertEqual(parser_id2, 'matroska')
+        self.assertEqual(metadata2.exportPlaintext(),
+                         metadata.exportPlaintext())
+        self.assertEqual(metadata2.exportValues(), metadata.exportValues())
+
+    def test_invalidation(self):
+        filename = os.path.join(self.tmpdir, 'file.jpg')
+        shutil.copyfile(os.path.join(DATADIR, 'gps.jpg'), filename)
+        with MetadataCache(self.filename) as cache:
+            cache.extractMetadata(filename)
+
+            # modified file
+            with open(filename, 'r+b') as fp:
+                fp.seek(0, os.SEEK_END)
+                fp.write(b'\0')
+            cache.extractMetadata(filename)
+            self.assertEqual((cache.hits, cache.misses), (0, 2))
+            self.assertEqual(cache.getStats()['entries'], 1)
+
+            # removed file
+            os.unlink(filename)
+            self.assertEqual(cache.clean(), 1)
+            self.assertEqual(cache.getStats()['entries'], 0)
+
+    def test_no_parser(self):
+        filename = os.path.join(self.tmpdir, 'file.bin')
+        with open(filename, 'wb') as fp:
+            fp.write(b'\0' * 100)
+        with MetadataCache(self.filename) as cache:
+            self.assertEqual(cache.extractMetadata(filename), (None, None))
+            self.assertEqual(cache.extractMetadata(filename), (None, None))
+            self.assertEqual(cache.hits, 1)
+
+    def test_options(self):
+        filename = os.path.join(DATADIR, 'gps.jpg')
+        maxlen = metadata_config.MAX_STR_LENGTH
+        with MetadataCache(self.filename) as cache:
+            cache.extractMetadata(filename)
+            try:
+                metadata_config.MAX_STR_LENGTH = 10
+                cache.extractMetadata(filename)
+            finally:
+                metadata_config.MAX_STR_LENGTH = maxlen
+            cache.extractMetadata(filename)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(cache.getStats()['entries'], 2)
+
+    def test_last_use(self):
+        filename = os.path.join(DATADIR, 'gps.jpg')
+        with MetadataCache(self.filename) as cache:
+            cache.extractMetadata(filename)
+        db = sqlite3.connect(self.filename)
+        try:
+            with db:
+                db.execute("UPDATE metadata SET last_use=0")
+            with MetadataCache(self.filename) as cache:
+                cache.extractMetadata(filename)
+                # a hit doesn't write into the database
+                self.assertEqual(
+                    db.execute("SELECT last_use FROM metadata").fetchone(),
+                    (0,))
+            last_use = db.execute("SELECT last_use FROM metadata").fetchone()
+            self.assertGreater(last_use[0], 0)
+        finally:
+            db.close()
+
+
 class TestMetadataCommandLine(unittest.TestCase):
 
     def test_metadata(self):
@@ -530,6 +692,125 @@ class TestMetadataCommandLine(unittest.TestCase):
 - MIME type: image/jpeg
 - Endianness: Big endian""")
 
+    def test_batch(self):
+        args = [sys.executable, PROGRAM, '--mime', '--jobs', '2',
+                os.path.join(DATADIR, 'gps.jpg'),
+                os.path.join(DATADIR, 'georgia.cab'),
+                os.path.join(DATADIR, 'kde_click.wav')]
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        self.assertEqual(proc.returncode, 0)
+        lines = stdout.decode('ascii', 'replace').splitlines()
+        self.assertEqual([line.split(': ', 1)[1] for line in lines],
+                         ['image/jpeg',
+                          'application/vnd.ms-cab-compressed',
+                          'audio/x-wav'])
+        self.assertIn('- Files: 3', stderr.decode('ascii', 'replace'))
+
+    def test_json(self):
+        args = [sys.executable, PROGRAM, '--format=json',
+                os.path.join(DATADIR, 'gps.jpg'),
+                os.path.join(DATADIR, '10min.mkv')]
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+        stdout, _ = proc.communicate()
+        records = [json.loads(line) for line in stdout.decode('ascii').splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['path'], os.path.join(DATADIR, 'gps.jpg'))
+        self.assertEqual(records[0]['parser'], 'jpeg')
+        self.assertEqual(records[0]['width'], 144)
+        self.assertEqual(records[0]['creation_date'], '2003-05-24T22:29:14')
+        self.assertEqual(records[1]['duration'], 600.0)
+        self.assertEqual(records[1]['groups']['video[1]']['language'], 'eng')
+
+    def test_csv(self):
+        args = [sys.executable, PROGRAM, '--format=csv',
+                '--fields=duration,width',
+                os.path.join(DATADIR, 'gps.jpg'),
+                os.path.join(DATADIR, '10min.mkv')]
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+        stdout, _ = proc.communicate()
+        rows = list(csv.reader(io.StringIO(stdout.decode('ascii'))))
+        self.assertEqual(rows[0], ['path', 'parser', 'duration', 'width'])
+        self.assertEqual(rows[1][1:], ['jpeg', '', '144'])
+        self.assertEqual(rows[2][1:], ['matroska', '600.0', '384'])
+
+
+class TestExport(unittest.TestCase):
+
+    def test_columns(self):
+        columns = getColumns()
+        self.assertEqual(columns[:3], ['path', 'parser', 'os'])
+        self.assertEqual(len(columns), len(set(columns)))
+        self.assertIn('compression', columns)
+
+    def test_record(self):
+        meta = RootMetadata()
+        meta.duration = timedelta(seconds=3, milliseconds=250)
+        meta.producer = "a"
+        meta.producer = "b"
+        meta.has_password = True
+        record = createRecord('file.bin', 'test', meta)
+        self.assertEqual(record, {'path': 'file.bin', 'parser': 'test',
+                                  'producer': ['a', 'b'], 'duration': 3.25,
+                                  'has_password': True})
+        self.assertEqual(formatCSV(record, ['path', 'producer', 'duration',
+                                            'has_password', 'title']),
+                         'file.bin,a | b,3.25,1,')
+        self.assertEqual(filterRecord(record, ['duration']),
+                         {'path': 'file.bin', 'parser': 'test',
+                          'duration': 3.25})
+
+
+def exitOrSleep(item):
+    if item == "exit":
+        os._exit(1)
+    if item == "sleep":
+        time.sleep(60)
+    return item
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_iter_files(self):
+        filenames = list(iterFiles([DATADIR], recursive=True))
+        self.assertIn(os.path.join(DATADIR, 'gps.jpg'), filenames)
+        self.assertEqual(filenames, sorted(filenames))
+        self.assertEqual(list(iterFiles([DATADIR])), [DATADIR])
+
+    def test_run_pool(self):
+        items = list(range(20))
+        results = list(runPool(abs, items, 2, buffer_size=3))
+        self.assertEqual(results, [(item, item) for item in items])
+        results = list(runPool(abs, items, 2, ordered=False))
+        self.assertEqual(sorted(results), [(item, item) for item in items])
+
+    def test_run_pool_errors(self):
+        # A worker which dies and a worker which hangs don't stop the batch
+        items = list(range(6)) + ["exit", "sleep"] + list(range(6, 10))
+        results = list(runPool(exitOrSleep, items, 2, timeout=2.0,
+                               on_error=lambda item, err: type(err).__name__))
+        self.assertEqual(results,
+                         [(item, item) for item in range(6)]
+                         + [("exit", "BrokenProcessPool"),
+                            ("sleep", "TimeoutError")]
+                         + [(item, item) for item in range(6, 10)])
+        with self.assertRaises(BrokenProcessPool):
+            list(runPool(exitOrSleep, ["exit"], 1))
+
+    def test_summary(self):
+        summary = BatchSummary(slowest=2)
+        summary.add('a', True, 0.1)
+        summary.add('b', False, 0.3)
+        summary.add('c', True, 0.2)
+        self.assertEqual(summary.files, 3)
+        self.assertEqual(summary.failures, 1)
+        self.assertEqual(summary.getSlowest(), [(0.3, 'b'), (0.2, 'c')])
+        text = summary.exportPlaintext()
+        self.assertEqual(text[:3], ["Summary:", "- Files: 3", "- Failures: 1"])
+        self.assertEqual(text[-2:], ["- b: 300 ms", "- c: 200 ms"])
+
 
 if __name__ == "__main__":
     setup_tests()
@@ -4,15 +4,32 @@ Test hachoir-parser using the testcase.
 """
 
 from hachoir.core.error import error
+from hachoir.field import ParserError
 from hachoir.stream import StringInputStream
 from hachoir.parser import createParser, HachoirParserList, ValidateError
+from hachoir.parser.archive.zip import ZipFile
+from hachoir.parser.audio.mpeg_audio import scanFrameHeaders
+from hachoir.parser.file_system.fat import FatTable
+from hachoir.parser.file_system.iso9660 import ISO9660, IsoFileSystem
+from hachoir.parser.file_system.ntfs import NTFS
+from hachoir.parser.image.jpeg import findMarker, SEARCH_BLOCK_SIZE
+from hachoir.parser.misc.pdf import PDFReference
+from hachoir.parser.network.resolver import Resolver, setResolver, ip2name
+from hachoir.parser.network.pcapng import PcapNgFile, MAX_TIMESTAMP
+from hachoir.parser.network.tcpdump import TcpdumpFile
+from hachoir.parser.video.mov import MovFile
+from hachoir.parser.video.mpeg_ts import MPEG_TS, PacketTable, has_numpy
 from hachoir.test import setup_tests
 from array import array
 from datetime import datetime
+import io
 import random
+import struct
 import os
 import sys
+import threading
 import unittest
+import zipfile
 
 DATADIR = os.path.join(os.path.dirname(__file__), 'files')
 
@@ -113,6 +130,59 @@ class TestParsers(unittest.TestCase):
         self.checkValue(
             parser, "/Segment[0]/Tracks[0]/TrackEntry[0]/CodecID/string", "V_MPEG4/ISO/AVC")
 
+    def test_mkv_segment_index(self):
+        # Elements located using the SeekHead, clusters are not parsed
+        parser = self.parse("flashmob.mkv")
+        index = parser.getSegmentIndex(parser["Segment[0]"])
+        tags = index.getElements("Tags")
+        self.assertEqual([field.name for field in tags], ["Tags[0]"])
+        self.assertEqual(tags[0]["Tag[0]/SimpleTag[3]/TagString/unicode"].value,
+                         "\xa9 dadaprod, licence Creative Commons by-nc-sa 2.0 fr")
+        self.assertEqual(index.getCues()[1], (6440, 1, 623210))
+        positions = list(index.iterClusterPositions())
+        self.assertEqual(len(positions), 9)
+        self.assertEqual(positions[0], 75644)
+        cluster = index.getElement(positions[3])
+        self.assertEqual(cluster.name, "Cluster[3]")
+        self.assertEqual(cluster["BlockGroup[14]/Block/block/timecode"].value, 422)
+        # the index of a cluster doesn't depend on the order of creation
+        index = parser.getSegmentIndex(parser["Segment[0]"])
+        cluster = index.getElement(positions[5])
+        self.assertEqual(cluster.name, "Cluster[5]")
+        self.assertEqual(cluster.absolute_address,
+                         parser["Segment[0]/Cluster[5]"].absolute_address)
+
+        # Without SeekHead: elements are located using their size
+        parser = self.parse("10min.mkv")
+        index = parser.getSegmentIndex(parser["Segment[0]"])
+        info = index.getElements("Info")[0]
+        self.assertEqual(info["Duration/float"].value, 12000000.0)
+        self.assertEqual(len(list(index.iterClusters())), 300)
+
+    def test_mov_atom_index(self):
+        parser = self.parse("quicktime.mp4")
+        self.assertEqual([atom[0] for atom in parser.getAtomIndex()],
+                         ["ftyp", "moov", "free", "free", "mdat"])
+        moov = parser.getTopAtom("moov")
+        self.assertEqual(moov.path, "/atom[1]")
+        self.assertEqual(moov["movie/atom[0]/movie_hdr/time_scale"].value, 600)
+
+        audio, video = parser.getSampleTables()
+        self.assertEqual(video.handler, "vide")
+        self.assertEqual(video.getSampleCount(), 149)
+        self.assertAlmostEqual(video.getDuration(), 149 / 30)
+        self.assertEqual(list(video.getSampleOffsets()[:3]), [4304, 5460, 5565])
+        self.assertEqual(audio.time_scale, 32000)
+        self.assertEqual(len(audio.chunk_offsets), 20)
+
+        # 64-bit atom size
+        moov = self.parse("pentax_320x240.mov").stream.readBytes(0, 1938)
+        data = (struct.pack(">L4sQ", 1, b"mdat", 16 + 100) + bytes(100)
+                + moov)
+        parser = MovFile(StringInputStream(data), validate=False)
+        self.assertEqual(parser.getAtomIndex()[0], ("mdat", 0, 116, 16))
+        self.assertEqual(parser.getTopAtom("moov").path, "/atom[1]")
+
     def test_ico(self):
         parser = self.parse("wormux_32x32_16c.ico")
         self.checkValue(parser, "icon_header[0]/height", 16)
@@ -147,6 +217,100 @@ class TestParsers(unittest.TestCase):
         self.checkDesc(
             parser, "/frames/frame[1]", 'MPEG-1 layer III, 160.0 Kbit/sec, 44.1 kHz')
 
+    def test_mp3_scan_frames(self):
+        # Xing header in the first frame
+        parser = self.parse("steganography.mp3")
+        frame = parser["/frames/frame[0]"]
+        scan = scanFrameHeaders(parser.stream, frame.absolute_address,
+                                parser.size - frame.absolute_address)
+        self.assertEqual(scan.vbr_header, ('Xing', 9570, 4126562))
+        self.assertEqual(scan.frame_count, 2)
+        self.assertEqual(scan.bit_rates, {160000: 1, 128000: 1})
+        self.assertAlmostEqual(scan.getDuration(), 9570 * 1152 / 44100)
+
+        # Frames without VBR header: 3 frames of 128 kbit/s and
+        # 2 frames of 64 kbit/s (MPEG-1 layer III, 44.1 kHz)
+        data = b"".join(
+            header.to_bytes(4, "big") + b"\0" * (size - 4)
+            for header, size in ((0xfffb9064, 417), (0xfffb9264, 418),
+                                 (0xfffb9064, 417), (0xfffb5064, 208),
+                                 (0xfffb5064, 208)))
+        stream = StringInputStream(data + b"junk")
+        scan = scanFrameHeaders(stream, 0, len(data) * 8)
+        self.assertIsNone(scan.vbr_header)
+        self.assertTrue(scan.complete)
+        self.assertEqual(scan.frame_count, 5)
+        self.assertEqual(scan.bit_rates, {128000: 3, 64000: 2})
+        self.assertAlmostEqual(scan.getDuration(), 5 * 1152 / 44100)
+        self.assertAlmostEqual(scan.getBitRate(),
+                               len(data) * 8 / scan.getDuration())
+
+        scan = scanFrameHeaders(stream, 0, stream.size, max_frames=2)
+        self.assertFalse(scan.complete)
+        self.assertEqual(scan.frame_count, 2)
+        self.assertIsNone(scan.getDuration())
+
+        # Invalid data after the frames
+        scan = scanFrameHeaders(stream, 0, stream.size)
+        self.assertFalse(scan.complete)
+        self.assertEqual(scan.frame_count, 5)
+        self.assertIsNone(scan.getDuration())
+
+        # Corrupted header of the third frame
+        corrupted = data[:835] + b"\0\0\0\0" + data[839:]
+        stream = StringInputStream(corrupted)
+        scan = scanFrameHeaders(stream, 0, stream.size)
+        self.assertFalse(scan.complete)
+        self.assertEqual(scan.frame_count, 2)
+        self.assertIsNone(scan.getDuration())
+        self.assertIsNotNone(scan.getBitRate())
+
+    def test_zip_central_directory(self):
+        parser = self.parse("hachoir.org.sxw")
+        directory = parser.getCentralDirectory()
+        self.assertEqual(len(directory), 16)
+        self.assertEqual(directory[0].filename, "mimetype")
+        member = directory.getMember("Configurations2/accelerator/current.xml")
+        self.assertEqual(member.index, 2)
+        self.assertEqual(member.compressed_size, 2)
+        self.assertEqual(member.uncompressed_size, 0)
+        self.assertEqual(member.getDatetime(), datetime(2007, 1, 22, 19, 8, 14))
+        self.assertNotIn("missing.xml", directory)
+
+        member = directory.getMember("content.xml")
+        self.assertEqual(member.compressed_size, 4650)
+        entry = parser.getFileEntry(member)
+        self.assertEqual(entry["filename"].value, "content.xml")
+        self.assertEqual(entry["compression"].value, member.compression)
+
+        # Data before the archive (ex: self-extracting archive)
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as archive:
+            archive.writestr("a.txt", b"hello")
+            archive.comment = b"comment"
+        stream = StringInputStream(b"x" * 100 + output.getvalue())
+        directory = ZipFile(stream, validate=False).getCentralDirectory()
+        self.assertEqual(directory.comment, b"comment")
+        self.assertEqual(directory[0].offset_header, 100)
+
+        # ZIP64 end of central directory with data before the archive
+        output = io.BytesIO()
+        limit = zipfile.ZIP_FILECOUNT_LIMIT
+        zipfile.ZIP_FILECOUNT_LIMIT = 0
+        try:
+            with zipfile.ZipFile(output, "w") as archive:
+                archive.writestr("a.txt", b"hello")
+                archive.writestr("b.txt", b"world")
+        finally:
+            zipfile.ZIP_FILECOUNT_LIMIT = limit
+        self.assertIn(b"PK\6\6", output.getvalue())
+        stream = StringInputStream(b"x" * 100 + output.getvalue())
+        directory = ZipFile(stream, validate=False).getCentralDirectory()
+        self.assertEqual([member.filename for member in directory],
+                         ["a.txt", "b.txt"])
+        self.assertEqual(directory[1].offset_header,
+                         100 + output.getvalue().index(b"PK\3\4", 1))
+
     def test_rpm(self):
         parser = self.parse("ftp-0.17-537.i586.rpm")
         self.checkValue(parser, "name", "ftp-0.17-537")
@@ -164,6 +328,34 @@ class TestParsers(unittest.TestCase):
         self.checkValue(parser, "exif/content/header", "Exif\0\0")
         self.checkValue(parser, "exif/content/version", 42)
 
+    def test_jpeg_marker_index(self):
+        parser = self.parse("usa_railroad.jpg")
+        index = parser.getMarkerIndex(stop_at_scan=True)
+        self.assertFalse(index.complete)
+        self.assertEqual(index.segments[-1], (0xDA, 20743, 14))
+        chunks = parser.getHeaderChunks()
+        self.assertEqual([chunk.name for chunk in chunks][-3:],
+                         ["restart_interval", "huffman[0]", "start_scan[0]"])
+        self.assertEqual(chunks[7].name, "quantization[0]")
+        self.assertEqual(chunks[7]["content/qt[0]/coeff[0]"].value, 4)
+
+        index = parser.getMarkerIndex()
+        self.assertTrue(index.complete)
+        # Restart markers are part of the entropy-coded data
+        self.assertEqual(index.scans, [(20757, 82989)])
+        self.assertEqual(index.segments[-1], (0xD9, 103746, 2))
+        self.assertEqual(index.end, 103748)
+        self.assertEqual(parser.content_size, 103748 * 8)
+
+        # Stuffed byte and 0xFF at the end of a search block
+        data = (b"\x12" * (SEARCH_BLOCK_SIZE - 1) + b"\xff\x00\x34"
+                + b"\xff\xd0\x56\xff\xd9")
+        stream = StringInputStream(data)
+        self.assertEqual(findMarker(stream, 0), (SEARCH_BLOCK_SIZE + 2) * 8)
+        self.assertEqual(findMarker(stream, 0, True),
+                         (SEARCH_BLOCK_SIZE + 5) * 8)
+        self.assertIsNone(findMarker(StringInputStream(b"\x12\xff\x00"), 0))
+
     def test_tar(self):
         parser = self.parse("small_text.tar")
         self.checkDisplay(parser, "file[0]/name", '"dummy.txt"')
@@ -280,6 +472,112 @@ class TestParsers(unittest.TestCase):
         self.checkValue(parser, "/packet[3]/ipv4/src", "212.27.54.252")
         self.checkDisplay(parser, "/packet[7]/udp/src", "DNS")
 
+    def test_tcpdump_packet_index(self):
+        parser = self.parse("arp_dns_ping_dns.tcpdump")
+        index = parser.getPacketIndex()
+        self.assertEqual(len(index), 8)
+        self.assertFalse(index.truncated)
+        for number in range(len(index)):
+            packet = parser["packet[%u]" % number]
+            self.assertEqual(index.offsets[number], packet.address // 8)
+            self.assertEqual(index.caplens[number], packet["caplen"].value)
+        packet = parser.packet(3)
+        self.assertEqual(packet.name, "packet[3]")
+        self.assertEqual(packet["ipv4/src"].value, "212.27.54.252")
+        timestamp = parser["packet[3]"].getTimestamp()
+        self.assertEqual(parser.findPacket(timestamp), 3)
+        self.assertEqual(parser.findPacket(timestamp.replace(year=2000)), 0)
+        self.assertEqual(parser.findPacket(2000000000), 8)
+
+        # Big endian file with nanosecond timestamps, truncated last record
+        data = parser.stream.readBytes(0, parser.size // 8)
+        header = struct.pack(">LHHlLLL", 0xa1b23c4d, 2, 4, 0, 0, 65535, 1)
+        records = []
+        for number in range(len(index)):
+            offset = index.offsets[number]
+            seconds, fraction, caplen, length = struct.unpack_from(
+                "<4L", data, offset)
+            records.append(struct.pack(">4L", seconds, fraction * 1000,
+                                       caplen, length))
+            records.append(data[offset + 16:offset + 16 + caplen])
+        data = header + b"".join(records)
+        parser = TcpdumpFile(StringInputStream(data + data[24:40]))
+        self.assertEqual(parser.getPacketIndex().timestamps, index.timestamps)
+        self.assertTrue(parser.getPacketIndex().truncated)
+        parser = TcpdumpFile(StringInputStream(data))
+        self.assertEqual(parser["packet[3]"].getTimestamp(), timestamp)
+        self.checkValue(parser, "/packet[3]/ipv4/src", "212.27.54.252")
+
+    def test_pcapng(self):
+        parser = self.parse("arp_dns_ping_dns.pcapng")
+        self.checkValue(parser, "/section[0]/option[0]/value", "hachoir tests")
+        self.checkValue(parser, "/interface[0]/link_type", 1)
+        self.checkValue(parser, "/packet[2]/option[0]/value", "DNS query")
+        self.checkValue(parser, "/packet[3]/frame/ipv4/src", "212.27.54.252")
+        self.checkValue(parser, "/packet[5]/frame/ipv4/ttl", 120)
+        self.checkValue(parser, "/name_resolution[0]/record[0]/names",
+                        "dns.free.fr")
+        self.checkValue(parser, "/statistics[0]/option[0]/value", 8)
+        self.checkDesc(parser, "/packet[4]",
+                       "2006-11-23 23:13:19.196896: Ping (num=1)")
+
+        parser = self.parse("arp_dns_ping_dns.pcapng")
+        index = parser.getBlockIndex()
+        packet = parser.packet(3)
+        self.assertEqual(packet.name, "packet[3]")
+        self.assertEqual(packet["frame/udp/src"].value, 53)
+        # Blocks are only indexed up to the requested packet
+        self.assertFalse(index.done)
+        self.assertEqual(len(index.offsets), 4)
+        self.assertEqual(index.getPacketCount(), 8)
+        self.assertFalse(index.truncated)
+        self.assertEqual(len(index.interfaces), 1)
+        self.assertEqual(index.interfaces[0].ts_units, 10 ** 6)
+        self.assertEqual(len(index.statistics), 1)
+        tcpdump = self.parse("arp_dns_ping_dns.tcpdump").getPacketIndex()
+        self.assertEqual(index.timestamps, tcpdump.timestamps)
+        self.assertEqual(index.caplens, tcpdump.caplens)
+        for number in range(8):
+            self.assertEqual(index.offsets[number],
+                             parser["packet[%u]" % number].address // 8)
+        with self.assertRaises(IndexError):
+            index.getPacketOffset(8)
+
+        # Big endian file with nanosecond timestamps, truncated last block
+        frame = parser["packet[4]/frame"]
+        frame = parser.stream.readBytes(frame.absolute_address, frame.size // 8)
+        self.assertEqual(len(frame), 98)
+        ticks = 1164323599196896123
+        blocks = [
+            struct.pack(">LLLHHqL", 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1, 28),
+            struct.pack(">LLHHLHHBxxxL", 1, 28, 1, 0, 65535, 9, 1, 9, 28),
+            struct.pack(">LL5L", 6, 32 + len(frame) + 2, 0, ticks >> 32,
+                        ticks & 0xffffffff, len(frame), len(frame))
+            + frame + b"\0\0" + struct.pack(">L", 32 + len(frame) + 2),
+        ]
+        data = b"".join(blocks)
+        parser = PcapNgFile(StringInputStream(data + data[-40:]))
+        index = parser.getBlockIndex()
+        self.assertEqual(index.getPacketCount(), 1)
+        self.assertTrue(index.truncated)
+        self.assertEqual(list(index.timestamps), [ticks])
+        self.assertEqual(index.interfaces[0].ts_units, 10 ** 9)
+        self.checkValue(parser, "/packet[0]/frame/icmp/seq_num", 1)
+        self.assertEqual(parser["packet[0]"].getTimestamp().microsecond,
+                         196896)
+
+        # Timestamp bigger than the maximum timestamp in nanoseconds
+        ticks = 2 ** 64 - 1
+        blocks[2] = (struct.pack(">LL5L", 6, 32 + len(frame) + 2, 0,
+                                 ticks >> 32, ticks & 0xffffffff,
+                                 len(frame), len(frame))
+                     + frame + b"\0\0"
+                     + struct.pack(">L", 32 + len(frame) + 2))
+        parser = PcapNgFile(StringInputStream(b"".join(blocks)))
+        index = parser.getBlockIndex()
+        self.assertEqual(index.getPacketCount(), 1)
+        self.assertEqual(list(index.timestamps), [MAX_TIMESTAMP])
+
     def test_ext2(self):
         parser = self.parse("my60k.ext2")
         self.checkDisplay(parser, "/superblock/last_check",
@@ -337,6 +635,108 @@ class TestParsers(unittest.TestCase):
         self.checkValue(parser, "/superblock/default_mount_opts/uid16", False)
         self.checkDisplay(parser, "/superblock/default_mount_opts/jmode", "none")
 
+    def test_ext4_file_system(self):
+        parser = self.parse("extents_64bit.ext4")
+        self.checkValue(parser, "/group_desc/group[0]/inode_table_hi", 0)
+        self.checkValue(parser, "/group[0]/inode_table/inode[15]/extra_isize", 32)
+        fs = parser.getFileSystem()
+        names = [entry[0] for entry in fs.iterDirectory(fs.getInode(2))]
+        self.assertEqual(sorted(names),
+                         ['.', '..', 'etc', 'fill', 'fragmented', 'link',
+                          'lost+found', 'sparse', 'var'])
+        inode = fs.lookup("/var/log/syslog")
+        self.assertTrue(inode.isRegular())
+        self.assertEqual(inode.size, 3750)
+        with fs.openFile(inode) as stream:
+            self.assertEqual(stream.readBytes(8 * 3703, 47),
+                             b"Oct 19 08:01:19 host kernel: message number 79\n")
+        self.assertEqual(fs.readFile(fs.lookup("etc/hostname")), b"hachoir\n")
+        self.assertEqual(fs.readLink(fs.lookup("/link")), "var/log/syslog")
+
+        # Extent tree of depth 1
+        inode = fs.lookup("/fragmented")
+        self.assertEqual(len(fs.getBlocks(inode)), 8)
+        self.assertEqual(fs.readFile(inode), bytes(range(256)) * 48)
+
+        # Sparse file
+        inode = fs.lookup("/sparse")
+        self.assertEqual(fs.getExtents(inode),
+                         [(50176, 1024), (None, 19456), (51200, 400)])
+        data = fs.readFile(inode)
+        self.assertEqual(data[495:505], b"start\0\0\0\0\0")
+        self.assertEqual(data[-4:], b"end!")
+
+        field = fs.getInodeField(inode.number)
+        self.assertEqual(field.name, "inode[31]")
+        self.assertEqual(field["size"].value, 20880)
+        with self.assertRaises(KeyError):
+            fs.lookup("/var/log/messages")
+
+    def test_ext2_file_system(self):
+        parser = self.parse("indirect_blocks.ext2")
+        fs = parser.getFileSystem()
+        inode = fs.lookup("/dir/indirect.bin")
+        self.assertEqual(fs.getBlocks(inode), [(0, 23, 12), (12, 36, 4)])
+        data = fs.readFile(inode)
+        self.assertEqual(len(data), 15600)
+        self.assertEqual(data[12 * 1024 - 4:12 * 1024 + 8], b"023\nblock 01")
+        self.assertEqual(data[-12:], b"block 01299\n")
+        inode = fs.lookup("sparse")
+        self.assertEqual(fs.getBlocks(inode), [(0, 40, 1), (15, 42, 1)])
+        data = fs.readFile(inode)
+        self.assertEqual(data[:6], b"head\0\0")
+        self.assertEqual(data[-6:], b"\0\0tail")
+
+    def test_ntfs_file_system(self):
+        parser = self.parse("fragmented_mft.ntfs")
+        fs = parser.getFileSystem()
+        self.assertEqual(fs.record_count, 16)
+        # Record 9 is in the second run of the $MFT
+        self.assertEqual(fs.getRecordOffset(9), 64 * 512 + 1024)
+        self.assertEqual(fs.buildNameIndex(),
+                         {'/': 5, '/$MFT': 0, '/dir': 9, '/dir/hello.txt': 10,
+                          '/big.bin': 11, '/dir/long filename.txt': 12})
+
+        # Resident data crossing a fixup
+        record = fs.lookup("/dir/hello.txt")
+        self.assertIsNone(fs.getExtents(record))
+        self.assertEqual(fs.readData(record),
+                         b"".join(b"line %03d\n" % i for i in range(60)))
+
+        # Runlist split in an extension record, with a sparse run
+        record = fs.lookup("big.bin")
+        self.assertEqual(fs.getExtents(record),
+                         [(20480, 2048), (None, 1024), (51200, 1436)])
+        with fs.openData(record) as stream:
+            self.assertEqual(stream.readBytes(8 * 2046, 4), b"DD\0\0")
+            self.assertEqual(stream.readBytes(8 * 4504, 4), b"IIII")
+
+        # Initialized size before the runlist of the extension record
+        with open(os.path.join(DATADIR, "fragmented_mft.ntfs"), "rb") as fp:
+            data = bytearray(fp.read())
+        # initialized_size of the first $DATA attribute of big.bin
+        data[36176:36184] = struct.pack("<Q", 1000)
+        other = NTFS(StringInputStream(bytes(data))).getFileSystem()
+        record = other.lookup("big.bin")
+        self.assertEqual(other.getExtents(record),
+                         [(20480, 1000), (None, 3508)])
+        self.assertEqual(other.readData(record),
+                         fs.readData(fs.lookup("big.bin"))[:1000] + bytes(3508))
+
+        # Uninitialized data and named stream
+        record = fs.lookup("/dir/./long filename.txt")
+        data = fs.readData(record)
+        self.assertEqual(data, b"x" * 700 + bytes(324))
+        self.assertEqual(fs.readData(record, "ads"), b"alternate\n")
+        with self.assertRaises(KeyError):
+            fs.readData(record, "missing")
+
+        field = fs.getRecordField(12)
+        self.assertEqual(field["mft_record_number"].value, 12)
+        for path in ("/dir/LONGFI~1.TXT", "/deleted.txt", "/dir/orphan.txt"):
+            with self.assertRaises(KeyError):
+                fs.lookup(path)
+
     def test_bmp2(self):
         parser = self.parse("article01.bmp")
         self.checkDisplay(parser, "/header/red_mask", '0x00ff0000')
@@ -357,6 +757,40 @@ class TestParsers(unittest.TestCase):
         self.checkValue(parser, "/compression", 1)
         self.checkValue(parser, "/horiz_dpi", 500)
 
+    def test_pdf_objects(self):
+        parser = self.parse("incremental_update.pdf")
+        reader = parser.getObjectReader()
+        # Cross-reference stream, then two cross-reference tables
+        self.assertEqual(reader.sections, [1096, 816, 393])
+        self.assertEqual(reader.getObjectOffset(5), 628)
+        self.assertEqual(reader.getObjectOffset(8), None)
+        self.assertEqual(reader.getPageCount(), 3)
+        self.assertEqual(reader.getInfo(),
+                         {'Title': 'Été', 'Producer': 'hachoir',
+                          'Subject': 'a (nested) string\nA% not a comment',
+                          'Author': 'Hachoir',
+                          'Keywords': ['ABC', 1.5, -3, True, None]})
+        page = reader.getObject(8)
+        self.assertEqual(page, {'Type': 'Page', 'Parent': PDFReference(2, 0)})
+        stream = reader.getObject(reader.getObject(3)['Contents'].number)
+        self.assertEqual(reader.getStreamData(stream),
+                         b"BT /F1 12 Tf (Hello) Tj ET")
+        self.assertIsNone(reader.getObject(0))
+        self.assertIsNone(reader.getObject(100))
+
+        # Hybrid-reference file: the catalog is free in the table and
+        # stored in an object stream by the XRefStm stream
+        parser = self.parse("hybrid_reference.pdf")
+        reader = parser.getObjectReader()
+        self.assertEqual(reader.sections, [750, 502, 367])
+        self.assertEqual(reader.getObject(1),
+                         {'Type': 'Catalog', 'Pages': PDFReference(2, 0)})
+        self.assertEqual(reader.getPageCount(), 1)
+        self.assertEqual(reader.getInfo()['Title'], 'Hybrid')
+        # object deleted by the update: the older stream doesn't override it
+        self.assertIsNone(reader.getObjectOffset(4))
+        self.assertIsNone(reader.getObject(4))
+
     def test_linux_swap(self):
         parser = self.parse("linux_swap_9pages")
         self.checkValue(parser, "/version", 1)
@@ -645,6 +1079,118 @@ class TestParsers(unittest.TestCase):
             parser, "/root[0]/entry[2]/modify", "2005-07-26 00:48:26")
         self.checkValue(parser, "/root[0]/entry[2]/size", 29690)
 
+        fs = parser.getFileSystem()
+        self.assertEqual(fs.getTable().getRuns(2), ((2, 27),))
+        entry = fs.lookup("/ADAPTEC2.MDM")
+        self.assertEqual(entry.name, "Adaptec2.mdm")
+        self.assertEqual((entry.cluster, entry.size), (15792, 316603))
+
+    def test_fat32_file_system(self):
+        parser = self.parse("fragmented.fat32")
+        fs = parser.getFileSystem()
+        paths = [path for path, entry in fs.walk()]
+        self.assertEqual(paths[:4], ['/README.TXT', '/Long File Name.txt',
+                                     '/lower.txt', '/EMPTY'])
+        self.assertEqual(paths[-2:], ['/Sub Directory',
+                                      '/Sub Directory/NESTED.BIN'])
+        # The root directory uses two clusters
+        self.assertEqual(fs.getExtents(fs.getRoot()), [(3072, 512), (6656, 512)])
+
+        entry = fs.lookup("/long file name.TXT")
+        self.assertEqual(entry.short_name, "LONGFI~1.TXT")
+        self.assertEqual(fs.getTable().getChain(entry.cluster),
+                         [3, 4, 5, 20, 21, 7])
+        self.assertEqual(fs.getExtents(entry),
+                         [(3584, 1536), (12288, 1024), (5632, 340)])
+        data = bytes((i * 7) % 251 for i in range(2900))
+        self.assertEqual(fs.readFile(entry), data)
+        with fs.openFile(entry) as stream:
+            self.assertEqual(stream.readBytes(8 * 1530, 12), data[1530:1542])
+        self.assertEqual(fs.readFile(fs.lookup("/Sub Directory/nested.bin")),
+                         b"".join(b"nested %04d\n" % i for i in range(170)))
+        self.assertEqual(fs.readFile(fs.lookup("EMPTY")), b"")
+        with self.assertRaises(KeyError):
+            fs.lookup("/DELETED.TXT")
+
+    def test_fat12_table(self):
+        # Entries: 0xFF8, 0xFFF, 3, 5, 0xFFF, 6, 7, 0xFFF
+        table = FatTable(12, bytes.fromhex("f8ffff035000ff6f0007f0ff"), 8)
+        self.assertEqual(list(table.entries), [0xFF8, 0xFFF, 3, 5, 0xFFF, 6, 7, 0xFFF])
+        self.assertEqual(table.getRuns(2), ((2, 2), (5, 3)))
+        self.assertEqual(table.getChain(4), [4])
+        self.assertEqual(table.getRuns(1), ())
+        table.entries[7] = 5
+        self.assertRaises(ParserError, table.getRuns, 6)
+
+    def test_ole2_streams(self):
+        parser = self.parse("radpoor.doc")
+        self.assertEqual(list(parser.getDIFAT()), [0, 128])
+        self.assertEqual(len(parser.getBFAT()), 256)
+        self.assertEqual(list(parser.getChain(2)), [2])
+        self.assertEqual(list(parser.getChain(3))[:5], [3, 4, 5, 6, 195])
+        entries = {entry.name: entry for entry in parser.getDirectory()}
+        self.assertEqual(sorted(entries),
+                         ['\x01CompObj', '\x01Ole', '\x05DocumentSummaryInformation',
+                          '\x05SummaryInformation', '1Table', 'Root Entry',
+                          'WordDocument'])
+
+        # Stream stored in big blocks
+        entry = entries['\x05SummaryInformation']
+        self.assertEqual(parser.getStreamExtents(entry),
+                         [(4096, 61952), (66560, 33596)])
+        with parser.openStream(entry) as stream:
+            self.assertEqual(stream.readBytes(0, 4), b"\xfe\xff\0\0")
+
+        # Stream stored in small blocks of the mini stream
+        entry = entries['WordDocument']
+        self.assertTrue(parser.isSmallStream(entry))
+        data = parser.readStream(entry)
+        self.assertEqual(len(data), 2596)
+        self.assertEqual(data[:2], b"\xec\xa5")
+
+    def test_iso9660(self):
+        parser = self.parse("joliet_rockridge.iso")
+        self.checkValue(parser, "/volume[0]/content/volume_id", "HACHOIR")
+        records = {}
+        parser.build_record_list(23 * 2048, 4096, records)
+        self.assertEqual(len(records), 13)
+        self.assertIn(24 * 2048 + 58, records)
+
+        # An invalid record stops the reading of its directory extent
+        with open(os.path.join(DATADIR, "joliet_rockridge.iso"), "rb") as fp:
+            data = bytearray(fp.read())
+        data[24 * 2048 + 58] = 10
+        records = {}
+        ISO9660(StringInputStream(bytes(data))).build_record_list(
+            23 * 2048, 4096, records)
+        self.assertEqual(len(records), 12)
+        self.assertNotIn(24 * 2048 + 58, records)
+
+        # Rock Ridge names
+        fs = parser.getFileSystem()
+        self.assertTrue(fs.rock_ridge)
+        index = fs.buildIndex()
+        self.assertEqual(sorted(index),
+                         ['/Documents', '/Documents/a long file name.txt',
+                          '/Documents/deep', '/Documents/deep/file.txt',
+                          '/data.bin', '/readme.txt'])
+        entry = index['/data.bin']
+        self.assertEqual(entry.extents, [(31 * 2048, 2048), (33 * 2048, 1000)])
+        with fs.openFile(entry) as stream:
+            self.assertEqual(stream.readBytes(8 * 2044, 8), b"\xfc\xfd\xfe\xffseco")
+        self.assertEqual(fs.readFile(fs.lookup("/Documents/deep/file.txt")),
+                         b"deep file\n")
+
+        # Joliet names, directories located using the path table
+        fs = IsoFileSystem(parser, joliet=True)
+        self.assertEqual(fs.getDirectoryIndex(),
+                         {'/': 25, '/Documents': 27, '/Documents/deep': 29})
+        entry = fs.lookup("/Documents/a long file name.txt")
+        self.assertEqual(fs.readFile(entry), b"long name\n")
+        self.assertEqual(fs.lookup("/Documents/deep").location, 29)
+        with self.assertRaises(KeyError):
+            fs.lookup("/Documents/missing.txt")
+
     def test_xm(self):
         parser = self.parse("dontyou.xm")
         self.checkValue(parser, "/header/title", "Dont you... voguemix")
@@ -775,6 +1321,37 @@ class TestParsers(unittest.TestCase):
         self.checkValue(
             parser, "/packet[78]/payload_unit_start", True)
 
+    def test_mpeg_ts_packet_table(self):
+        parser = self.parse("sample.ts")
+        table = parser.getPacketTable()
+        self.assertEqual(len(table), 79)
+        self.assertEqual(table.lost_bytes, 0)
+        self.assertEqual(table.offsets[78], 78 * 188)
+        self.assertEqual(table.pusi[78], 1)
+        self.assertEqual(table.adaptation[2], 1)
+        self.assertEqual(table.getPacket(2)["adaptation_field/pcr_base"].value, 44)
+        pids = table.getPidIndex()
+        self.assertEqual(sorted(pids), [0x0, 0x1e0, 0x1e1])
+        self.assertEqual(list(pids[0x1e0]), [1])
+        for index in (0, 1, 50):
+            packet = parser["packet[%u]" % index]
+            self.assertEqual(table.pids[index], packet["pid"].value)
+            self.assertEqual(table.counters[index], packet["counter"].value)
+
+        # Synchronization lost: skip junk bytes
+        data = parser.stream.readBytes(0, 188 * 79)
+        data = b"\0\1\2" + data[:188 * 10] + b"junk!" + data[188 * 10:]
+        parser = MPEG_TS(StringInputStream(data), validate=False)
+        use_numpy = [False]
+        if has_numpy:
+            use_numpy.append(True)
+        for value in use_numpy:
+            table = PacketTable(parser, use_numpy=value)
+            self.assertEqual(len(table), 79)
+            self.assertEqual(table.lost_bytes, 8)
+            self.assertEqual(list(table.offsets[9:12]), [1695, 1888, 2076])
+            self.assertEqual(len(table.getPidIndex()[0x1e1]), 77)
+
     def test_m2ts(self):
         parser = self.parse("Panasonic_AG_HMC_151.MTS")
         self.checkValue(
@@ -825,6 +1402,74 @@ class TestParsers(unittest.TestCase):
         self.checkValue(parser, "ifd[0]/value[5]", 'Canon EOS REBEL T5i')
 
 
+class TestResolver(unittest.TestCase):
+    NAMES = {"212.27.54.252": "dns.example.org",
+             "192.168.0.1": "router.example.org"}
+
+    def setUp(self):
+        self.lookups = []
+        self.release = threading.Event()
+
+    def lookup(self, addr):
+        self.lookups.append(addr)
+        self.release.wait(5.0)
+        return self.NAMES.get(addr)
+
+    def test_disabled(self):
+        self.assertEqual(ip2name("212.27.54.252"), "212.27.54.252")
+        parser = createParser(os.path.join(
+            DATADIR, "arp_dns_ping_dns.tcpdump"))
+        self.assertEqual(parser["packet[3]/ipv4/src"].display,
+                         "212.27.54.252")
+
+    def test_resolve(self):
+        resolved = []
+        resolver = Resolver(self.lookup, ttl=60.0, timeout=5.0,
+                            callback=lambda addr, name: resolved.append(name))
+        with resolver:
+            previous = setResolver(resolver)
+            try:
+                parser = createParser(os.path.join(
+                    DATADIR, "arp_dns_ping_dns.tcpdump"))
+                field = parser["packet[3]/ipv4/src"]
+                # The lookup is running: the address is displayed
+                self.assertEqual(field.display, "212.27.54.252")
+                self.assertEqual(field.display, "212.27.54.252")
+                self.release.set()
+                names = resolver.resolve(["212.27.54.252", "10.0.0.1"])
+                self.assertEqual(names, {"212.27.54.252": "dns.example.org",
+                                         "10.0.0.1": "10.0.0.1"})
+                self.assertEqual(field.display, "dns.example.org")
+            finally:
+                setResolver(previous)
+        self.assertEqual(sorted(self.lookups), ["10.0.0.1", "212.27.54.252"])
+        self.assertEqual(resolved, ["dns.example.org"])
+
+    def test_timeout(self):
+        with Resolver(self.lookup, timeout=0.1) as resolver:
+            self.assertEqual(resolver.resolve(["192.168.0.1"]),
+                             {"192.168.0.1": "192.168.0.1"})
+            self.release.set()
+            # The failure is cached
+            self.assertEqual(resolver.getName("192.168.0.1"), "192.168.0.1")
+        self.assertEqual(self.lookups, ["192.168.0.1"])
+
+    def test_cache(self):
+        self.release.set()
+        with Resolver(self.lookup, cache_size=1) as resolver:
+            resolver.resolve(["192.168.0.1"])
+            resolver.resolve(["192.168.0.1"])
+            self.assertEqual(len(self.lookups), 1)
+            resolver.resolve(["212.27.54.252"])
+            self.assertEqual(resolver.resolve(["192.168.0.1"]),
+                             {"192.168.0.1": "router.example.org"})
+            self.assertEqual(len(self.lookups), 3)
+        with Resolver(self.lookup, ttl=0.0) as resolver:
+            resolver.resolve(["192.168.0.1"])
+            resolver.resolve(["192.168.0.1"])
+            self.assertEqual(len(self.lookups), 5)
+
+
 class TestParserRandomStream(unittest.TestCase):
 
     def test_random_stream(self, tests=(1, 8)):
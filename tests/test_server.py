@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test hachoir-server.
+"""
+
+from hachoir.server import HachoirServer, HachoirClient, RequestError
+from hachoir.test import setup_tests
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+
+DATADIR = os.path.join(os.path.dirname(__file__), "files")
+
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.address = os.path.join(cls.tmpdir, "hachoir.sock")
+        cls.server = HachoirServer(cls.address, jobs=1)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+        cls.server.server_close()
+        shutil.rmtree(cls.tmpdir)
+
+    def request(self, command, **options):
+        with HachoirClient(self.address) as client:
+            return client.request(command, **options)
+
+    def test_guess(self):
+        result = self.request("guess", filename=os.path.join(DATADIR, "gps.jpg"))
+        self.assertEqual(result["parser"], "jpeg")
+        self.assertEqual(result["mime_type"], "image/jpeg")
+
+    def test_metadata(self):
+        result = self.request("metadata", filename=os.path.join(DATADIR, "10min.mkv"))
+        self.assertEqual(result["parser"], "matroska")
+        self.assertEqual(result["metadata"]["duration"], 600.0)
+        self.assertEqual(result["text"][0], "Common:")
+
+    def test_fields(self):
+        result = self.request("fields", filename=os.path.join(DATADIR, "gps.jpg"),
+                              path="/exif", limit=2)
+        self.assertEqual(result["address"], 16)
+        self.assertTrue(result["truncated"])
+        self.assertEqual([field["name"] for field in result["fields"]],
+                         ["header", "type"])
+        self.assertEqual(result["fields"][0]["value"], 0xff)
+
+    def test_errors(self):
+        filename = os.path.join(DATADIR, "10min.mkv")
+        with HachoirClient(self.address) as client:
+            self.assertRaises(RequestError, client.request, "unknown")
+            self.assertRaises(RequestError, client.request, "guess")
+            with self.assertRaises(RequestError) as cm:
+                client.request("metadata", filename=filename, max_fields=5)
+            self.assertIn("limit of 5 fields", str(cm.exception))
+            # the connection can still be used
+            result = client.request("guess", filename=filename)
+            self.assertEqual(result["parser"], "matroska")
+
+    def test_socket_mode(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.address).st_mode), 0o600)
+
+    def test_dead_worker(self):
+        filename = os.path.join(DATADIR, "gps.jpg")
+        self.assertEqual(self.request("guess", filename=filename)["parser"],
+                         "jpeg")
+        executor = self.server.executor
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        # the pool is replaced and the request is submitted again
+        self.assertEqual(self.request("guess", filename=filename)["parser"],
+                         "jpeg")
+        self.assertIsNot(self.server.executor, executor)
+
+
+if __name__ == "__main__":
+    setup_tests()
+    unittest.main()
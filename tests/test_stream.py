@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test hachoir.stream input and output streams.
+"""
+
+from hachoir.core.endian import BIG_ENDIAN, LITTLE_ENDIAN
+from hachoir.stream import (FileInputStream, FileOutputStream,
+                            StringInputStream, InputSubStream, OutputStream,
+                            ExtentStream, InputStreamError)
+from hachoir.parser import createParser
+from hachoir.test import setup_tests
+import hachoir.core.config as config
+import io
+import os
+import tempfile
+import unittest
+
+DATADIR = os.path.join(os.path.dirname(__file__), "files")
+KDE_CLICK = os.path.join(DATADIR, 'kde_click.wav')
+
+
+class TestOutputStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def read_data(self, offset=0, size=None):
+        with open(KDE_CLICK, 'rb') as fp:
+            fp.seek(offset)
+            return fp.read(size)
+
+    def copy(self, stream, address, nbytes, prefix=b''):
+        filename = os.path.join(self.tmpdir.name, "output")
+        with stream:
+            with FileOutputStream(filename) as output:
+                output.writeBytes(prefix)
+                output.copyBytesFrom(stream, address, nbytes)
+                output.writeBytes(b'end')
+        with open(filename, 'rb') as fp:
+            return fp.read()
+
+    def test_copy_file(self):
+        stream = FileInputStream(KDE_CLICK)
+        self.assertIsNotNone(stream.getFileRange(0, 1000))
+        data = self.copy(stream, 0, stream.size // 8, b'abc')
+        self.assertEqual(data, b'abc' + self.read_data() + b'end')
+
+    def test_copy_substream(self):
+        stream = FileInputStream(KDE_CLICK)
+        substream = InputSubStream(stream, 8 * 100, 8 * 1500)
+        self.assertEqual(substream.getFileRange(8 * 10, 20), (stream._input.fileno(), 110))
+        self.assertIsNone(substream.getFileRange(8 * 10, 1500))
+        data = self.copy(substream, 8 * 10, 1000)
+        self.assertEqual(data, self.read_data(110, 1000) + b'end')
+
+    def test_copy_string(self):
+        raw = bytes(range(256)) * 10
+        stream = StringInputStream(raw)
+        self.assertIsNone(stream.getFileRange(0, 10))
+        data = self.copy(stream, 8 * 3, 2000)
+        self.assertEqual(data, raw[3:2003] + b'end')
+
+    def test_write_bits(self):
+        for endian in (BIG_ENDIAN, LITTLE_ENDIAN):
+            output = io.BytesIO()
+            stream = OutputStream(output)
+            stream.writeBits(3, 5, endian)
+            stream.writeBits(29, 0x1234567, endian)
+            stream.writeBits(24, 0xabcdef, endian)
+            stream.writeBits(8, 0x42, endian)
+            self.assertEqual(len(output.getvalue()), 8)
+            input = StringInputStream(output.getvalue())
+            self.assertEqual(input.readBits(0, 3, endian), 5)
+            self.assertEqual(input.readBits(3, 29, endian), 0x1234567)
+            self.assertEqual(input.readBits(32, 24, endian), 0xabcdef)
+            self.assertEqual(input.readBits(56, 8, endian), 0x42)
+
+
+class TestStreamStats(unittest.TestCase):
+
+    def setUp(self):
+        old = (config.io_stats, config.io_trace)
+        self.addCleanup(setattr, config, "io_stats", old[0])
+        self.addCleanup(setattr, config, "io_trace", old[1])
+
+    def test_disabled(self):
+        config.io_stats = False
+        stream = StringInputStream(b"abcd")
+        stream.readBytes(0, 2)
+        self.assertIsNone(stream.stats)
+
+    def test_counters(self):
+        config.io_stats = True
+        config.io_trace = True
+        stream = StringInputStream(bytes(100))
+        substream = InputSubStream(stream, 8 * 10, 8 * 50)
+        substream.readBytes(0, 4)
+        substream.readBytes(32, 4)
+        substream.readBytes(8 * 20, 2)
+        substream.readBytes(8 * 2, 1)
+
+        stats = substream.stats
+        self.assertEqual(stats.read_calls, 4)
+        self.assertEqual(stats.read_bytes, 11)
+        self.assertEqual(stats.seeks, 2)
+        self.assertEqual(stats.backward_seeks, 1)
+        self.assertEqual(stats.trace[1], (32, 32, "(no field set)"))
+
+        # reads of the substream are also counted by the parent stream
+        self.assertEqual(stream.stats.read_calls, 4)
+        self.assertEqual(stream.stats.trace[1], (112, 32, "(no field set)"))
+
+    def test_fieldsets(self):
+        config.io_stats = True
+        parser = createParser(KDE_CLICK)
+        with parser:
+            for field in parser:
+                pass
+            stats = parser.stream.stats
+        self.assertIn("RiffFile", stats.fieldsets)
+        self.assertEqual(sum(calls for calls, bits in stats.fieldsets.values()),
+                         stats.read_calls)
+        self.assertEqual(stats.exportPlaintext()[0], "I/O statistics:")
+
+
+class TestExtentStream(unittest.TestCase):
+
+    def test_read(self):
+        stream = StringInputStream(b"0123456789abcdef")
+        extents = ExtentStream(stream, [(4, 3), (None, 2), (10, 2), (0, 0)],
+                               size=10)
+        self.assertEqual(extents.size, 80)
+        self.assertEqual(extents.readBytes(0, 10), b"456\0\0ab\0\0\0")
+        self.assertEqual(extents.readBytes(8 * 2, 4), b"6\0\0a")
+        self.assertEqual(extents.readBits(8 * 5, 16, BIG_ENDIAN), 0x6162)
+        with self.assertRaises(InputStreamError):
+            extents.readBytes(8 * 9, 2)
+
+
+if __name__ == "__main__":
+    setup_tests()
+    unittest.main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark of Hachoir parsers on the test files.
+
+For each file of tests/files (or the files/directories given on the
+command line) which has a parser, measure:
+
+- guess: time to guess the parser (createParser) ;
+- parse: time to parse the whole field tree ;
+- metadata: time to extract metadata (None if there is no extractor) ;
+- memory: peak memory allocated while parsing the whole tree (tracemalloc) ;
+- fields: number of fields of the tree.
+
+Times and memory peaks are the minimum of --repeat runs (at least 3).
+Results can be written into a JSON file (--output) and compared to a previous
+result (--baseline): a time is a regression if it is more than --threshold
+slower than the baseline and if the difference is larger than --min-time and
+than the spread of the runs, a memory peak if it is more than --threshold
+bigger and if the difference is larger than --min-memory.
+
+Usage (from the root of the source tree):
+
+    PYTHONPATH=. python3 tools/benchmark.py --output=baseline.json
+    (modify the code)
+    PYTHONPATH=. python3 tools/benchmark.py --baseline=baseline.json
+"""
+
+from hachoir.core.tools import humanDurationNanosec, humanFilesize
+from hachoir.metadata import extractMetadata
+from hachoir.metadata.metadata import extractors as metadata_extractors
+from hachoir.parser import createParser
+from hachoir.test import setup_tests
+from hachoir import version
+from optparse import OptionParser
+from time import perf_counter
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+DATADIR = os.path.join(os.path.dirname(__file__), "..", "tests", "files")
+TIME_MEASURES = ("guess", "parse", "metadata")
+MEASURES = TIME_MEASURES + ("memory",)
+MIN_REPEAT = 3
+
+
+def parseOptions():
+    parser = OptionParser(usage="%prog [options] [file|directory ...]")
+    parser.add_option("--repeat", help="Number of runs of each measure (default: %s)" % MIN_REPEAT,
+                      type="int", default=MIN_REPEAT)
+    parser.add_option("--output", help="Write results into a JSON file",
+                      type="str", default=None)
+    parser.add_option("--baseline", help="Compare results to a JSON file",
+                      type="str", default=None)
+    parser.add_option("--threshold",
+                      help="Regression threshold in percent (default: 20)",
+                      type="float", default=20.0)
+    parser.add_option("--min-time",
+                      help="Ignore time differences smaller than this "
+                           "number of milliseconds (default: 5)",
+                      type="float", default=5.0)
+    parser.add_option("--min-memory",
+                      help="Ignore memory differences smaller than this "
+                           "number of KiB (default: 64)",
+                      type="float", default=64.0)
+    parser.add_option("--quiet", help="Don't display results",
+                      action="store_true", default=False)
+    values, arguments = parser.parse_args()
+    if values.repeat < MIN_REPEAT:
+        parser.error("--repeat must be at least %s" % MIN_REPEAT)
+    return values, arguments
+
+
+def findFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+def parseAll(fieldset):
+    """
+    Create all fields of a field set: return the number of fields
+    """
+    count = 0
+    for field in fieldset:
+        count += 1
+        if field.is_field_set:
+            count += parseAll(field)
+    return count
+
+
+def bestTime(func, repeat, spread=None, measure=None):
+    """
+    Minimum duration in seconds of repeat calls to func(). Store the
+    difference between the maximum and the minimum in spread[measure].
+    """
+    durations = []
+    for run in range(repeat):
+        start = perf_counter()
+        func()
+        durations.append(perf_counter() - start)
+    best = min(durations)
+    if spread is not None:
+        spread[measure] = max(durations) - best
+    return best
+
+
+def peakMemory(func, repeat):
+    """
+    Minimum of the peak memory allocated by func() (tracemalloc)
+    """
+    best = None
+    for run in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+        except Exception:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if best is None or peak < best:
+            best = peak
+    return best
+
+
+def benchmarkFile(filename, repeat):
+    """
+    Benchmark a file: return a dictionary of measures, or None
+    if no parser is able to parse the file.
+    """
+    parser = createParser(filename)
+    if not parser:
+        return None
+    with parser:
+        result = {"parser": parser.getParserTags()["id"]}
+        has_metadata = parser.__class__ in metadata_extractors
+
+    def guess():
+        parser = createParser(filename)
+        parser.close()
+
+    def parse():
+        with createParser(filename) as parser:
+            result["fields"] = parseAll(parser)
+
+    def metadata():
+        with createParser(filename) as parser:
+            extractMetadata(parser)
+
+    spread = result["spread"] = {}
+    result["guess"] = bestTime(guess, repeat, spread, "guess")
+    try:
+        result["parse"] = bestTime(parse, repeat, spread, "parse")
+    except Exception as err:
+        result["parse"] = None
+        result["error"] = "parse: %s" % err
+    result["metadata"] = None
+    if has_metadata:
+        try:
+            result["metadata"] = bestTime(metadata, repeat, spread, "metadata")
+        except Exception as err:
+            result["error"] = "metadata: %s" % err
+
+    result["memory"] = peakMemory(parse, repeat)
+    return result
+
+
+def runBenchmark(filenames, repeat, verbose=True):
+    results = {}
+    for filename in filenames:
+        result = benchmarkFile(filename, repeat)
+        if result is None:
+            continue
+        name = os.path.basename(filename)
+        results[name] = result
+        if verbose:
+            print(formatResult(name, result))
+    return {"hachoir": version.VERSION,
+            "python": platform.python_version(),
+            "repeat": repeat,
+            "files": results}
+
+
+def formatTime(value):
+    if value is None:
+        return "-"
+    return humanDurationNanosec(value * 1e9)
+
+
+def formatResult(name, result):
+    text = "%s (%s): guess=%s parse=%s metadata=%s memory=%s fields=%s" % (
+        name, result["parser"],
+        formatTime(result["guess"]), formatTime(result["parse"]),
+        formatTime(result["metadata"]), humanFilesize(result["memory"]),
+        result.get("fields", "-"))
+    if "error" in result:
+        text += " (error: %s)" % result["error"]
+    return text
+
+
+def compareResults(baseline, results, threshold, min_time, min_memory):
+    """
+    Compare results to the baseline. Return the list of regressions:
+    (filename, measure, old value, new value) tuples. Display
+    improvements, regressions and changes of the number of fields.
+
+    Differences smaller than min_time (in milliseconds) or min_memory
+    (in KiB) are ignored, as time differences smaller than the spread of the
+    runs of the baseline or of the results.
+    """
+    regressions = []
+    ratio = 1.0 + threshold / 100.0
+    old_files = baseline["files"]
+    for name, new in sorted(results["files"].items()):
+        try:
+            old = old_files[name]
+        except KeyError:
+            print("%s: new file" % name)
+            continue
+        if old.get("fields") != new.get("fields"):
+            print("%s: number of fields changed: %s => %s"
+                  % (name, old.get("fields"), new.get("fields")))
+        for measure in MEASURES:
+            old_value = old.get(measure)
+            new_value = new.get(measure)
+            if old_value is None or new_value is None:
+                continue
+            if measure in TIME_MEASURES:
+                noise = max(min_time / 1000,
+                            old.get("spread", {}).get(measure, 0),
+                            new["spread"].get(measure, 0))
+                if abs(new_value - old_value) < noise:
+                    continue
+                text = "%s => %s" % (formatTime(old_value), formatTime(new_value))
+                worse, better = "slower", "faster"
+            else:
+                if abs(new_value - old_value) < min_memory * 1024:
+                    continue
+                text = "%s => %s" % (humanFilesize(old_value), humanFilesize(new_value))
+                worse, better = "bigger", "smaller"
+            if old_value * ratio < new_value:
+                regressions.append((name, measure, old_value, new_value))
+                print("%s: %s REGRESSION (%s): %s" % (name, measure, worse, text))
+            elif new_value * ratio < old_value:
+                print("%s: %s %s: %s" % (name, measure, better, text))
+    missing = set(old_files) - set(results["files"])
+    if missing:
+        print("(%s files of the baseline were not benchmarked)" % len(missing))
+    return regressions
+
+
+def main():
+    values, paths = parseOptions()
+    setup_tests()
+    if not paths:
+        paths = [DATADIR]
+    results = runBenchmark(findFiles(paths), values.repeat,
+                           verbose=not values.quiet)
+
+    if values.output:
+        with open(values.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print("Results written into %s" % values.output)
+
+    if values.baseline:
+        with open(values.baseline) as fp:
+            baseline = json.load(fp)
+        print()
+        print("Compare to %s (hachoir %s, Python %s), threshold: %s%%"
+              % (values.baseline, baseline["hachoir"], baseline["python"],
+                 values.threshold))
+        regressions = compareResults(baseline, results,
+                                     values.threshold, values.min_time,
+                                     values.min_memory)
+        print()
+        if regressions:
+            print("%s regression(s)" % len(regressions))
+            sys.exit(1)
+        print("No regression")
+
+
+if __name__ == "__main__":
+    main()
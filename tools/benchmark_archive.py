@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the metadata extraction of large archives: create a TAR and
+a ZIP archive containing many (small) files in a temporary directory and
+measure the time and the peak memory (tracemalloc) of extractMetadata()
+with the best quality (metadata of all archive members are extracted).
+
+Usage (from the root of the source tree):
+
+    PYTHONPATH=. python3 tools/benchmark_archive.py --files=5000
+"""
+
+from hachoir.core.tools import humanDurationNanosec, humanFilesize
+from hachoir.metadata import extractMetadata
+from hachoir.metadata.metadata_item import QUALITY_BEST
+from hachoir.parser import createParser
+from hachoir.test import setup_tests
+from optparse import OptionParser
+from time import perf_counter
+import io
+import os
+import tarfile
+import tempfile
+import tracemalloc
+import zipfile
+
+
+def parseOptions():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--files", help="Number of files in each archive (default: 2000)",
+                      type="int", default=2000)
+    parser.add_option("--repeat", help="Number of runs (default: 3)",
+                      type="int", default=3)
+    values, arguments = parser.parse_args()
+    if arguments:
+        parser.error("no argument expected")
+    return values
+
+
+def createTar(filename, nfile):
+    with tarfile.open(filename, "w") as tar:
+        for index in range(nfile):
+            data = b"file %d" % index
+            info = tarfile.TarInfo("dir/file%05d.txt" % index)
+            info.size = len(data)
+            info.mtime = 1500000000
+            tar.addfile(info, io.BytesIO(data))
+
+
+def createZip(filename, nfile):
+    with zipfile.ZipFile(filename, "w") as archive:
+        for index in range(nfile):
+            archive.writestr("dir/file%05d.txt" % index, b"file %d" % index)
+
+
+def extract(filename):
+    with createParser(filename) as parser:
+        metadata = extractMetadata(parser, QUALITY_BEST)
+    return metadata
+
+
+def benchmark(filename, repeat):
+    best = None
+    for run in range(repeat):
+        start = perf_counter()
+        metadata = extract(filename)
+        duration = perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    ngroup = len(list(metadata.iterGroups()))
+
+    del metadata
+    tracemalloc.start()
+    extract(filename)
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, memory, ngroup
+
+
+def main():
+    values = parseOptions()
+    setup_tests()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, create in (("tar", createTar), ("zip", createZip)):
+            filename = os.path.join(tmpdir, "archive.%s" % name)
+            create(filename, values.files)
+            duration, memory, ngroup = benchmark(filename, values.repeat)
+            print("%s: %s files: %s, peak memory: %s (%s groups)"
+                  % (name.upper(), values.files,
+                     humanDurationNanosec(duration * 1e9),
+                     humanFilesize(memory), ngroup))
+
+
+if __name__ == "__main__":
+    main()